@@ -1,19 +1,17 @@
+import time
+script_started = time.perf_counter()
+
 import streamlit as st
-from langchain_aws import BedrockEmbeddings
-from langchain_classic.chains import ConversationalRetrievalChain
-from langchain_classic.memory import ConversationBufferMemory
-from langchain_classic.vectorstores import FAISS
-from langchain_aws import ChatBedrock
-import boto3
-from langchain_classic.prompts import PromptTemplate
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
 from datetime import datetime
-import io
 import json
 import os
+import uuid
+from chat_client import ChatClient
+from feedback_store import open_feedback_store
+from startup import Warmup, timed_import
+from streaming import CURSOR, StreamToPlaceholder
+from tracing import observe_script_run, start_metrics_server
+from validation import SUPPORT_GUARDRAIL
 
 
 st.set_page_config(page_title="💬 Spectrum Support Chatbot", layout="wide", initial_sidebar_state="expanded")
@@ -46,87 +44,57 @@ def load_config():
     with open(config_path, 'r') as f:
         return json.load(f)
 
-@st.cache_resource
-def init_chain():
+def build_engine():
     config = load_config()
-    
-    # Set AWS credentials
-    boto3.setup_default_session(
-        aws_access_key_id=config["aws_access_key_id"],
-        aws_secret_access_key=config["aws_secret_access_key"],
-        region_name=config["aws_region"]
-    )
-    embeddings = BedrockEmbeddings(
-        model_id="amazon.titan-embed-text-v1",
-        region_name=config["aws_region"]
-    )
-    vectordb = FAISS.load_local(
-        "faiss_index",
-        embeddings,
-        allow_dangerous_deserialization=True,
-    )
-    prompt = PromptTemplate(
-        template="""You are a Spectrum mobile customer support assistant. Follow these rules EXACTLY:
+    # With a chat service configured this app is a thin client; otherwise it hosts the engine itself
+    if config.get("chat_service_url"):
+        return ChatClient(config["chat_service_url"])
+    # langchain, boto3 and FAISS are first imported here, off the first page render
+    engine = timed_import("chat_engine").ChatEngine(config)
+    if config.get("warmup", True):
+        engine.warmup()
+    return engine
 
-        STRICT REQUIREMENTS:
-        1. Answer ONLY in English - no other languages permitted
-        2. Use ONLY information from the provided context below
-        3. If information is not in context, respond: "I don't have that information. Please contact (833) 224-6603 for further assistance 
-            or visit https://www.spectrum.net/support/category/mobile for further assistance."
-        4. Only mention phone number (833) 224-6603 - no other numbers
-        5. Stay focused on Spectrum mobile products and services only
-        6. Provide factual, direct answers without speculation
-        7. ALWAYS use bullet points for clarity when listing multiple items. Each bullet point should be in a separate line.
-        8. Include the actual link at the bottom of the response with a prefix "For more details, please refer "
-        
-        CONTEXT INFORMATION:
-        {context}
-        
-        CUSTOMER QUESTION:
-        {question}
-        
-        RESPONSE (English only, context-based facts only):""",
-        input_variables=["context", "question"]
-    )
-    
-    return ConversationalRetrievalChain.from_llm(
-        ChatBedrock(
-            model_id=config["model_id"], 
-            region_name=config["aws_region"],
-            model_kwargs={"temperature": config["temperature"], "max_tokens": 500}
-        ),
-        vectordb.as_retriever(search_kwargs={"k": 5}),
-        memory=ConversationBufferMemory(memory_key="chat_history", return_messages=True),
-        combine_docs_chain_kwargs={"prompt": prompt}
-    )
+@st.cache_resource
+def init_engine():
+    # Starts on the process's first script run; the page renders while the engine warms up
+    return Warmup("engine", build_engine)
 
-def get_cached_response(question):
-    cache_file = "response_cache.json"
-    if os.path.exists(cache_file):
-        with open(cache_file, 'r') as f:
-            cache = json.load(f)
-        return cache.get(question)
-    return None
+def get_engine():
+    try:
+        if engine_warmup.ready():
+            return engine_warmup.get()
+        with st.spinner("Getting ready..."):
+            return engine_warmup.get()
+    except Exception:
+        # Let the next run retry instead of caching the failure
+        init_engine.clear()
+        raise
 
-def save_to_cache(question, response):
-    cache_file = "response_cache.json"
-    if os.path.exists(cache_file):
-        with open(cache_file, 'r') as f:
-            cache = json.load(f)
-    else:
-        cache = {}
-    
-    cache[question] = response
-    
-    with open(cache_file, 'w') as f:
-        json.dump(cache, f, indent=2)
+@st.cache_resource
+def init_feedback():
+    return open_feedback_store(load_config())
+
+def save_feedback(index, feedback):
+    # Queued for the shared feedback log's writer thread; the click returns immediately
+    msg = st.session_state.messages[index]
+    init_feedback().record(st.session_state.messages[index - 1]["content"], msg["content"], feedback, app="support",
+                           session_id=st.session_state.session_id, request_id=msg.get("request_id"))
+    st.session_state.feedback[index] = feedback
+
+@st.cache_resource
+def init_voice():
+    # pyttsx3 / openai load on the first answer read aloud
+    return timed_import("tts").Voice.from_config(load_config())
+
+def voice_enabled():
+    return load_config().get("voice_output", False) and st.session_state.get("voice", False)
 
-def validate_english_response(response_text):
-    """Ensure response is in English only"""
-    non_english_patterns = ['¿', '¡', 'ñ', 'ç', 'ü', 'ß', 'à', 'é', 'è', 'ê', 'ë', 'î', 'ï', 'ô', 'ù', 'û', 'ÿ', 'ą', 'ć', 'ę', 'ł', 'ń', 'ó', 'ś', 'ź', 'ż']
-    if any(pattern in response_text for pattern in non_english_patterns):
-        return "I apologize, but I can only respond in English. Please contact (833) 224-6603 for assistance in other languages."
-    return response_text
+@st.cache_resource
+def init_tracing():
+    port = load_config().get("metrics_port")
+    if port:
+        start_metrics_server(port)
 
 # Initialize session state
 if "messages" not in st.session_state:
@@ -137,9 +105,14 @@ if "selected_msg" not in st.session_state:
     st.session_state.selected_msg = None
 if "last_question" not in st.session_state:
     st.session_state.last_question = None
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if "answer_audio" not in st.session_state:
+    st.session_state.answer_audio = None
 
-# Initialize chain
-chain = init_chain()
+# Initialize chat engine
+init_tracing()
+engine_warmup = init_engine()
 
 with st.expander("⚠️ Disclaimer"):
     st.warning("This chatbot is an AI assistant built for demonstration. Responses may be inaccurate. Do not use for legal, financial or sensitive decisions.")
@@ -149,63 +122,59 @@ if question := st.chat_input("💬 Hello, how can Spectra assist you today?"):
         st.session_state.last_question = question
         st.session_state.messages.append({"role": "user", "content": question})
         
-        with st.spinner("Processing your request..."):
-            # Check cache first
-            cached_response = get_cached_response(question)
-            
-            if cached_response:
-                response_text = validate_english_response(cached_response)
-            else:
-                response = chain({"question": question, "chat_history": [(m["content"], "") for m in st.session_state.messages if m["role"] == "user"]})
-                response_text = validate_english_response(response["answer"])
-                save_to_cache(question, response_text)
+        with st.chat_message("user"):
+            st.write(question)
+        with st.chat_message("assistant"):
+            placeholder = st.empty()
+            placeholder.markdown(CURSOR)
+            handler = StreamToPlaceholder(placeholder, SUPPORT_GUARDRAIL)
+            # Sentences are spoken as the guardrail releases them, not after the whole answer
+            speaker = init_voice().speaker(st.container()) if voice_enabled() else None
+
+            def on_token(token):
+                handler.write(token)
+                if speaker and not handler.blocked:
+                    speaker.update(handler.released)
+
+            result = get_engine().answer(st.session_state.session_id, question, "support", on_token=on_token)
+            response_text = result["answer"]
+            placeholder.markdown(response_text)
+            # The rest of the answer's audio, played from the history so the rerun does not cut it off
+            answer_audio = speaker.finish(response_text) if speaker else None
         
-        st.session_state.messages.append({"role": "assistant", "content": response_text})
+        st.session_state.messages.append({"role": "assistant", "content": response_text, "request_id": result["request_id"]})
         if len(st.session_state.messages) > 20:
             st.session_state.messages = st.session_state.messages[-20:]
+        st.session_state.answer_audio = (len(st.session_state.messages) - 1, answer_audio) if answer_audio else None
         st.rerun()
 
 
-def generate_pdf():
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    story = []
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        alignment=1  # Center alignment
-    )
-    story.append(Paragraph("Customer Support Chat History", title_style))
-    story.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
-    story.append(Spacer(1, 20))
-    
-    # Chat messages
-    for i, msg in enumerate(st.session_state.messages):
-        if msg["role"] == "user":
-            story.append(Paragraph(f"<b>Question {i//2+1}:</b>", styles['Heading3']))
-            story.append(Paragraph(msg["content"], styles['Normal']))
-            story.append(Spacer(1, 10))
-        else:
-            story.append(Paragraph("<b>Answer:</b>", styles['Heading3']))
-            story.append(Paragraph(msg["content"], styles['Normal']))
-            story.append(Spacer(1, 20))
-    
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+@st.cache_data(max_entries=16, show_spinner=False)
+def export_body(messages, fmt):
+    # Re-rendered only when the transcript changes
+    return timed_import("transcript_export").text_body(messages, fmt)
+
+def export_transcript(messages, fmt):
+    # "Generated on" is added after the cache lookup so a re-download shows the current time;
+    # a PDF is only rendered on request (reportlab loads then) and is not cached
+    export = timed_import("transcript_export")
+    if fmt == "pdf":
+        return export.export_bytes(messages, fmt)
+    return export.stamp(export_body(messages, fmt), fmt)
 
 # Sidebar for chat history
 with st.sidebar:
+    if load_config().get("voice_output", False):
+        st.toggle("🔊 Read answers aloud", key="voice")
+
     st.header("Chat History")
     
     if st.button("Clear History"):
+        if engine_warmup.ready():
+            get_engine().reset(st.session_state.session_id)
         st.session_state.messages = []
         st.session_state.selected_msg = None
+        st.session_state.answer_audio = None
         st.rerun()
     
     if len(st.session_state.messages) == 0:
@@ -234,6 +203,9 @@ else:
     for i, msg in enumerate(st.session_state.messages):
         with st.chat_message(msg["role"]):
             st.write(msg["content"])
+            if st.session_state.answer_audio and st.session_state.answer_audio[0] == i:
+                # Same element on every rerun, so it keeps playing rather than restarting
+                st.audio(st.session_state.answer_audio[1], format=init_voice().mime, autoplay=True)
             
             # Add like/dislike buttons for assistant messages
             if msg["role"] == "assistant":
@@ -241,17 +213,21 @@ else:
                 with col1:
                     like_class = "feedback-liked" if st.session_state.feedback.get(i) == "like" else ""
                     if st.button("👍", key=f"like_{i}"):
-                        st.session_state.feedback[i] = "like"
+                        save_feedback(i, "like")
                         st.rerun()
                     if like_class:
                         st.markdown(f'<style>button[data-testid="baseButton-secondary"]:has([data-testid="like_{i}"]) {{background:#4caf50 !important;color:#ffffff !important;border:2px solid #4caf50 !important}}</style>', unsafe_allow_html=True)
                 with col2:
                     dislike_class = "feedback-disliked" if st.session_state.feedback.get(i) == "dislike" else ""
                     if st.button("👎", key=f"dislike_{i}"):
-                        st.session_state.feedback[i] = "dislike"
+                        save_feedback(i, "dislike")
                         st.rerun()
                     if dislike_class:
                         st.markdown(f'<style>button[data-testid="baseButton-secondary"]:has([data-testid="dislike_{i}"]) {{background:#f44336 !important;color:#ffffff !important;border:2px solid #f44336 !important}}</style>', unsafe_allow_html=True)
+                with col3:
+                    if voice_enabled() and st.button("🔊", key=f"play_{i}"):
+                        voice = init_voice()
+                        st.audio(voice.answer_audio(msg["content"]), format=voice.mime, autoplay=True)
 
 
 # Download PDF button in main area
@@ -260,14 +236,25 @@ if st.session_state.messages:
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
         if st.button("📄 Download Chat as PDF", use_container_width=True):
-            pdf_buffer = generate_pdf()
             st.download_button(
                 label="💾 Click to Save PDF",
-                data=pdf_buffer,
+                data=export_transcript(st.session_state.messages, "pdf"),
                 file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
                 mime="application/pdf",
                 use_container_width=True
             )
+        md_col, html_col = st.columns(2)
+        for col, fmt, label, mime in ((md_col, "md", "📝 Markdown", "text/markdown"), (html_col, "html", "🌐 HTML", "text/html")):
+            with col:
+                st.download_button(
+                    label=label,
+                    data=export_transcript(st.session_state.messages, fmt),
+                    file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}",
+                    mime=mime,
+                    use_container_width=True
+                )
 
 # Footer
-st.markdown("<div class='footer-fixed'><strong>Need further assistance?</strong> Call us at <strong>(833) 224-6603</strong></div>", unsafe_allow_html=True)
\ No newline at end of file
+st.markdown("<div class='footer-fixed'><strong>Need further assistance?</strong> Call us at <strong>(833) 224-6603</strong></div>", unsafe_allow_html=True)
+
+observe_script_run("app-claude", time.perf_counter() - script_started)
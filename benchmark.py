@@ -0,0 +1,374 @@
+"""Offline latency benchmark for the support chatbot.
+
+Replays real questions (the keys of response_cache.json and the questions
+in feedback.json) through the same retriever and ConversationalRetrievalChain
+configuration the apps build in init_chain, with deterministic local
+stand-ins for BedrockEmbeddings and ChatBedrock, so it runs without AWS.
+Each session asks its questions as one conversation, so prompt tokens and
+latency are also reported per turn.
+
+    python benchmark.py --sessions 4 --save-baseline bench_baseline.json
+    python benchmark.py --sessions 4 --baseline bench_baseline.json
+    python benchmark.py --history buffer     # unbounded ConversationBufferMemory, for comparison
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_classic.vectorstores import FAISS
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from cache_store import ResponseCache
+from chat_chain import SUPPORT_TEMPLATE, build_chain, build_retriever, make_memory
+from history import approximate_tokens
+from lexical_index import tokenize
+from retrieval import DEFAULT_INDEXES, load_vectorstores
+from streaming import ANSWER_TAG
+from validation import validate_english_response
+
+STAGES = ("cache_read", "condense", "embed", "search", "prompt_build", "llm", "validation", "cache_write")
+
+_current = threading.local()
+
+
+class StageTimer:
+    """Seconds spent per stage for one replayed question"""
+
+    def __init__(self):
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.prompt_tokens = 0
+        self.context_tokens = 0
+        self.coverage = 0.0
+        self.condensed = False
+
+    def add(self, stage, seconds):
+        self.stages[stage] += seconds
+
+    @contextmanager
+    def measure(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+
+def current_timer():
+    return getattr(_current, "timer", None)
+
+
+class StubEmbeddings(Embeddings):
+    """Deterministic feature-hashed bag-of-words vectors with injected latency"""
+
+    def __init__(self, size=1536, latency=0.05):
+        self.size = size
+        self.latency = latency
+
+    def _vector(self, text):
+        vector = np.zeros(self.size, dtype="float32")
+        for token in tokenize(text):
+            digest = hashlib.md5(token.encode()).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.size] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        started = time.perf_counter()
+        time.sleep(self.latency)
+        vector = self._vector(text)
+        timer = current_timer()
+        if timer:
+            timer.add("embed", time.perf_counter() - started)
+        return vector
+
+
+class StubChatModel(BaseChatModel):
+    """ChatBedrock stand-in: time to first token grows with the prompt, then a steady token rate.
+
+    Condensing prompts get the follow-up question back; answer prompts get
+    the first sentences of the supplied context as bullet points.
+    """
+
+    first_token_latency: float = 0.4
+    tokens_per_second: float = 60.0
+    prefill_tokens_per_second: float = 5000.0
+    max_tokens: int = 120
+    streaming: bool = False
+
+    @property
+    def _llm_type(self):
+        return "stub-chat"
+
+    def _reply(self, messages):
+        prompt = messages[-1].content
+        follow_up = re.search(r"Follow Up Input:\s*(.*?)\s*Standalone question:", prompt, re.S)
+        if follow_up:
+            return follow_up.group(1)
+        context = prompt.split("CONTEXT INFORMATION:")[-1].split("CUSTOMER QUESTION:")[0]
+        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", " ".join(context.split())) if s.strip()]
+        words = " ".join(f"- {s}\n" for s in sentences[:6]).split(" ")[:self.max_tokens]
+        return " ".join(words) + "\nFor more details, please refer https://www.spectrum.net/support/category/mobile"
+
+    def _first_token_delay(self, messages):
+        prompt_tokens = sum(approximate_tokens(message.content) for message in messages)
+        return self.first_token_latency + prompt_tokens / self.prefill_tokens_per_second
+
+    def _tokens(self, messages):
+        return re.findall(r"\S+\s*", self._reply(messages))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            text = "".join(chunk.text for chunk in self._stream(messages, stop, run_manager, **kwargs))
+        else:
+            tokens = self._tokens(messages)
+            time.sleep(self._first_token_delay(messages) + len(tokens) / self.tokens_per_second)
+            text = "".join(tokens)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._first_token_delay(messages))
+        for token in self._tokens(messages):
+            time.sleep(1 / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class StageTimingHandler(BaseCallbackHandler):
+    """Splits a chain run into condense, retrieval, prompt build and LLM time"""
+
+    def __init__(self, timer):
+        self.timer = timer
+        self.started = {}
+        self.retrieval_end = None
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self.started[run_id] = time.perf_counter()
+        self.query_terms = set(tokenize(query))
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self.retrieval_end = time.perf_counter()
+        self.timer.add("search", self.retrieval_end - self.started.pop(run_id) - self.timer.stages["embed"])
+        context = " ".join(doc.page_content for doc in documents)
+        self.timer.context_tokens = approximate_tokens(context)
+        # Share of the query's terms the context still contains: a cheap proxy for answerability
+        if self.query_terms:
+            self.timer.coverage = len(self.query_terms.intersection(tokenize(context))) / len(self.query_terms)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        now = time.perf_counter()
+        self.started[run_id] = now
+        self.timer.prompt_tokens += sum(approximate_tokens(m.content) for batch in messages for m in batch)
+        if ANSWER_TAG not in (tags or []):
+            self.timer.condensed = True
+        if ANSWER_TAG in (tags or []) and self.retrieval_end is not None:
+            self.timer.add("prompt_build", now - self.retrieval_end)
+
+    def on_llm_end(self, response, *, run_id, tags=None, **kwargs):
+        stage = "llm" if ANSWER_TAG in (tags or []) else "condense"
+        self.timer.add(stage, time.perf_counter() - self.started.pop(run_id))
+
+
+def load_questions(cache_path="response_cache.json", feedback_path="feedback.json"):
+    """Benchmark questions: cached question keys, then questions with feedback"""
+    questions = []
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r') as f:
+            questions.extend(json.load(f))
+    if os.path.exists(feedback_path):
+        with open(feedback_path, 'r') as f:
+            questions.extend(entry["question"] for entry in json.load(f))
+    return list(dict.fromkeys(q for q in questions if q.strip()))
+
+
+def stub_vectorstores(embeddings, index_dirs=DEFAULT_INDEXES):
+    """Re-embed the real indexes' chunks with the stub so vector search is meaningful offline"""
+    stores = {}
+    for name, store in load_vectorstores(embeddings, index_dirs).items():
+        ids = list(store.index_to_docstore_id.values())
+        docs = [store.docstore.search(doc_id) for doc_id in ids]
+        texts = [doc.page_content for doc in docs]
+        stores[name] = FAISS.from_embeddings(
+            list(zip(texts, embeddings.embed_documents(texts))),
+            embeddings,
+            metadatas=[doc.metadata for doc in docs],
+            ids=ids,
+        )
+    return stores
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    return float(np.percentile(values, pct))
+
+
+def run_session(chain, questions, cache):
+    results = []
+    for question in questions:
+        timer = StageTimer()
+        _current.timer = timer
+        started = time.perf_counter()
+        with timer.measure("cache_read"):
+            cache.get(question)
+        response = chain({"question": question, "chat_history": []}, callbacks=[StageTimingHandler(timer)])
+        with timer.measure("validation"):
+            answer = validate_english_response(response["answer"])
+        with timer.measure("cache_write"):
+            cache.set(question, answer)
+        results.append({
+            "total": time.perf_counter() - started,
+            "stages": timer.stages,
+            "prompt_tokens": timer.prompt_tokens,
+            "context_tokens": timer.context_tokens,
+            "coverage": timer.coverage,
+            "condensed": timer.condensed,
+        })
+        _current.timer = None
+    return results
+
+
+def run_benchmark(args):
+    embeddings = StubEmbeddings(latency=args.embed_latency)
+    config = {"lexical_fast_path": not args.no_lexical_fast_path, "context_packing": not args.no_context_packing}
+    retriever = build_retriever(config, embeddings, vectorstores=stub_vectorstores(embeddings))
+    llm_options = {
+        "first_token_latency": args.llm_latency,
+        "tokens_per_second": args.llm_tps,
+        "prefill_tokens_per_second": args.llm_prefill_tps,
+    }
+    answer_llm = StubChatModel(streaming=True, tags=[ANSWER_TAG], **llm_options)
+    condense_llm = StubChatModel(**llm_options)
+
+    questions = load_questions()[:args.questions or None]
+    # Each session asks the same questions from a different starting point
+    session_questions = [
+        questions[i % len(questions):] + questions[:i % len(questions)] for i in range(args.sessions)
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, "bench_cache.db"))
+        chains = [
+            build_chain(
+                answer_llm, condense_llm, retriever, SUPPORT_TEMPLATE,
+                memory=None if args.history == "buffer" else make_memory({}, condense_llm),
+            )
+            for _ in range(args.sessions)
+        ]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            runs = list(pool.map(run_session, chains, session_questions, [cache] * args.sessions))
+        wall = time.perf_counter() - started
+        cache.close()
+
+    results = [result for run in runs for result in run]
+    totals = [result["total"] for result in results]
+    turns = [[run[turn] for run in runs if turn < len(run)] for turn in range(max(map(len, runs)))]
+    return {
+        "sessions": args.sessions,
+        "history": args.history,
+        "requests": len(results),
+        "throughput_rps": len(results) / wall,
+        "prompt_tokens": float(np.mean([r["prompt_tokens"] for r in results])),
+        "context_tokens": float(np.mean([r["context_tokens"] for r in results])),
+        "context_coverage": float(np.mean([r["coverage"] for r in results])),
+        "condense_rate": float(np.mean([r["condensed"] for r in results])),
+        "turns": [
+            {
+                "prompt_tokens": float(np.mean([r["prompt_tokens"] for r in turn])),
+                "latency": float(np.mean([r["total"] for r in turn])),
+            }
+            for turn in turns
+        ],
+        "latency": {f"p{pct}": percentile(totals, pct) for pct in (50, 95, 99)},
+        "stages": {
+            stage: {
+                "mean": float(np.mean([r["stages"][stage] for r in results])),
+                "p95": percentile([r["stages"][stage] for r in results], 95),
+            }
+            for stage in STAGES
+        },
+    }
+
+
+def print_summary(summary, baseline=None):
+    def delta(current, previous):
+        if not previous:
+            return ""
+        return f"  ({(current - previous) / previous:+.1%} vs baseline)"
+
+    base_latency = (baseline or {}).get("latency", {})
+    base_stages = (baseline or {}).get("stages", {})
+    print(f"{summary['requests']} requests over {summary['sessions']} concurrent sessions")
+    print(f"throughput: {summary['throughput_rps']:.2f} req/s"
+          f"{delta(summary['throughput_rps'], (baseline or {}).get('throughput_rps'))}")
+    for name, value in summary["latency"].items():
+        print(f"{name}: {value * 1000:.1f} ms{delta(value, base_latency.get(name))}")
+    print(f"prompt tokens/request: {summary['prompt_tokens']:.0f}"
+          f"{delta(summary['prompt_tokens'], (baseline or {}).get('prompt_tokens'))}")
+    print(f"context tokens/request: {summary['context_tokens']:.0f}"
+          f"{delta(summary['context_tokens'], (baseline or {}).get('context_tokens'))}")
+    print(f"query terms covered by context: {summary['context_coverage']:.1%}"
+          f"{delta(summary['context_coverage'], (baseline or {}).get('context_coverage'))}")
+    print(f"condensing calls: {summary['condense_rate']:.0%} of requests ({summary['history']} history)")
+    print("turn    prompt tokens    mean ms")
+    base_turns = (baseline or {}).get("turns", [])
+    for turn, values in enumerate(summary["turns"]):
+        # Every turn for short runs, then every tenth
+        if turn >= 10 and (turn + 1) % 10:
+            continue
+        previous = base_turns[turn]["prompt_tokens"] if turn < len(base_turns) else None
+        print(f"{turn + 1:<8}{values['prompt_tokens']:>13.0f}{values['latency'] * 1000:>11.1f}"
+              f"{delta(values['prompt_tokens'], previous)}")
+    print("stage          mean ms    p95 ms")
+    for stage, values in summary["stages"].items():
+        print(f"{stage:<14}{values['mean'] * 1000:>8.1f}{values['p95'] * 1000:>10.1f}"
+              f"{delta(values['mean'], base_stages.get(stage, {}).get('mean'))}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay support questions through the chain with local stubs")
+    parser.add_argument("--sessions", type=int, default=1, help="concurrent chat sessions")
+    parser.add_argument("--questions", type=int, default=None, help="limit the number of questions per session")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per stub embedding call")
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="stub time to first token in seconds")
+    parser.add_argument("--llm-tps", type=float, default=60.0, help="stub generated tokens per second")
+    parser.add_argument("--llm-prefill-tps", type=float, default=5000.0, help="stub prompt tokens processed per second")
+    parser.add_argument("--no-lexical-fast-path", action="store_true")
+    parser.add_argument("--no-context-packing", action="store_true", help="stuff the raw top-5 chunks as before")
+    parser.add_argument("--history", choices=("budget", "buffer"), default="budget",
+                        help="token-budgeted history (default) or the old unbounded buffer memory")
+    parser.add_argument("--baseline", help="compare against a summary saved with --save-baseline")
+    parser.add_argument("--save-baseline", help="write this run's summary as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    summary = run_benchmark(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    print_summary(summary, baseline)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Keeps the response cache consistent with user feedback and the retrieval index.
+
+Every engine runs a ``CacheMaintainer`` thread. Each pass applies new rows
+from the feedback log to the cache (a dislike stops the answer being
+served, repeated likes pin it), then regenerates a batch of stale
+entries: disliked answers and answers built from an older ``faiss_index``,
+pinned ones first. Each entry is claimed in the shared database before it is
+regenerated, so one process redoes it however many apps are running, and
+answered again by the profile that produced it.
+
+    python cache_maintenance.py status
+    python cache_maintenance.py refresh        # regenerate everything stale now, e.g. after ingest
+"""
+import argparse
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_store import open_cache
+from feedback_store import DEFAULT_DB_PATH as FEEDBACK_DB_PATH, feedback_after
+from semantic_cache import index_fingerprint
+from tracing import METRICS
+
+
+class CacheMaintainer:
+    """Applies feedback to the engine's cache and regenerates stale entries every ``interval`` seconds.
+
+    Regeneration goes through the engine's LLM scheduler under one shared
+    fairness queue, and at most ``concurrency`` at a time, so it takes turns
+    with live sessions instead of crowding them out. A claim lasts
+    ``claim_seconds``; if the process dies mid-regeneration another one
+    picks the entry up after that. ``profile`` answers entries cached before
+    profiles were recorded.
+    """
+
+    def __init__(self, engine, feedback_db=FEEDBACK_DB_PATH, interval=30, batch=8, concurrency=2,
+                 pin_likes=3, profile="support", claim_seconds=300):
+        self.engine = engine
+        self.response_cache = engine.cache.response_cache
+        self.fingerprint = engine.cache.fingerprint
+        self.feedback_db = feedback_db
+        self.interval = interval
+        self.batch = batch
+        self.concurrency = concurrency
+        self.pin_likes = pin_likes
+        self.profile = profile
+        self.claim_seconds = claim_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, engine, config):
+        return cls(
+            engine,
+            feedback_db=config.get("feedback_db", FEEDBACK_DB_PATH),
+            interval=config.get("cache_maintenance_interval", 30),
+            batch=config.get("cache_refresh_batch", 8),
+            concurrency=config.get("cache_refresh_concurrency", 2),
+            pin_likes=config.get("cache_pin_likes", 3),
+            profile=config.get("cache_refresh_profile", "support"),
+            claim_seconds=config.get("cache_refresh_claim_seconds", 300),
+        )
+
+    def start(self):
+        if self.interval and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="cache-maintainer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[cache] maintenance pass failed: {e}", file=sys.stderr)
+
+    def apply_feedback(self):
+        rows = feedback_after(self.feedback_db, self.response_cache.feedback_cursor())
+        stale, pinned = self.response_cache.apply_feedback(rows, self.pin_likes) if rows else (0, 0)
+        # Entries another process marked stale may still sit in this process's memory layer
+        self.response_cache.forget_stale()
+        if stale:
+            METRICS.inc("chatbot_cache_feedback_total", stale, help="Cache entries changed by feedback", action="stale")
+        if pinned:
+            METRICS.inc("chatbot_cache_feedback_total", pinned, help="Cache entries changed by feedback", action="pinned")
+        return stale, pinned
+
+    def regenerate(self, limit=None):
+        """Regenerate up to ``limit`` stale entries (``None``: all of them); returns how many succeeded"""
+        done = 0
+        while limit is None or done < limit:
+            size = self.batch if limit is None else min(self.batch, limit - done)
+            candidates = self.response_cache.refresh_candidates(self.fingerprint, size)
+            if not candidates:
+                break
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                results = list(pool.map(lambda candidate: self._regenerate_one(*candidate), candidates))
+            done += sum(results)
+            if not any(results):
+                break  # every candidate failed; try again next pass
+        return done
+
+    def _regenerate_one(self, question, profile=None):
+        if not self.response_cache.claim(question, self.fingerprint, self.claim_seconds):
+            return False  # another process is regenerating it, or already has
+        try:
+            self.engine.regenerate(question, profile or self.profile)
+        except Exception as e:
+            self.response_cache.release(question)
+            print(f"[cache] could not regenerate {question!r}: {e}", file=sys.stderr)
+            return False
+        METRICS.inc("chatbot_cache_regenerated_total", help="Stale cache entries answered again")
+        return True
+
+    def run_once(self):
+        stale, pinned = self.apply_feedback()
+        regenerated = self.regenerate(self.batch)
+        return {"stale": stale, "pinned": pinned, "regenerated": regenerated}
+
+
+def print_stats(stats):
+    print(f"{stats['entries']} entries, {stats['pinned']} pinned, {stats['stale']} stale, "
+          f"{stats['other_index']} from another index")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply feedback to the response cache and regenerate stale entries")
+    parser.add_argument("command", choices=["status", "refresh"])
+    parser.add_argument("--config", default="config.json")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    if args.command == "status":
+        cache = open_cache(config)
+        pending = feedback_after(config.get("feedback_db", FEEDBACK_DB_PATH), cache.feedback_cursor())
+        print_stats(cache.stats(index_fingerprint()))
+        print(f"{len(pending)} feedback rows not applied yet")
+        return
+
+    # The periodic thread is not needed for a one-off pass
+    config["cache_maintenance_interval"] = 0
+    from chat_engine import ChatEngine
+
+    maintainer = ChatEngine(config).maintainer
+    stale, pinned = maintainer.apply_feedback()
+    print(f"feedback applied: {stale} marked stale, {pinned} pinned")
+    print(f"regenerated {maintainer.regenerate()} entries")
+    print_stats(maintainer.response_cache.stats(maintainer.fingerprint))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_DB_PATH = "response_cache.db"
+LEGACY_JSON_PATH = "response_cache.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    question TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access);
+CREATE TABLE IF NOT EXISTS cache_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Feedback and index-tracking columns, added to databases created before them
+FEEDBACK_COLUMNS = {
+    "likes": "INTEGER NOT NULL DEFAULT 0",
+    "pinned": "INTEGER NOT NULL DEFAULT 0",
+    "stale_since": "REAL",
+    "index_fingerprint": "TEXT",
+    "profile": "TEXT",
+    "refreshing_until": "REAL NOT NULL DEFAULT 0",
+}
+FEEDBACK_CURSOR = "feedback_cursor"
+
+# Only persist a read's access time when it moved by at least this much,
+# so cache hits do not turn into a write per question.
+TOUCH_INTERVAL = 60
+
+
+class ResponseCache:
+    """Question -> answer cache backed by SQLite with an in-process LRU layer.
+
+    Lookups are a primary-key read, writes are single-row upserts, and the
+    database runs in WAL mode so several Streamlit processes can share it.
+    Entries older than ``ttl_seconds`` are treated as misses, and the store is
+    trimmed to ``max_entries`` by least-recent access.
+
+    Feedback adjusts entries in place: a disliked answer is marked stale and
+    no longer served until it is regenerated, and an answer liked
+    ``pin_likes`` times is pinned, exempt from TTL and eviction. Each entry
+    records the fingerprint of the index it was answered from and the
+    profile that answered it. Regeneration claims an entry for a while with
+    ``claim`` so processes sharing the database do not all redo it.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, max_entries=5000, ttl_seconds=None, memory_entries=256):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._add_columns()
+
+    def _add_columns(self):
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        for name, declaration in FEEDBACK_COLUMNS.items():
+            if name not in existing:
+                try:
+                    self._conn.execute(f"ALTER TABLE responses ADD COLUMN {name} {declaration}")
+                except sqlite3.OperationalError:
+                    pass  # another process added it first
+
+    def _expired(self, created_at, now):
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _remember(self, question, response, created_at, last_access, pinned=0):
+        self._memory[question] = (response, created_at, last_access, pinned)
+        self._memory.move_to_end(question)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, question):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(question)
+            if entry is None:
+                row = self._conn.execute(
+                    "SELECT response, created_at, last_access, pinned FROM responses "
+                    "WHERE question = ? AND stale_since IS NULL",
+                    (question,),
+                ).fetchone()
+                if row is None:
+                    return None
+                entry = row
+            response, created_at, last_access, pinned = entry
+            if not pinned and self._expired(created_at, now):
+                self._memory.pop(question, None)
+                self._conn.execute("DELETE FROM responses WHERE question = ?", (question,))
+                return None
+            if now - last_access >= TOUCH_INTERVAL:
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE question = ?", (now, question))
+                last_access = now
+            self._remember(question, response, created_at, last_access, pinned)
+            return response
+
+    def set(self, question, response, fingerprint=None, profile=None):
+        """Store an answer; replacing a stale entry makes it servable again, keeps its pin and ends any claim"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO responses (question, response, created_at, last_access, index_fingerprint, profile) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(question) DO UPDATE SET response = excluded.response, "
+                "created_at = excluded.created_at, last_access = excluded.last_access, "
+                "index_fingerprint = excluded.index_fingerprint, profile = excluded.profile, "
+                "stale_since = NULL, refreshing_until = 0",
+                (question, response, now, now, fingerprint, profile),
+            )
+            (pinned,) = self._conn.execute("SELECT pinned FROM responses WHERE question = ?", (question,)).fetchone()
+            self._remember(question, response, now, now, pinned)
+            self._evict()
+
+    def delete(self, question):
+        with self._lock:
+            self._memory.pop(question, None)
+            self._conn.execute("DELETE FROM responses WHERE question = ?", (question,))
+
+    def _evict(self):
+        if self.ttl_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ? AND pinned = 0", (time.time() - self.ttl_seconds,)
+            )
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            evicted = [q for (q,) in self._conn.execute(
+                "SELECT question FROM responses WHERE pinned = 0 ORDER BY last_access LIMIT ?", (overflow,)
+            )]
+            self._conn.executemany("DELETE FROM responses WHERE question = ?", [(q,) for q in evicted])
+            for question in evicted:
+                self._memory.pop(question, None)
+
+    def feedback_cursor(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache_meta WHERE key = ?", (FEEDBACK_CURSOR,)).fetchone()
+        return int(row[0]) if row else 0
+
+    def apply_feedback(self, rows, pin_likes=3):
+        """Apply ``(id, response, feedback)`` rows from the feedback log, each exactly once.
+
+        Entries are matched by answer text, so feedback on a semantic hit
+        reaches the entry that served it, and feedback on an answer that has
+        since been regenerated changes nothing. The cursor lives in the
+        shared database and moves in the same transaction, so concurrent
+        processes never apply a row twice. Returns ``(stale, pinned)`` counts.
+        """
+        stale = pinned = 0
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM cache_meta WHERE key = ?", (FEEDBACK_CURSOR,)).fetchone()
+                cursor = int(row[0]) if row else 0
+                for row_id, response, feedback in rows:
+                    if row_id <= cursor:
+                        continue
+                    cursor = row_id
+                    questions = [q for (q,) in self._conn.execute(
+                        "SELECT question FROM responses WHERE response = ? AND stale_since IS NULL", (response,)
+                    )]
+                    for question in questions:
+                        if feedback == "dislike":
+                            self._conn.execute(
+                                "UPDATE responses SET stale_since = ?, pinned = 0, likes = 0 WHERE question = ?",
+                                (now, question),
+                            )
+                            self._memory.pop(question, None)
+                            stale += 1
+                            continue
+                        self._conn.execute("UPDATE responses SET likes = likes + 1 WHERE question = ?", (question,))
+                        if self._conn.execute(
+                            "UPDATE responses SET pinned = 1 WHERE question = ? AND pinned = 0 AND likes >= ?",
+                            (question, pin_likes),
+                        ).rowcount:
+                            self._memory.pop(question, None)
+                            pinned += 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache_meta (key, value) VALUES (?, ?)", (FEEDBACK_CURSOR, str(cursor))
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return stale, pinned
+
+    def forget_stale(self):
+        """Drop in-memory copies of entries marked stale, including by other processes"""
+        with self._lock:
+            for (question,) in self._conn.execute("SELECT question FROM responses WHERE stale_since IS NOT NULL"):
+                self._memory.pop(question, None)
+
+    def prewarm(self):
+        """Load pinned entries into the in-memory layer; returns how many"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question, response, created_at, last_access FROM responses "
+                "WHERE pinned = 1 AND stale_since IS NULL ORDER BY last_access DESC LIMIT ?",
+                (self.memory_entries,),
+            ).fetchall()
+            for question, response, created_at, last_access in reversed(rows):
+                self._remember(question, response, created_at, last_access, 1)
+        return len(rows)
+
+    def adopt_fingerprint(self, fingerprint):
+        """Attribute entries of unknown origin (e.g. migrated from JSON) to the current index"""
+        with self._lock:
+            self._conn.execute("UPDATE responses SET index_fingerprint = ? WHERE index_fingerprint IS NULL", (fingerprint,))
+
+    def refresh_candidates(self, fingerprint, limit):
+        """``(question, profile)`` pairs to regenerate: disliked entries and entries from another index, pinned first.
+
+        Entries another process has claimed are left out; ``profile`` is
+        None for entries written before profiles were recorded.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT question, profile FROM responses "
+                "WHERE (stale_since IS NOT NULL OR index_fingerprint != ?) AND refreshing_until < ? "
+                "ORDER BY pinned DESC, stale_since IS NULL, last_access DESC LIMIT ?",
+                (fingerprint, time.time(), limit),
+            ).fetchall()
+
+    def claim(self, question, fingerprint, seconds):
+        """Reserve ``question`` for regeneration for ``seconds``.
+
+        False if another process holds it or has already regenerated it
+        since it was listed by ``refresh_candidates``.
+        """
+        now = time.time()
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE responses SET refreshing_until = ? WHERE question = ? AND refreshing_until < ? "
+                "AND (stale_since IS NOT NULL OR index_fingerprint != ?)",
+                (now + seconds, question, now, fingerprint),
+            ).rowcount == 1
+
+    def release(self, question):
+        """Give up a claim without regenerating, so the next pass can try again"""
+        with self._lock:
+            self._conn.execute("UPDATE responses SET refreshing_until = 0 WHERE question = ?", (question,))
+
+    def fresh(self, questions, fingerprint):
+        """The subset of ``questions`` whose entry would be served and was answered from the ``fingerprint`` index"""
+        now = time.time()
+        found = set()
+        with self._lock:
+            # Chunked to stay under SQLite's bound-parameter limit
+            for start in range(0, len(questions), 500):
+                chunk = questions[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT question, created_at, pinned FROM responses WHERE stale_since IS NULL "
+                    f"AND index_fingerprint = ? AND question IN ({', '.join('?' * len(chunk))})",
+                    (fingerprint, *chunk),
+                )
+                found.update(question for question, created_at, pinned in rows
+                             if pinned or not self._expired(created_at, now))
+        return found
+
+    def stats(self, fingerprint=None):
+        with self._lock:
+            total, pinned, stale, other_index = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(pinned), 0), COALESCE(SUM(stale_since IS NOT NULL), 0), "
+                "COALESCE(SUM(index_fingerprint != ?), 0) FROM responses",
+                (fingerprint,),
+            ).fetchone()
+        return {"entries": total, "pinned": pinned, "stale": stale, "other_index": other_index}
+
+    def keys(self):
+        with self._lock:
+            return [q for (q,) in self._conn.execute("SELECT question FROM responses ORDER BY created_at")]
+
+    def popular_keys(self):
+        """Questions by pin and like count; unlike ``keys`` the order survives answers being rewritten"""
+        with self._lock:
+            return [q for (q,) in self._conn.execute("SELECT question FROM responses ORDER BY pinned DESC, likes DESC, question")]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_json_cache(cache, json_path=LEGACY_JSON_PATH):
+    """Copy every entry of the legacy whole-file JSON cache into ``cache``"""
+    with open(json_path, 'r') as f:
+        legacy = json.load(f)
+    now = time.time()
+    with cache._lock:
+        cache._conn.execute("BEGIN")
+        cache._conn.executemany(
+            "INSERT OR IGNORE INTO responses (question, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+            [(question, response, now, now) for question, response in legacy.items()],
+        )
+        cache._conn.execute("COMMIT")
+    return len(legacy)
+
+
+def open_cache(config=None, db_path=DEFAULT_DB_PATH, json_path=LEGACY_JSON_PATH):
+    """Open the shared cache, migrating ``response_cache.json`` on first use"""
+    config = config or {}
+    first_run = not os.path.exists(db_path)
+    cache = ResponseCache(
+        db_path,
+        max_entries=config.get("cache_max_entries", 5000),
+        ttl_seconds=config.get("cache_ttl_seconds"),
+        memory_entries=config.get("cache_memory_entries", 256),
+    )
+    if first_run and os.path.exists(json_path):
+        migrate_json_cache(cache, json_path)
+    return cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the shared response cache")
+    parser.add_argument("command", choices=["migrate", "stats"])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--json", default=LEGACY_JSON_PATH)
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.db)
+    if args.command == "migrate":
+        count = migrate_json_cache(cache, args.json)
+        print(f"Migrated {count} entries from {args.json} into {args.db}")
+    stats = cache.stats()
+    print(f"{args.db}: {stats['entries']} cached responses, {stats['pinned']} pinned, {stats['stale']} stale")
+
+if __name__ == "__main__":
+    main()
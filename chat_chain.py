@@ -0,0 +1,133 @@
+import boto3
+from langchain_aws import BedrockEmbeddings, ChatBedrock
+from langchain_classic.chains import ConversationalRetrievalChain
+from langchain_classic.memory import ConversationBufferMemory
+from langchain_classic.prompts import PromptTemplate
+
+from context_packing import ContextPackingRetriever, merged_idf
+from history import TokenBudgetMemory
+from retrieval import DEFAULT_INDEXES, HybridRetriever, load_indexes, load_lexical_indexes
+from streaming import ANSWER_TAG
+
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v1"
+
+SUPPORT_TEMPLATE = """You are a Spectrum mobile customer support assistant. Follow these rules EXACTLY:
+
+        STRICT REQUIREMENTS:
+        1. Answer ONLY in English - no other languages permitted
+        2. Use ONLY information from the provided context below
+        3. If information is not in context, respond: "I don't have that information. Please contact (833) 224-6603 for further assistance 
+            or visit https://www.spectrum.net/support/category/mobile for further assistance."
+        4. Only mention phone number (833) 224-6603 - no other numbers
+        5. Stay focused on Spectrum mobile products and services only
+        6. Provide factual, direct answers without speculation
+        7. ALWAYS use bullet points for clarity when listing multiple items. Each bullet point should be in a separate line.
+        8. Include the actual link at the bottom of the response with a prefix "For more details, please refer "
+        
+        CONTEXT INFORMATION:
+        {context}
+        
+        CUSTOMER QUESTION:
+        {question}
+        
+        RESPONSE (English only, context-based facts only):"""
+
+POPUP_TEMPLATE = """You are a Spectrum mobile customer support assistant. Follow these rules EXACTLY:
+
+        STRICT REQUIREMENTS:
+        1. Answer ONLY in English - no other languages permitted
+        2. Use ONLY information from the provided context below
+        3. If information is not in context, respond: "I don't have that information. Please contact (833) 224-6603 for further assistance 
+           or visit https://www.spectrum.net/support/category/mobile for further assistance."
+        4. Only mention phone number (833) 224-6603 - no other numbers
+        5. Stay focused on Spectrum mobile products and services only
+        6. Provide factual, direct answers without speculation
+        7. Use bullet points for clarity when listing multiple items
+        8. Include the actual link at he bottom of the response with a prefix "For more details, please refer "
+        
+        CONTEXT INFORMATION:
+        {context}
+        
+        CUSTOMER QUESTION:
+        {question}
+        
+        RESPONSE (English only, context-based facts only):"""
+
+
+def make_embeddings(config):
+    # Set AWS credentials
+    boto3.setup_default_session(
+        aws_access_key_id=config["aws_access_key_id"],
+        aws_secret_access_key=config["aws_secret_access_key"],
+        region_name=config["aws_region"]
+    )
+    return BedrockEmbeddings(model_id=EMBEDDING_MODEL_ID, region_name=config["aws_region"])
+
+
+def make_llms(config):
+    """The streamed answer model and the non-streamed question-condensing model"""
+    answer_llm = ChatBedrock(
+        model_id=config["model_id"],
+        region_name=config["aws_region"],
+        model_kwargs={"temperature": config["temperature"], "max_tokens": 500},
+        streaming=True,
+        tags=[ANSWER_TAG]
+    )
+    condense_llm = ChatBedrock(
+        model_id=config["model_id"],
+        region_name=config["aws_region"],
+        model_kwargs={"temperature": config["temperature"], "max_tokens": 500}
+    )
+    return answer_llm, condense_llm
+
+
+def build_retriever(config, embeddings, vectorstores=None, index_dirs=DEFAULT_INDEXES, query_vectors=None):
+    # BM25 and one query embedding are searched in faiss_index and, when built, faiss_webindex
+    if vectorstores is None:
+        vectorstores, lexical_indexes = load_indexes(
+            embeddings, index_dirs, config.get("index_search_params"), config.get("use_ann_index", True)
+        )
+    else:
+        lexical_indexes = load_lexical_indexes(index_dirs)
+    packing = config.get("context_packing", True)
+    retriever = HybridRetriever(
+        vectorstores=vectorstores,
+        lexical_indexes=lexical_indexes,
+        embeddings=embeddings,
+        query_vectors=query_vectors,
+        lexical_fast_path=config.get("lexical_fast_path", True),
+        k=config.get("context_candidates", 10) if packing else 5
+    )
+    if not packing:
+        return retriever
+    # Re-rank a wider candidate set and pack it into a fixed token budget
+    return ContextPackingRetriever(
+        base=retriever,
+        token_budget=config.get("context_token_budget", 700),
+        idf=merged_idf(lexical_indexes),
+    )
+
+
+def make_memory(config, condense_llm):
+    """Token-budgeted history for the question-condensing prompt"""
+    return TokenBudgetMemory(
+        max_tokens=config.get("history_max_tokens", 600),
+        window_turns=config.get("history_window_turns", 3),
+        skip_condense=config.get("history_skip_condense", True),
+        summarizer=condense_llm if config.get("history_summarizer") == "llm" else None,
+        token_llm=condense_llm,
+    )
+
+
+def build_chain(answer_llm, condense_llm, retriever, template=SUPPORT_TEMPLATE, memory=None):
+    prompt = PromptTemplate(template=template, input_variables=["context", "question"])
+    if memory is None:
+        memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    return ConversationalRetrievalChain.from_llm(
+        answer_llm,
+        retriever,
+        memory=memory,
+        combine_docs_chain_kwargs={"prompt": prompt},
+        # Condensing the follow-up question is not shown to the user, so it is not streamed
+        condense_question_llm=condense_llm
+    )
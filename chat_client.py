@@ -0,0 +1,36 @@
+import json
+
+import requests
+
+
+class ChatClient:
+    """Thin client for chat_service.py with the same interface as ChatEngine"""
+
+    def __init__(self, base_url, timeout=120):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.http = requests.Session()
+
+    def answer(self, session_id, question, profile="support", on_token=None):
+        body = {"session_id": session_id, "question": question, "profile": profile}
+        if on_token is None:
+            response = self.http.post(f"{self.base_url}/chat", json=body, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+        with self.http.post(f"{self.base_url}/chat/stream", json=body, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if "token" in event:
+                    on_token(event["token"])
+                elif "error" in event:
+                    raise RuntimeError(f"chat service error: {event['error']}")
+                else:
+                    return event
+        raise RuntimeError("chat service closed the stream without an answer")
+
+    def reset(self, session_id):
+        self.http.delete(f"{self.base_url}/sessions/{session_id}", timeout=self.timeout).raise_for_status()
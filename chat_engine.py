@@ -0,0 +1,167 @@
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from cache_maintenance import CacheMaintainer
+from cache_store import open_cache
+from chat_chain import POPUP_TEMPLATE, SUPPORT_TEMPLATE, build_chain, build_retriever, make_embeddings, make_llms, make_memory
+from llm_scheduler import LLMScheduler
+from semantic_cache import SemanticCache, normalize_question
+from startup import record_startup
+from streaming import TokenForwarder
+from tracing import METRICS_FILE, METRICS_FLUSH_SECONDS, Trace, start_metrics_flush
+from validation import POPUP_GUARDRAIL, SUPPORT_GUARDRAIL
+
+# Scheduler fairness queue shared by every cache regeneration
+REFRESH_SESSION = "cache-refresh"
+
+# Prompt and response guardrail for each front end
+PROFILES = {
+    "support": (SUPPORT_TEMPLATE, SUPPORT_GUARDRAIL),
+    "popup": (POPUP_TEMPLATE, POPUP_GUARDRAIL),
+}
+
+
+class _Session:
+    def __init__(self, chain):
+        self.chain = chain
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+
+class ChatEngine:
+    """One warm index, shared Bedrock clients and per-session conversation memory.
+
+    Used in-process by the Streamlit apps or behind chat_service.py. Every
+    session gets its own chain (and so its own token-budgeted history) on
+    top of the shared retriever and models; sessions idle longer than
+    ``session_ttl`` seconds are dropped.
+    """
+
+    def __init__(self, config, session_ttl=3600):
+        self.config = config
+        self.session_ttl = session_ttl
+        self.timings = {}
+        with self._timed("clients"):
+            self.embeddings = make_embeddings(config)
+            self.answer_llm, self.condense_llm = make_llms(config)
+        with self._timed("cache"):
+            self.cache = SemanticCache(
+                self.embeddings, open_cache(config), threshold=config.get("semantic_cache_threshold", 0.92)
+            )
+            self.cache.response_cache.adopt_fingerprint(self.cache.fingerprint)
+            self.cache.response_cache.prewarm()
+        with self._timed("index"):
+            # A cache miss has already embedded the question; retrieval reuses that vector
+            self.retriever = build_retriever(config, self.embeddings, query_vectors=self.cache)
+        self.scheduler = LLMScheduler(
+            max_concurrency=config.get("llm_max_concurrency", 4), retries=config.get("llm_retries", 4)
+        )
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.maintainer = CacheMaintainer.from_config(self, config).start()
+        # metrics.prom is rewritten in the background, never on the request path
+        start_metrics_flush(config.get("metrics_file", METRICS_FILE),
+                            config.get("metrics_flush_seconds", METRICS_FLUSH_SECONDS))
+
+    @contextmanager
+    def _timed(self, phase):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] = time.perf_counter() - started
+            record_startup(phase, self.timings[phase])
+
+    def warmup(self, question="How do I activate my phone?"):
+        """Open the Bedrock connection and fault in the index pages before the first question"""
+        with self._timed("warmup_bedrock"):
+            self.embeddings.embed_query(question)
+        with self._timed("warmup_retrieval"):
+            self.retriever.invoke(question)
+
+    def _session(self, session_id, profile):
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, session in self._sessions.items() if now - session.last_used > self.session_ttl]:
+                del self._sessions[key]
+            session = self._sessions.get((session_id, profile))
+            if session is None:
+                chain = build_chain(
+                    self.answer_llm, self.condense_llm, self.retriever, PROFILES[profile][0],
+                    memory=make_memory(self.config, self.condense_llm),
+                )
+                session = self._sessions[(session_id, profile)] = _Session(chain)
+            session.last_used = now
+            return session
+
+    def answer(self, session_id, question, profile="support", on_token=None):
+        """Answer from cache or the chain; streamed tokens go to ``on_token``"""
+        guardrail = PROFILES[profile][1]
+        trace = Trace(profile, question, session_id)
+        try:
+            with trace.span("cache_read"):
+                cached_response = self.cache.get(question)
+
+            if cached_response:
+                trace.set(cache="hit")
+                with trace.span("validation"):
+                    response_text = guardrail.validate(cached_response)
+            else:
+                trace.set(cache="miss")
+                session = self._session(session_id, profile)
+
+                def call(emit):
+                    with session.lock:
+                        return session.chain(
+                            {"question": question, "chat_history": []},
+                            callbacks=[trace.handler(), TokenForwarder(emit)],
+                        )
+
+                # Identical questions with the same history already in flight share one Bedrock call
+                key = (profile, normalize_question(question), session.chain.memory.history_fingerprint(question))
+                response, shared = self.scheduler.run(session_id, key, call, on_token)
+                with trace.span("validation"):
+                    response_text = guardrail.validate(response["answer"])
+                if shared:
+                    trace.set(coalesced=True)
+                    with session.lock:
+                        session.chain.memory.save_context({"question": question}, {"answer": response["answer"]})
+                else:
+                    with trace.span("cache_write"):
+                        self.cache.set(question, response_text, profile)
+            # Logged with the question so transcripts can be exported per session
+            trace.set(answer=response_text)
+        except Exception as e:
+            trace.set(error=type(e).__name__)
+            raise
+        finally:
+            trace.finish()
+        return {"answer": response_text, "cached": bool(cached_response), "request_id": trace.request_id}
+
+    def regenerate(self, question, profile="support"):
+        """Answer ``question`` afresh, without history, and overwrite its cache entry"""
+        session_id = f"{REFRESH_SESSION}-{uuid.uuid4().hex}"
+        session = self._session(session_id, profile)
+        try:
+            response, _ = self.scheduler.run(
+                REFRESH_SESSION, (profile, normalize_question(question), ""),
+                lambda emit: session.chain({"question": question, "chat_history": []}, callbacks=[TokenForwarder(emit)]),
+                None,
+            )
+        finally:
+            self.reset(session_id)
+        response_text = PROFILES[profile][1].validate(response["answer"])
+        self.cache.set(question, response_text, profile)
+        return response_text
+
+    def reset(self, session_id):
+        """Forget a session's conversation memory"""
+        with self._lock:
+            for key in [key for key in self._sessions if key[0] == session_id]:
+                del self._sessions[key]
+
+    def session_count(self):
+        with self._lock:
+            return len(self._sessions)
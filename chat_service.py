@@ -0,0 +1,116 @@
+"""Local HTTP/JSON chat service shared by the Streamlit front ends.
+
+    python chat_service.py --port 8600
+
+POST /chat           {"session_id", "question", "profile"} -> {"answer", "cached", "request_id"}
+POST /chat/stream    same body; newline-delimited JSON: {"token": ...} events, then the final answer
+DELETE /sessions/ID  forget a session's conversation memory
+GET /health, GET /metrics
+"""
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from chat_engine import PROFILES, ChatEngine
+from tracing import METRICS
+
+_DONE = object()
+
+
+def load_config():
+    with open('config.json', 'r') as f:
+        return json.load(f)
+
+
+async def _read_request(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="request body must be JSON")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="request body must be a JSON object")
+    question = (body.get("question") or "").strip()
+    profile = body.get("profile", "support")
+    if not question or not body.get("session_id"):
+        raise web.HTTPBadRequest(text="session_id and question are required")
+    if profile not in PROFILES:
+        raise web.HTTPBadRequest(text=f"unknown profile {profile!r}")
+    return body["session_id"], question, profile
+
+
+async def chat(request):
+    session_id, question, profile = await _read_request(request)
+    engine = request.app["engine"]
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(request.app["executor"], engine.answer, session_id, question, profile)
+    return web.json_response(result)
+
+
+async def chat_stream(request):
+    session_id, question, profile = await _read_request(request)
+    engine = request.app["engine"]
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def on_token(token):
+        loop.call_soon_threadsafe(queue.put_nowait, {"token": token})
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    future = loop.run_in_executor(request.app["executor"], engine.answer, session_id, question, profile, on_token)
+    future.add_done_callback(lambda _: queue.put_nowait(_DONE))
+    while (event := await queue.get()) is not _DONE:
+        await response.write((json.dumps(event) + "\n").encode())
+    try:
+        result = future.result()
+    except Exception as e:
+        result = {"error": str(e)}
+    await response.write((json.dumps(result) + "\n").encode())
+    await response.write_eof()
+    return response
+
+
+async def reset_session(request):
+    request.app["engine"].reset(request.match_info["session_id"])
+    return web.json_response({"ok": True})
+
+
+async def health(request):
+    return web.json_response({"status": "ok", "sessions": request.app["engine"].session_count()})
+
+
+async def metrics(request):
+    return web.Response(text=METRICS.render(), content_type="text/plain")
+
+
+def create_app(engine, workers=16):
+    app = web.Application()
+    app["engine"] = engine
+    # Chain calls are blocking, so they run on a bounded thread pool off the event loop
+    app["executor"] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat")
+    app.router.add_post("/chat", chat)
+    app.router.add_post("/chat/stream", chat_stream)
+    app.router.add_delete("/sessions/{session_id}", reset_session)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the support chatbot over local HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=16, help="concurrent chain calls")
+    args = parser.parse_args()
+
+    engine = ChatEngine(load_config())
+    # Warm up before accepting requests so the first caller does not pay for it
+    engine.warmup()
+    print("startup: " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in engine.timings.items()))
+    web.run_app(create_app(engine, args.workers), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""Structure-aware chunking and near-duplicate merging for the support corpus.
+
+The PDFs are browser printouts of support pages: a title, headings such as
+"Before You Activate", numbered steps whose lines wrap, and a date/title
+header and URL footer on every page. ``StructureSplitter`` drops the print
+furniture, joins a document's pages and cuts chunks at headings and step
+boundaries, never inside a step. Each chunk starts with its heading, so
+neighbouring chunks need no overlap.
+
+Several documents repeat whole sections (the activation guides share their
+"Before You Activate" steps). ``NearDuplicates`` finds such chunks with
+MinHash signatures over word shingles and LSH banding; ingest embeds and
+stores one canonical copy whose ``sources`` metadata lists every document
+it appears in.
+
+    python create_faiss_index.py                          # structure-aware, near-duplicates merged
+    python create_faiss_index.py --chunking recursive --dedupe-threshold 0
+    python chunking.py report --data-glob "Data/*.pdf"
+"""
+import argparse
+import glob
+import re
+import zlib
+
+import numpy as np
+from langchain_classic.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from history import approximate_tokens
+from lexical_index import BM25Index, tokenize
+
+CHUNKING = ("structure", "recursive")
+PRINT_HEADER = re.compile(r"^\d{1,2}/\d{1,2}/\d{2,4},\s+\d{1,2}:\d{2}\s*[AP]M\b")
+PRINT_FOOTER = re.compile(r"^(https?://\S+)\s+\d+/\d+$")
+STEP = re.compile(r"^(\d{1,2}[.)]|Step\s+\d+[.:]?)\s+")
+HEADING_MAX_LENGTH = 60
+SENTENCE_END = ".?!:"
+
+MERSENNE_PRIME = (1 << 31) - 1
+TITAN_DIMENSIONS = 1536
+
+
+def _is_heading(line, previous, previous_heading):
+    """A short capitalised line that does not continue a wrapped sentence"""
+    if len(line) > HEADING_MAX_LENGTH or STEP.match(line) or not line[0].isupper() or line[-1] in ".,;:":
+        return False
+    return previous is None or previous_heading or previous[-1] in SENTENCE_END
+
+
+class StructureSplitter:
+    """Splits documents at headings and numbered steps into chunks of at most ``chunk_size`` characters.
+
+    Pages of the same source are joined first, so a step broken by a page
+    end stays whole. Wrapped lines are unwrapped; each step or sentence-ended
+    paragraph is one block, and blocks are packed under their heading.
+    Chunks shorter than ``min_chunk_size`` (e.g. a heading with no text)
+    are folded into a neighbour. A single block longer than ``chunk_size``
+    falls back to RecursiveCharacterTextSplitter without overlap.
+    """
+
+    def __init__(self, chunk_size=1000, min_chunk_size=200):
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self._fallback = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
+
+    def _sections(self, pages):
+        """``[(heading, page, [(block, page)])]`` for one source's pages, and the page URL from the print footer"""
+        sections = [(None, None, [])]
+        url = None
+        previous, previous_heading = None, False
+        block, block_page = [], None
+        for page_number, text in pages:
+            for line in text.splitlines():
+                line = line.strip()
+                footer = PRINT_FOOTER.match(line)
+                if footer:
+                    url = url or footer.group(1)
+                    continue
+                if not line or PRINT_HEADER.match(line):
+                    continue
+                heading = _is_heading(line, previous, previous_heading)
+                if block and (heading or STEP.match(line) or previous[-1] in SENTENCE_END):
+                    sections[-1][2].append((" ".join(block), block_page))
+                    block = []
+                if heading:
+                    sections.append((line, page_number, []))
+                else:
+                    if not block:
+                        block_page = page_number
+                    block.append(line)
+                previous, previous_heading = line, heading
+        if block:
+            sections[-1][2].append((" ".join(block), block_page))
+        return sections, url
+
+    def _pack(self, heading, heading_page, blocks):
+        prefix = f"{heading}\n" if heading else ""
+        if not blocks:
+            return [(heading, heading_page)] if heading else []
+        chunks, current, page = [], [], None
+        for text, block_page in blocks:
+            pieces = [text] if len(prefix) + len(text) <= self.chunk_size else self._fallback.split_text(text)
+            for piece in pieces:
+                if current and len(prefix) + len("\n".join(current + [piece])) > self.chunk_size:
+                    chunks.append((prefix + "\n".join(current), page))
+                    current = []
+                if not current:
+                    page = block_page
+                current.append(piece)
+        chunks.append((prefix + "\n".join(current), page))
+        return chunks
+
+    def _merge_small(self, chunks):
+        merged, carry = [], None
+        for text, page in chunks:
+            if carry is not None:
+                if len(carry[0]) + 1 + len(text) <= self.chunk_size:
+                    text, page = f"{carry[0]}\n{text}", carry[1]
+                else:
+                    merged.append(carry)
+                carry = None
+            if merged and min(len(text), len(merged[-1][0])) < self.min_chunk_size \
+                    and len(merged[-1][0]) + 1 + len(text) <= self.chunk_size:
+                merged[-1] = (f"{merged[-1][0]}\n{text}", merged[-1][1])
+            elif len(text) < self.min_chunk_size:
+                carry = (text, page)  # too big to join the previous chunk; try the next one
+            else:
+                merged.append((text, page))
+        if carry is not None:
+            merged.append(carry)
+        return merged
+
+    def split_documents(self, docs):
+        by_source = {}
+        for doc in docs:
+            by_source.setdefault(doc.metadata.get("source"), []).append(doc)
+        chunks = []
+        for pages in by_source.values():
+            sections, url = self._sections([(doc.metadata.get("page", 0), doc.page_content) for doc in pages])
+            packed = self._merge_small([chunk for section in sections for chunk in self._pack(*section)])
+            for text, page in packed:
+                metadata = dict(pages[0].metadata)
+                metadata["page"] = page
+                if url:
+                    metadata["url"] = url
+                chunks.append(Document(page_content=text, metadata=metadata))
+        return chunks
+
+
+class MinHasher:
+    """MinHash signatures over shingles of ``shingle_size`` content words; equal slots estimate Jaccard similarity"""
+
+    def __init__(self, num_perm=128, shingle_size=3, seed=1):
+        rng = np.random.default_rng(seed)
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        words = tokenize(text)
+        size = min(self.shingle_size, len(words)) or 1
+        hashes = np.array(
+            sorted({zlib.crc32(" ".join(words[i:i + size]).encode()) for i in range(max(len(words) - size + 1, 1))}),
+            dtype=np.uint64,
+        ) % MERSENNE_PRIME
+        # a < 2**31 and hashes < 2**31, so the products fit in 64 bits
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+
+class NearDuplicates:
+    """Finds an added text whose estimated Jaccard similarity to a new one is at least ``threshold``.
+
+    Signatures are cut into ``bands``; texts sharing any band are candidates
+    and are confirmed on the full signature. With 32 bands of 4 rows a pair
+    at 0.8 similarity is a candidate with probability > 0.999.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=128, bands=32, hasher=None):
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher(num_perm)
+        self.rows = num_perm // bands
+        self.bands = bands
+        self._buckets = {}
+        self._signatures = {}
+
+    def _band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def add(self, key, text):
+        signature = self.hasher.signature(text)
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, []).append(key)
+
+    def find(self, text):
+        """Key of the most similar added text at or above the threshold, else None"""
+        signature = self.hasher.signature(text)
+        candidates = {key for band_key in self._band_keys(signature) for key in self._buckets.get(band_key, ())}
+        best, best_similarity = None, self.threshold
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = key, similarity
+        return best
+
+
+def add_source(metadata, source):
+    """Record that the chunk described by ``metadata`` also appears in ``source``"""
+    sources = metadata.setdefault("sources", [metadata.get("source")])
+    if source not in sources:
+        sources.append(source)
+
+
+def drop_source(metadata, source):
+    if source in metadata.get("sources", ()):
+        metadata["sources"].remove(source)
+
+
+def deduplicate(chunks, threshold=0.8):
+    """The first chunk of every near-duplicate group, its metadata listing each group member's source"""
+    detector = NearDuplicates(threshold)
+    kept = []
+    for chunk in chunks:
+        match = detector.find(chunk.page_content)
+        if match is None:
+            detector.add(len(kept), chunk.page_content)
+            kept.append(Document(page_content=chunk.page_content, metadata=dict(chunk.metadata)))
+        else:
+            add_source(kept[match].metadata, chunk.metadata.get("source"))
+    return kept
+
+
+def add_chunking_args(parser):
+    parser.add_argument("--chunking", choices=CHUNKING, default="structure",
+                        help="split at headings and steps, or RecursiveCharacterTextSplitter(1000, 200)")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--dedupe-threshold", type=float, default=0.8,
+                        help="MinHash similarity at which chunks are merged (0 keeps every copy)")
+
+
+def make_splitter(chunking="structure", chunk_size=1000):
+    if chunking == "recursive":
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_size // 5)
+    return StructureSplitter(chunk_size)
+
+
+def chunking_from_args(args):
+    """``(splitter, dedupe threshold or None, label)``; the label is kept in the index manifest"""
+    threshold = args.dedupe_threshold or None
+    label = f"{args.chunking}:{args.chunk_size}" + (f":minhash{threshold}" if threshold else "")
+    return make_splitter(args.chunking, args.chunk_size), threshold, label
+
+
+def redundancy(chunks, questions, threshold=0.8, k=5):
+    """Mean number of BM25 top-``k`` chunks per question that near-duplicate a better-ranked one"""
+    if not questions:
+        return 0.0
+    lexical = BM25Index(list(range(len(chunks))), [chunk.page_content for chunk in chunks],
+                        [chunk.metadata for chunk in chunks])
+    repeats = 0
+    for question in questions:
+        detector = NearDuplicates(threshold)
+        for doc_idx, _ in lexical.search(question, k)[0]:
+            if detector.find(chunks[doc_idx].page_content) is not None:
+                repeats += 1
+            detector.add(doc_idx, chunks[doc_idx].page_content)
+    return repeats / len(questions)
+
+
+def run_report(args):
+    from benchmark import load_questions
+    from ingest import load_pdfs
+
+    docs = load_pdfs(sorted(glob.glob(args.data_glob)))
+    questions = load_questions()
+    variants = {
+        "recursive 1000/200": make_splitter("recursive").split_documents(docs),
+        "structure": make_splitter("structure", args.chunk_size).split_documents(docs),
+    }
+    variants["recursive + dedupe"] = deduplicate(variants["recursive 1000/200"], args.threshold)
+    variants["structure + dedupe"] = deduplicate(variants["structure"], args.threshold)
+
+    baseline = variants["recursive 1000/200"]
+    base_tokens = sum(approximate_tokens(chunk.page_content) for chunk in baseline)
+    print(f"{len(docs)} pages, {len(questions)} questions for top-{args.k} redundancy, "
+          f"index size at {TITAN_DIMENSIONS} dims\n")
+    print(f"{'chunking':<20}{'chunks':>8}{'embed calls':>13}{'tokens':>9}{'index KB':>10}{'top-k repeats':>15}")
+    for name in ("recursive 1000/200", "recursive + dedupe", "structure", "structure + dedupe"):
+        chunks = variants[name]
+        tokens = sum(approximate_tokens(chunk.page_content) for chunk in chunks)
+        size = len(chunks) * TITAN_DIMENSIONS * 4 + sum(len(chunk.page_content.encode()) for chunk in chunks)
+        calls = f"{(len(chunks) - len(baseline)) / len(baseline):+.0%}"
+        print(f"{name:<20}{len(chunks):>8}{calls:>13}{tokens - base_tokens:>+9}{size / 1024:>10.0f}"
+              f"{redundancy(chunks, questions, args.threshold, args.k):>15.2f}")
+    print(f"\n(embed calls and tokens relative to recursive 1000/200: {len(baseline)} chunks, {base_tokens} tokens)")
+
+    if args.show_groups:
+        for chunk in variants["structure + dedupe"]:
+            if len(chunk.metadata.get("sources", ())) > 1:
+                print(f"\n{len(chunk.metadata['sources'])} sources: {chunk.page_content[:70]!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chunking strategies on the PDF corpus")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--data-glob", default="Data/*.pdf")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--threshold", type=float, default=0.8, help="MinHash similarity treated as a duplicate")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--show-groups", action="store_true", help="print the chunks shared by several PDFs")
+    run_report(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
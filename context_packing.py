@@ -0,0 +1,145 @@
+import ntpath
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from history import TokenCounter
+from lexical_index import tokenize
+
+MIN_OVERLAP = 40
+MAX_OVERLAP = 400
+
+_counter = TokenCounter()
+
+
+def source_reference(metadata):
+    """URL for web pages and for PDFs printed from one (the footer URL StructureSplitter
+    keeps in ``url``), else the file name (sources are stored with Windows or POSIX paths)"""
+    if metadata.get("url"):
+        return metadata["url"]
+    source = metadata.get("source", "")
+    if source.startswith(("http://", "https://")):
+        return source
+    return ntpath.basename(source) or "unknown source"
+
+
+def overlap_length(head, tail):
+    """Length of the longest suffix of ``head`` that starts ``tail`` (splitter overlap), or 0"""
+    probe = tail[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return 0
+    start = head.find(probe, max(0, len(head) - MAX_OVERLAP))
+    while start != -1:
+        if tail.startswith(head[start:]):
+            return len(head) - start
+        start = head.find(probe, start + 1)
+    return 0
+
+
+def remove_overlap(docs):
+    """Trim text a chunk shares with another chunk of the same source.
+
+    RecursiveCharacterTextSplitter repeats up to ``chunk_overlap`` characters
+    between neighbouring chunks; the repeated text is cut from whichever
+    chunk comes later in ``docs``.
+    """
+    kept = []
+    for doc in docs:
+        text = doc.page_content
+        for other in kept:
+            if other.metadata.get("source") != doc.metadata.get("source"):
+                continue
+            text = text[overlap_length(other.page_content, text):]
+            cut = overlap_length(text, other.page_content)
+            if cut:
+                text = text[:-cut]
+        if text.strip():
+            kept.append(Document(page_content=text.strip(), metadata=doc.metadata))
+    return kept
+
+
+def rerank(query, docs, idf=None):
+    """Order candidates by IDF-weighted query-term coverage blended with their retrieval rank"""
+    terms = set(tokenize(query))
+    idf = idf or {}
+    total = sum(idf.get(term, 1.0) for term in terms)
+    scored = []
+    for rank, doc in enumerate(docs):
+        present = terms.intersection(tokenize(doc.page_content))
+        coverage = sum(idf.get(term, 1.0) for term in present) / total if total else 0.0
+        prior = 1 - rank / len(docs)
+        scored.append((0.6 * coverage + 0.4 * prior, rank, doc))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    for score, _, doc in scored:
+        doc.metadata["rerank_score"] = round(score, 4)
+    return [doc for _, _, doc in scored]
+
+
+def merged_idf(lexical_indexes):
+    """Highest IDF each term has in any of the BM25 indexes"""
+    idf = {}
+    for lexical in lexical_indexes.values():
+        for term, value in lexical.idf.items():
+            idf[term] = max(value, idf.get(term, 0.0))
+    return idf
+
+
+def pack(docs, token_budget, min_tokens=40):
+    """Group the best chunks by source within ``token_budget``.
+
+    Chunks are taken in ranked order; the first that does not fit is cut to
+    the remaining budget when at least ``min_tokens`` are left. Each source
+    becomes one document headed by its reference, ordered by its best chunk.
+    """
+    groups = {}
+    budget = token_budget
+    for doc in docs:
+        reference = source_reference(doc.metadata)
+        header = 0 if reference in groups else _counter.count(f"Source: {reference}\n")
+        cost = header + _counter.count(doc.page_content)
+        text = doc.page_content
+        if cost > budget:
+            if budget - header < min_tokens:
+                break
+            text = _counter.truncate(text, budget - header)
+            cost = budget
+        groups.setdefault(reference, []).append((doc.metadata.get("page", 0), text, doc.metadata))
+        budget -= cost
+
+    packed = []
+    for reference, chunks in groups.items():
+        chunks.sort(key=lambda chunk: chunk[0])
+        metadata = dict(chunks[0][2])
+        metadata.update(reference=reference, chunks=len(chunks))
+        body = "\n".join(text for _, text, _ in chunks)
+        packed.append(Document(page_content=f"Source: {reference}\n{body}", metadata=metadata))
+    return packed
+
+
+class ContextPackingRetriever(BaseRetriever):
+    """Turns retriever candidates into a compact, source-labelled prompt context.
+
+    Fetches candidates from ``base``, re-ranks them locally, strips the text
+    neighbouring chunks repeat and packs the best into ``token_budget``
+    tokens. Every packed document starts with a ``Source:`` line (URL or PDF
+    name) so the answer can cite it.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    base: BaseRetriever
+    token_budget: int = 700
+    idf: dict = {}
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        # The base retriever runs without callbacks so the chain still reports one retrieval
+        candidates = self.base.invoke(query)
+        return pack(remove_overlap(rerank(query, candidates, self.idf)), self.token_budget)
+
+    def retrieve_many(self, queries):
+        """Packed context for each of ``queries``, with the candidates retrieved as one batch"""
+        return [
+            pack(remove_overlap(rerank(query, candidates, self.idf)), self.token_budget)
+            for query, candidates in zip(queries, self.base.retrieve_many(queries))
+        ]
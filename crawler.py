@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from urllib.parse import urldefrag, urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+from bs4 import BeautifulSoup
+from langchain_core.documents import Document
+
+USER_AGENT = "SpectraSupportBot/1.0 (+https://www.spectrum.net/support)"
+# Responses meaning the page no longer exists; any other failure keeps the cached copy
+GONE_STATUSES = (404, 410)
+
+
+def spectrum_mobile_support(url):
+    """Default link filter: Spectrum mobile support pages only"""
+    return 'spectrum.net/support' in url and 'mobile' in url
+
+
+class Page:
+    def __init__(self, url, html, depth, from_cache):
+        self.url = url
+        self.html = html
+        self.depth = depth
+        self.from_cache = from_cache
+
+
+class PageCache:
+    """Fetched pages on disk with the validators needed for conditional GETs"""
+
+    def __init__(self, cache_dir="web_cache"):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url, suffix):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode()).hexdigest() + suffix)
+
+    def load(self, url):
+        meta_path = self._path(url, ".json")
+        if not os.path.exists(meta_path):
+            return None, None
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        with open(self._path(url, ".html"), 'r', encoding='utf-8') as f:
+            return meta, f.read()
+
+    def store(self, url, html, headers):
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+        }
+        with open(self._path(url, ".html"), 'w', encoding='utf-8') as f:
+            f.write(html)
+        with open(self._path(url, ".json"), 'w') as f:
+            json.dump(meta, f)
+
+
+class Crawler:
+    """Breadth-first asyncio crawler with per-host politeness.
+
+    Every host gets at most ``per_host_concurrency`` requests in flight and
+    at least ``delay`` seconds between request starts (or the robots.txt
+    Crawl-delay, if larger). Pages already in the cache are revalidated with
+    If-None-Match / If-Modified-Since so unchanged pages are not downloaded
+    again, and served from the cache when the server fails (429, 5xx,
+    timeouts). URLs known to be gone (404/410 or disallowed by robots.txt)
+    are collected in ``gone``; any other page missing from a crawl may just
+    have been unreachable this time.
+    """
+
+    def __init__(self, max_depth=1, per_host_concurrency=2, delay=1.0, url_filter=spectrum_mobile_support,
+                 cache_dir="web_cache", timeout=20, respect_robots=True, max_pages=500):
+        self.max_depth = max_depth
+        self.per_host_concurrency = per_host_concurrency
+        self.delay = delay
+        self.url_filter = url_filter
+        self.cache = PageCache(cache_dir)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.respect_robots = respect_robots
+        self.max_pages = max_pages
+        self.stats = {"fetched": 0, "not_modified": 0, "from_cache": 0, "errors": 0, "robots_blocked": 0, "gone": 0}
+        self.gone = set()
+        self._hosts = {}
+
+    def _host(self, url):
+        netloc = urlparse(url).netloc
+        if netloc not in self._hosts:
+            self._hosts[netloc] = {
+                "semaphore": asyncio.Semaphore(self.per_host_concurrency),
+                "lock": asyncio.Lock(),
+                "next_request": 0.0,
+                "robots": None,
+                "robots_lock": asyncio.Lock(),
+            }
+        return self._hosts[netloc]
+
+    async def _robots(self, session, url):
+        """The host's robots.txt, fetched once and paced like any other request to the host"""
+        host = self._host(url)
+        async with host["robots_lock"]:
+            if host["robots"] is None:
+                parsed = urlparse(url)
+                robots = RobotFileParser()
+                async with host["semaphore"]:
+                    await self._wait_turn(host, self.delay)
+                    try:
+                        async with session.get(f"{parsed.scheme}://{parsed.netloc}/robots.txt") as response:
+                            lines = (await response.text()).splitlines() if response.status == 200 else []
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        lines = []
+                robots.parse(lines)
+                host["robots"] = robots
+        return host["robots"]
+
+    async def _wait_turn(self, host, delay):
+        async with host["lock"]:
+            now = time.monotonic()
+            wait = host["next_request"] - now
+            host["next_request"] = max(now, host["next_request"]) + delay
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def fetch(self, session, url, depth):
+        delay = self.delay
+        if self.respect_robots:
+            robots = await self._robots(session, url)
+            if not robots.can_fetch(USER_AGENT, url):
+                self.stats["robots_blocked"] += 1
+                self.gone.add(url)
+                return None
+            delay = max(delay, robots.crawl_delay(USER_AGENT) or 0)
+
+        meta, cached_html = self.cache.load(url)
+        headers = {}
+        if meta and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        host = self._host(url)
+        async with host["semaphore"]:
+            await self._wait_turn(host, delay)
+            try:
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 304 and cached_html is not None:
+                        self.stats["not_modified"] += 1
+                        return Page(url, cached_html, depth, from_cache=True)
+                    if response.status in GONE_STATUSES:
+                        self.stats["gone"] += 1
+                        self.gone.add(url)
+                        return None
+                    if response.status != 200 or "html" not in response.headers.get("Content-Type", "text/html"):
+                        print(f"Error crawling {url}: HTTP {response.status} {response.headers.get('Content-Type', '')}")
+                        return self._fallback(url, cached_html, depth)
+                    html = await response.text()
+                    self.cache.store(url, html, response.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Error crawling {url}: {e}")
+                return self._fallback(url, cached_html, depth)
+        self.stats["fetched"] += 1
+        return Page(url, html, depth, from_cache=False)
+
+    def _fallback(self, url, cached_html, depth):
+        """The cached copy of a page that could not be fetched, if there is one"""
+        self.stats["errors"] += 1
+        if cached_html is None:
+            return None
+        self.stats["from_cache"] += 1
+        return Page(url, cached_html, depth, from_cache=True)
+
+    def extract_links(self, page):
+        soup = BeautifulSoup(page.html, 'html.parser')
+        links = []
+        for link in soup.find_all('a', href=True):
+            full_url, _ = urldefrag(urljoin(page.url, link['href']))
+            if full_url.startswith(("http://", "https://")) and self.url_filter(full_url):
+                links.append(full_url)
+        return links
+
+    async def crawl(self, start_urls):
+        pages = []
+        seen = set(start_urls)
+        frontier = list(start_urls)
+        connector = aiohttp.TCPConnector(limit_per_host=self.per_host_concurrency)
+        async with aiohttp.ClientSession(connector=connector, timeout=self.timeout,
+                                         headers={"User-Agent": USER_AGENT}) as session:
+            for depth in range(self.max_depth + 1):
+                results = await asyncio.gather(*(self.fetch(session, url, depth) for url in frontier))
+                frontier = []
+                for page in results:
+                    if page is None:
+                        continue
+                    pages.append(page)
+                    if depth == self.max_depth:
+                        continue
+                    for url in self.extract_links(page):
+                        if url not in seen and len(seen) < self.max_pages:
+                            seen.add(url)
+                            frontier.append(url)
+                if not frontier:
+                    break
+        return pages
+
+
+def page_to_document(page):
+    """Same text and metadata WebBaseLoader would produce for the page"""
+    soup = BeautifulSoup(page.html, 'html.parser')
+    metadata = {"source": page.url}
+    if soup.title and soup.title.string:
+        metadata["title"] = soup.title.string.strip()
+    description = soup.find("meta", attrs={"name": "description"})
+    if description and description.get("content"):
+        metadata["description"] = description["content"]
+    html = soup.find("html")
+    if html and html.get("lang"):
+        metadata["language"] = html["lang"]
+    return Document(page_content=soup.get_text(), metadata=metadata)
+
+
+def crawl(start_urls, **options):
+    """Run a crawl to completion; returns the pages as Documents, the stats and the URLs found to be gone"""
+    crawler = Crawler(**options)
+    pages = asyncio.run(crawler.crawl(start_urls))
+    return [page_to_document(page) for page in pages], crawler.stats, crawler.gone
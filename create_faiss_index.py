@@ -1,59 +1,82 @@
-import os
+import argparse
 import json
 import boto3
 from langchain_aws import BedrockEmbeddings
-from langchain_classic.vectorstores import FAISS
-from langchain_classic.document_loaders import DirectoryLoader, TextLoader
-from langchain_classic.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import UnstructuredURLLoader, TextLoader, PyPDFLoader
-import os, pathlib, textwrap, glob
+import glob
+
+from chunking import add_chunking_args, chunking_from_args
+from embedding_cache import EmbeddingCache
+from index_factory import add_index_args, spec_from_args
+from ingest import Throughput, file_hash, load_pdfs, update_index
+
+MODEL_ID = "amazon.titan-embed-text-v1"
 
 def load_config():
     with open('config.json', 'r') as f:
         return json.load(f)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build faiss_index from the support PDFs")
+    parser.add_argument("--data-glob", default="Data/Phone*.pdf")
+    parser.add_argument("--parse-workers", type=int, default=None, help="PDF parser processes (default: CPU count)")
+    parser.add_argument("--embed-workers", type=int, default=8, help="concurrent embedding threads")
+    parser.add_argument("--batch-size", type=int, default=8, help="chunks per embedding task")
+    parser.add_argument("--rate-limit", type=float, default=None, help="max embedding calls per second")
+    parser.add_argument("--embedding-cache", default="embedding_cache.db")
+    add_chunking_args(parser)
+    add_index_args(parser)
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+
     # Load configuration
     config = load_config()
-    
+
     # Set AWS credentials
     boto3.setup_default_session(
         aws_access_key_id=config["aws_access_key_id"],
         aws_secret_access_key=config["aws_secret_access_key"],
         region_name=config["aws_region"]
     )
-    
+
     # Initialize embeddings
     embeddings = BedrockEmbeddings(
-        model_id="amazon.titan-embed-text-v1",
+        model_id=MODEL_ID,
         region_name=config["aws_region"]
     )
-    
-    pdf_paths = glob.glob("data/phone*.pdf")
-
-    raw_docs = []
-    for path in pdf_paths:
-        raw_docs.extend(PyPDFLoader(path).load())
-
-
-    # Load documents from ./data folder
-    #loader = DirectoryLoader("./data", glob="**/*phone*.pdf")
-    #documents = loader.load()
-    
-    # Split documents into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200
+
+    throughput = Throughput()
+    pdf_paths = sorted(glob.glob(args.data_glob))
+    source_hashes = {path: file_hash(path) for path in pdf_paths}
+
+    # Split documents at headings and steps, merging near-duplicate chunks across documents
+    text_splitter, dedupe_threshold, chunking = chunking_from_args(args)
+
+    # Re-parse and re-embed only PDFs that were added or changed since the last build
+    vectorstore, changed, removed = update_index(
+        "faiss_index",
+        source_hashes,
+        lambda paths: load_pdfs(paths, args.parse_workers, throughput),
+        text_splitter,
+        embeddings,
+        MODEL_ID,
+        EmbeddingCache(args.embedding_cache),
+        args.batch_size,
+        args.embed_workers,
+        args.rate_limit,
+        throughput,
+        index_spec=spec_from_args(args),
+        dedupe_threshold=dedupe_threshold,
+        chunking=chunking,
     )
-    chunks = text_splitter.split_documents(raw_docs)
-    
-    # Create FAISS vector store
-    vectorstore = FAISS.from_documents(chunks, embeddings)
-    
-    # Save to local directory
-    vectorstore.save_local("faiss_index")
-    
-    print(f"Created FAISS index with {len(chunks)} chunks from {len(raw_docs)} documents")
+
+    if not changed and not removed:
+        print(f"FAISS index is up to date with {len(pdf_paths)} documents")
+    else:
+        print(f"Updated FAISS index: {len(changed)} documents re-indexed, {len(removed)} removed, "
+              f"{vectorstore.index.ntotal if vectorstore else 0} chunks total")
+    print(throughput.report())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,43 +1,41 @@
-import os
+import argparse
 import json
 import boto3
 from langchain_aws import BedrockEmbeddings
-from langchain_classic.vectorstores import FAISS
-from langchain_classic.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import WebBaseLoader
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+
+from crawler import crawl, spectrum_mobile_support
+from chunking import add_chunking_args, chunking_from_args
+from embedding_cache import EmbeddingCache, text_hash
+from index_factory import add_index_args, spec_from_args
+from ingest import Throughput, load_manifest, update_index
+
+MODEL_ID = "amazon.titan-embed-text-v1"
+BASE_URL = "https://www.spectrum.net/support/mobile/transferring-your-spectrum-mobile-service-another-iphone"
 
 def load_config():
     with open('config.json', 'r') as f:
         return json.load(f)
 
-def get_all_links(base_url):
-    """Crawl the base URL and extract all relevant support links"""
-    try:
-        response = requests.get(base_url)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        links = set()
-        links.add(base_url)  # Include the main page
-        
-        # Find all links on the page
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            full_url = urljoin(base_url, href)
-            
-            # Only include Spectrum support mobile links
-            if 'spectrum.net/support' in full_url and 'mobile' in full_url:
-                links.add(full_url)
-                print(f"Link: {full_url}")
-        
-        return list(links)
-    except Exception as e:
-        print(f"Error crawling {base_url}: {e}")
-        return [base_url]
+def parse_args():
+    parser = argparse.ArgumentParser(description="Crawl Spectrum mobile support pages into faiss_webindex")
+    parser.add_argument("--start-url", action="append", default=None,
+                        help="page to start from (repeatable)")
+    parser.add_argument("--url-contains", action="append", default=None,
+                        help="only follow links containing every given substring (default: spectrum.net/support and mobile)")
+    parser.add_argument("--depth", type=int, default=1, help="link hops to follow from the start pages")
+    parser.add_argument("--per-host", type=int, default=2, help="concurrent requests per host")
+    parser.add_argument("--delay", type=float, default=1.0, help="seconds between requests to the same host")
+    parser.add_argument("--cache-dir", default="web_cache")
+    parser.add_argument("--ignore-robots", action="store_true")
+    parser.add_argument("--prune-unreached", action="store_true",
+                        help="also drop indexed pages this crawl did not reach (default: only pages that are gone)")
+    add_chunking_args(parser)
+    add_index_args(parser)
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    
     # Load configuration
     config = load_config()
     
@@ -50,34 +48,64 @@ def main():
     
     # Initialize embeddings
     embeddings = BedrockEmbeddings(
-        model_id="amazon.titan-embed-text-v1",
+        model_id=MODEL_ID,
         region_name=config["aws_region"]
     )
     
-    # Get all URLs to crawl
-    base_url = "https://www.spectrum.net/support/mobile/transferring-your-spectrum-mobile-service-another-iphone"
-    urls = get_all_links(base_url)
+    # Crawl the support pages, revalidating cached copies instead of re-downloading them
+    start_urls = args.start_url or [BASE_URL]
+    url_filter = spectrum_mobile_support
+    if args.url_contains:
+        url_filter = lambda url: all(part in url for part in args.url_contains)
+    raw_docs, stats, gone = crawl(
+        start_urls,
+        max_depth=args.depth,
+        per_host_concurrency=args.per_host,
+        delay=args.delay,
+        url_filter=url_filter,
+        cache_dir=args.cache_dir,
+        respect_robots=not args.ignore_robots,
+    )
     
-    print(f"Found {len(urls)} URLs to process")
+    print(f"Crawled {len(raw_docs)} pages: {stats['fetched']} downloaded, {stats['not_modified']} not modified, "
+          f"{stats['from_cache']} served from cache after {stats['errors']} errors, "
+          f"{stats['gone']} gone, {stats['robots_blocked']} blocked by robots.txt")
     
-    # Load web documents
-    loader = WebBaseLoader(urls)
-    raw_docs = loader.load()
+    docs_by_url = {doc.metadata["source"]: doc for doc in raw_docs}
+    source_hashes = {url: text_hash(doc.page_content) for url, doc in docs_by_url.items()}
     
-    # Split documents into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200
-    )
-    chunks = text_splitter.split_documents(raw_docs)
+    # Pages that failed without a cached copy, or sat behind one, stay indexed until they are known to be gone
+    indexed = (load_manifest("faiss_webindex") or {}).get("sources", {})
+    unreached = [] if args.prune_unreached else [url for url in indexed if url not in docs_by_url and url not in gone]
+    if unreached:
+        print(f"Keeping {len(unreached)} indexed pages this crawl did not reach")
     
-    # Create FAISS vector store
-    vectorstore = FAISS.from_documents(chunks, embeddings)
+    # Split documents at headings and steps, merging near-duplicate chunks across documents
+    text_splitter, dedupe_threshold, chunking = chunking_from_args(args)
     
-    # Save to local directory
-    vectorstore.save_local("faiss_webindex")
+    # Re-embed only pages whose text changed since the last build
+    throughput = Throughput()
+    vectorstore, changed, removed = update_index(
+        "faiss_webindex",
+        source_hashes,
+        lambda keys: [docs_by_url[url] for url in keys],
+        text_splitter,
+        embeddings,
+        MODEL_ID,
+        EmbeddingCache(),
+        throughput=throughput,
+        index_spec=spec_from_args(args),
+        dedupe_threshold=dedupe_threshold,
+        chunking=chunking,
+        keep=unreached,
+    )
     
-    print(f"Created FAISS web index with {len(chunks)} chunks from {len(raw_docs)} documents")
+    if not changed and not removed:
+        print(f"FAISS web index is up to date with {len(source_hashes)} pages")
+    else:
+        print(f"Updated FAISS web index: {len(changed)} pages re-indexed, {len(removed)} removed, "
+              f"{vectorstore.index.ntotal if vectorstore else 0} chunks total")
+    print(throughput.report())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
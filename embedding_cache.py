@@ -0,0 +1,54 @@
+import hashlib
+import sqlite3
+
+import numpy as np
+
+DEFAULT_DB_PATH = "embedding_cache.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model_id TEXT NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (model_id, chunk_hash)
+);
+"""
+
+# SQLite caps the number of bound parameters per statement
+LOOKUP_BATCH = 500
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk chunk embeddings keyed by (model_id, sha256 of the chunk text)"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self._conn = sqlite3.connect(db_path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def get_many(self, model_id, hashes):
+        found = {}
+        unique = list(set(hashes))
+        for i in range(0, len(unique), LOOKUP_BATCH):
+            batch = unique[i:i + LOOKUP_BATCH]
+            rows = self._conn.execute(
+                f"SELECT chunk_hash, vector FROM embeddings WHERE model_id = ? AND chunk_hash IN ({','.join('?' * len(batch))})",
+                [model_id, *batch],
+            )
+            for chunk_hash, vector in rows:
+                found[chunk_hash] = np.frombuffer(vector, dtype="float32").tolist()
+        return found
+
+    def put_many(self, model_id, items):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model_id, chunk_hash, vector) VALUES (?, ?, ?)",
+                [(model_id, chunk_hash, np.asarray(vector, dtype="float32").tobytes()) for chunk_hash, vector in items],
+            )
+
+    def close(self):
+        self._conn.close()
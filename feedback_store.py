@@ -0,0 +1,283 @@
+"""Append-only feedback log shared by both apps, and the analytics job over it.
+
+Thumbs clicks are queued and inserted by a background thread into
+``feedback.db`` (SQLite in WAL mode, so both apps append concurrently).
+The report joins feedback to the request log to learn which sources each
+rated answer was built from, then ranks question clusters and source
+documents by how often they are disliked.
+
+    python feedback_store.py migrate            # import the legacy feedback.json
+    python feedback_store.py report --top 15
+"""
+import argparse
+import atexit
+import json
+import math
+import ntpath
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime
+
+from lexical_index import tokenize
+from tracing import METRICS, TRACE_LOG
+
+DEFAULT_DB_PATH = "feedback.db"
+LEGACY_JSON_PATH = "feedback.json"
+RATINGS = ("like", "dislike")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp REAL NOT NULL,
+    app TEXT,
+    session_id TEXT,
+    request_id TEXT,
+    question TEXT NOT NULL,
+    response TEXT NOT NULL,
+    feedback TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_feedback_timestamp ON feedback(timestamp);
+"""
+INSERT = ("INSERT INTO feedback (timestamp, app, session_id, request_id, question, response, feedback) "
+          "VALUES (?, ?, ?, ?, ?, ?, ?)")
+
+
+class FeedbackStore:
+    """Feedback rows appended to SQLite by a writer thread; ``record`` never blocks the UI.
+
+    Whatever is queued when the writer wakes is inserted in one transaction.
+    ``flush`` waits for the queue to drain; ``close`` (also run at exit)
+    stops the writer after it has written everything queued.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._queue = queue.Queue()
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+        self._writer = threading.Thread(target=self._write_loop, name="feedback-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(self, question, response, feedback, app=None, session_id=None, request_id=None, timestamp=None):
+        if feedback not in RATINGS:
+            raise ValueError(f"feedback must be one of {RATINGS}, got {feedback!r}")
+        self._queue.put((timestamp or time.time(), app, session_id, request_id, question, response, feedback))
+        METRICS.inc("chatbot_feedback_total", help="Thumbs up/down clicks", app=app or "unknown", feedback=feedback)
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [item for item in batch if item is not None]
+            if rows:
+                try:
+                    with conn:
+                        conn.execute("BEGIN")
+                        conn.executemany(INSERT, rows)
+                except sqlite3.Error as e:
+                    print(f"[feedback] dropped {len(rows)} rows: {e}", file=sys.stderr)
+            for _ in batch:
+                self._queue.task_done()
+            if len(rows) < len(batch):
+                conn.close()
+                return
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=10)
+
+    def rows(self, since=None):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute(
+                "SELECT * FROM feedback WHERE timestamp >= ? ORDER BY id", (since or 0,)
+            )]
+        finally:
+            conn.close()
+
+
+def feedback_after(db_path, after_id):
+    """``(id, response, feedback)`` rows appended after ``after_id``, oldest first"""
+    if not os.path.exists(db_path):
+        return []
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        return conn.execute(
+            "SELECT id, response, feedback FROM feedback WHERE id > ? ORDER BY id", (after_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def migrate_json_feedback(store, json_path=LEGACY_JSON_PATH):
+    """Append every record of the legacy whole-file ``feedback.json``"""
+    with open(json_path, 'r') as f:
+        legacy = json.load(f)
+    for item in legacy:
+        store.record(item["question"], item["response"], item["feedback"], app="legacy",
+                     timestamp=datetime.fromisoformat(item["timestamp"]).timestamp())
+    store.flush()
+    return len(legacy)
+
+
+def open_feedback_store(config=None, json_path=LEGACY_JSON_PATH):
+    """Open the shared feedback log, importing ``feedback.json`` on first use"""
+    db_path = (config or {}).get("feedback_db", DEFAULT_DB_PATH)
+    first_run = not os.path.exists(db_path)
+    store = FeedbackStore(db_path)
+    if first_run and os.path.exists(json_path):
+        migrate_json_feedback(store, json_path)
+    return store
+
+
+def _question_key(question):
+    return " ".join(sorted(set(tokenize(question))))
+
+
+def _source_name(source):
+    return source if source.startswith(("http://", "https://")) else ntpath.basename(source)
+
+
+def load_sources(log_path=TRACE_LOG):
+    """Retrieved sources per request id, and the latest per question for cached or legacy answers"""
+    by_request, by_question = {}, {}
+    if not os.path.exists(log_path):
+        return by_request, by_question
+    with open(log_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("sources"):
+                sources = [_source_name(source) for source in record["sources"]]
+                by_request[record["request_id"]] = sources
+                by_question[_question_key(record["question"])] = sources
+    return by_request, by_question
+
+
+def cluster_questions(questions, threshold=0.5):
+    """Greedy clustering by token-set Jaccard similarity, most frequent questions first.
+
+    Returns ``{question: cluster label}``; the label is the cluster's most
+    frequent question.
+    """
+    counts = Counter(questions)
+    clusters = []  # (label, token set)
+    labels = {}
+    for question, _ in counts.most_common():
+        terms = set(tokenize(question))
+        for label, members in clusters:
+            union = terms | members
+            if union and len(terms & members) / len(union) >= threshold:
+                labels[question] = label
+                break
+        else:
+            clusters.append((question, terms))
+            labels[question] = question
+    return labels
+
+
+def wilson_lower_bound(bad, total, z=1.96):
+    """Lower end of the 95% interval for the dislike rate, so one stray click does not top the list"""
+    if total == 0:
+        return 0.0
+    p = bad / total
+    centre = p + z * z / (2 * total)
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total))
+    return (centre - margin) / (1 + z * z / total)
+
+
+def _tally(groups):
+    table = []
+    for name, ratings in groups.items():
+        likes, dislikes = ratings.count("like"), ratings.count("dislike")
+        total = likes + dislikes
+        table.append({
+            "name": name, "total": total, "likes": likes, "dislikes": dislikes,
+            "dislike_rate": dislikes / total, "score": wilson_lower_bound(dislikes, total),
+        })
+    return sorted(table, key=lambda row: (row["score"], row["dislikes"]), reverse=True)
+
+
+def analyze(rows, log_path=TRACE_LOG, threshold=0.5):
+    """Like/dislike tallies per question cluster and per retrieved source document"""
+    labels = cluster_questions([row["question"] for row in rows], threshold)
+    by_request, by_question = load_sources(log_path)
+    clusters, sources = {}, {}
+    unattributed = 0
+    for row in rows:
+        clusters.setdefault(labels[row["question"]], []).append(row["feedback"])
+        used = by_request.get(row["request_id"]) or by_question.get(_question_key(row["question"]))
+        if not used:
+            unattributed += 1
+        for source in used or ():
+            sources.setdefault(source, []).append(row["feedback"])
+    return {
+        "ratings": len(rows),
+        "unattributed": unattributed,
+        "clusters": _tally(clusters),
+        "sources": _tally(sources),
+    }
+
+
+def print_report(report, top):
+    print(f"{report['ratings']} ratings, {report['unattributed']} without known sources")
+    for title, key in (("question clusters", "clusters"), ("source documents", "sources")):
+        print(f"\n{title}, worst first\ntotal  likes  dislikes  dislike%  score  name")
+        for row in report[key][:top]:
+            print(f"{row['total']:>5}{row['likes']:>7}{row['dislikes']:>10}{row['dislike_rate'] * 100:>10.0f}"
+                  f"{row['score']:>7.2f}  {row['name'][:80]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feedback log and analytics")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="append the legacy feedback.json records")
+    migrate.add_argument("--json", default=LEGACY_JSON_PATH)
+    report = sub.add_parser("report", help="like/dislike rates per question cluster and source document")
+    report.add_argument("--log", default=TRACE_LOG)
+    report.add_argument("--since", type=date.fromisoformat, default=None, help="only feedback from this day on")
+    report.add_argument("--threshold", type=float, default=0.5, help="Jaccard similarity to join a cluster")
+    report.add_argument("--top", type=int, default=10)
+    report.add_argument("--output", help="also write the full report as JSON")
+    for command in (migrate, report):
+        command.add_argument("--db", default=DEFAULT_DB_PATH)
+    args = parser.parse_args()
+
+    store = FeedbackStore(args.db)
+    if args.command == "migrate":
+        print(f"Appended {migrate_json_feedback(store, args.json)} records from {args.json} to {args.db}")
+        return
+    since = datetime.combine(args.since, datetime.min.time()).timestamp() if args.since else None
+    result = analyze(store.rows(since), args.log, args.threshold)
+    print_report(result, args.top)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
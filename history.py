@@ -0,0 +1,235 @@
+import hashlib
+import math
+import re
+import threading
+import warnings
+from functools import lru_cache
+from typing import Any
+
+from langchain_classic.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import SystemMessage
+from pydantic import PrivateAttr
+
+from lexical_index import tokenize
+from tracing import METRICS
+
+# Words that point back at earlier turns; a question containing one needs condensing
+FOLLOW_UP_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "there",
+    "he", "she", "one", "ones", "same", "else", "also", "too", "again", "another",
+    "above", "previous", "earlier", "former", "latter",
+}
+FOLLOW_UP_OPENERS = ("and ", "but ", "or ", "so ", "what about", "how about", "why not", "then ")
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+SUMMARY_PROMPT = """Update the running summary of a customer support conversation with the new turns.
+Keep only what is needed to understand follow-up questions: products, devices, plans and issues discussed.
+Answer with the summary only, at most {words} words.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}
+
+Updated summary:"""
+
+_WORD = re.compile(r"\w+|[^\w\s]")
+
+
+def approximate_tokens(text):
+    """BPE-style estimate: one token per short word or symbol, about four characters per token otherwise"""
+    return sum(math.ceil(len(piece) / 4) for piece in _WORD.findall(text))
+
+
+def _has_own_tokenizer(llm):
+    """True when ``llm.get_num_tokens`` uses the model's tokenizer rather than LangChain's GPT-2 default"""
+    try:
+        from langchain_aws.utils import anthropic_tokens_supported
+
+        return llm._get_provider() == "anthropic" and not llm.custom_get_token_ids and anthropic_tokens_supported()
+    except Exception:
+        return False
+
+
+class TokenCounter:
+    """Counts tokens with the model's own tokenizer when one is available locally.
+
+    ChatBedrock only has a local tokenizer for Anthropic models with an older
+    ``anthropic`` package installed. For any other model ``get_num_tokens``
+    would count with GPT-2's tokenizer (downloading it if needed), so the
+    count falls back to ``approximate_tokens`` instead.
+    """
+
+    def __init__(self, llm=None):
+        self._count = approximate_tokens
+        if llm is not None and _has_own_tokenizer(llm):
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    llm.get_num_tokens("token probe")
+                self._count = llm.get_num_tokens
+            except Exception:
+                pass
+        self.count = lru_cache(maxsize=4096)(self._count)
+
+    def count_messages(self, messages):
+        # A few tokens of role framing per message, as in the chat prompt formats
+        return sum(self.count(message.content) + 4 for message in messages)
+
+    def truncate(self, text, max_tokens):
+        """Trim ``text`` to at most ``max_tokens``, ellipsis included, cutting at a word boundary"""
+        if self.count(text) <= max_tokens:
+            return text
+        words = text.split()
+        low, high = 0, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count(" ".join(words[:middle]) + " ...") <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return " ".join(words[:low]) + " ..."
+
+
+def is_self_contained(question, min_terms=2):
+    """True when the question can be answered without the conversation so far.
+
+    It must not lean on the previous turn (pronouns like "it"/"that", openers
+    like "what about") and must carry at least ``min_terms`` content words.
+    """
+    lowered = " ".join(question.lower().split())
+    if lowered.startswith(FOLLOW_UP_OPENERS):
+        return False
+    if FOLLOW_UP_WORDS.intersection(re.findall(r"[a-z']+", lowered)):
+        return False
+    return len(tokenize(question)) >= min_terms
+
+
+class TokenBudgetMemory(BaseChatMemory):
+    """Conversation memory for the question-condensing prompt with a hard token budget.
+
+    The newest turns are kept verbatim (at most ``window_turns``); older turns
+    are folded into a rolling summary that is refreshed in a background
+    thread, so a response never waits for it. Without a ``summarizer`` LLM the
+    summary is extractive: the customer's earlier questions, newest kept
+    first. Summary plus window never exceed ``max_tokens``.
+
+    With ``skip_condense`` on, a self-contained question loads an empty
+    history, which makes ConversationalRetrievalChain skip the condensing LLM
+    call altogether.
+    """
+
+    memory_key: str = "chat_history"
+    return_messages: bool = True
+    max_tokens: int = 600
+    window_turns: int = 3
+    message_tokens: int = 200
+    summary_tokens: int = 150
+    skip_condense: bool = True
+    summary: str = ""
+    summarizer: Any = None
+    token_llm: Any = None
+
+    _counter: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _pending: list = PrivateAttr(default_factory=list)
+    _summarizing: bool = PrivateAttr(default=False)
+
+    @property
+    def counter(self):
+        if self._counter is None:
+            self._counter = TokenCounter(self.token_llm)
+        return self._counter
+
+    @property
+    def memory_variables(self):
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs):
+        question = (inputs or {}).get("question", "")
+        if self.skip_condense and question and is_self_contained(question):
+            METRICS.inc("chatbot_condense_skipped_total", help="Follow-up condensing skipped for self-contained questions")
+            return {self.memory_key: []}
+        return {self.memory_key: self.window()}
+
+    def history_fingerprint(self, question):
+        """Hash of the history ``question`` would be condensed with; "" when it is answered without one"""
+        if self.skip_condense and question and is_self_contained(question):
+            return ""
+        messages = self.window()
+        if not messages:
+            return ""
+        return hashlib.sha1("\n".join(f"{message.type}: {message.content}" for message in messages).encode()).hexdigest()
+
+    def window(self):
+        """Summary message plus the newest turns that fit the token budget"""
+        with self._lock:
+            messages = list(self.chat_memory.messages)
+            summary = self.summary
+        budget = self.max_tokens
+        prefix = []
+        if summary:
+            prefix = [SystemMessage(content=SUMMARY_PREFIX + summary)]
+            budget -= self.counter.count_messages(prefix)
+        kept = []
+        for message in reversed(messages):
+            # Long answers are cut to what is left of the budget rather than dropped
+            limit = min(self.message_tokens, budget - 8)
+            if limit < 8:
+                break
+            text = self.counter.truncate(message.content, limit)
+            trimmed = message.model_copy(update={"content": text}) if text != message.content else message
+            cost = self.counter.count_messages([trimmed])
+            if cost > budget:
+                break
+            kept.append(trimmed)
+            budget -= cost
+        return prefix + kept[::-1]
+
+    def save_context(self, inputs, outputs):
+        super().save_context(inputs, outputs)
+        with self._lock:
+            messages = self.chat_memory.messages
+            overflow = len(messages) - 2 * self.window_turns
+            if overflow <= 0:
+                return
+            self._pending.extend(messages[:overflow])
+            del messages[:overflow]
+            if self._summarizing:
+                return
+            self._summarizing = True
+        threading.Thread(target=self._summarize_pending, daemon=True).start()
+
+    def _summarize_pending(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._summarizing = False
+                    return
+                pending, self._pending = self._pending, []
+                summary = self.summary
+            try:
+                summary = self._summarize(summary, pending)
+            except Exception:
+                # Keep the previous summary; the turns were already dropped from the window
+                METRICS.inc("chatbot_history_summary_errors_total", help="Failed rolling summary updates")
+                continue
+            with self._lock:
+                self.summary = summary
+
+    def _summarize(self, summary, messages):
+        if self.summarizer is None:
+            questions = [m.content for m in messages if m.type == "human"]
+            merged = "; ".join(questions[::-1] + ([summary] if summary else []))
+            return self.counter.truncate(merged, self.summary_tokens)
+        turns = "\n".join(f"{'Human' if m.type == 'human' else 'Assistant'}: {m.content}" for m in messages)
+        prompt = SUMMARY_PROMPT.format(words=int(self.summary_tokens * 0.7), summary=summary or "(none)", turns=turns)
+        reply = self.summarizer.invoke(prompt)
+        return self.counter.truncate(getattr(reply, "content", reply).strip(), self.summary_tokens)
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self.summary = ""
+            self._pending = []
@@ -0,0 +1,313 @@
+"""Approximate nearest-neighbour (ANN) index types for the FAISS stores.
+
+``index.faiss`` stays an exact flat index: ingest publishes a new
+generation of it on every update and it is the recall baseline. Building with an ``--index-type`` other than
+flat also writes an ANN copy, trained on a sample of the flat vectors,
+to ``index.ann.faiss`` with its spec in ``ann.json``. The apps search that
+copy, with ``efSearch``/``nprobe`` taken from ``index_search_params`` in
+config.json, as long as ``ann.json`` names the flat index generation it was
+built from.
+
+    python create_faiss_index.py --index-type hnsw --storage fp16
+    python index_factory.py bench --vectors 10000 100000 1000000 --dim 256
+"""
+import argparse
+import json
+import math
+import os
+import time
+import warnings
+
+import faiss
+import numpy as np
+
+from mmap_index import current_generation, index_path
+
+ANN_INDEX_FILE = "index.ann.faiss"
+ANN_SPEC_FILE = "ann.json"
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+# Vector storage for flat, HNSW and IVF lists; IVF-PQ always stores PQ codes
+STORAGE = {"fp32": "Flat", "fp16": "SQfp16", "int8": "SQ8"}
+# Optional re-ranking of IVF-PQ candidates against a finer copy of the vectors
+REFINE = {"fp32": "RFlat", "fp16": "Refine(SQfp16)", "int8": "Refine(SQ8)"}
+# Below this many vectors exact search is as fast as any ANN structure and IVF/PQ cannot train
+MIN_ANN_VECTORS = 2000
+ADD_BATCH = 50000
+SEARCH_PARAMS = ("efSearch", "nprobe", "k_factor")
+
+
+def default_nlist(count):
+    """IVF lists: about 4 * sqrt(n), with at least 39 training points per list"""
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+
+def default_pq_m(dim):
+    """PQ sub-quantizers: the largest even divisor of ``dim`` giving at least 4 dimensions each, or None"""
+    return max((m for m in range(2, dim // 4 + 1, 2) if dim % m == 0), default=None)
+
+
+def factory_string(spec, dim, count):
+    """The ``faiss.index_factory`` description for ``spec`` at ``count`` vectors"""
+    index_type, storage = spec.get("type", "flat"), STORAGE[spec.get("storage", "fp32")]
+    if index_type == "flat":
+        return storage
+    if index_type == "hnsw":
+        m = spec.get("hnsw_m", 32)
+        return f"HNSW{m}" if storage == "Flat" else f"HNSW{m},{storage}"
+    nlist = spec.get("nlist") or default_nlist(count)
+    if index_type == "ivf":
+        return f"IVF{nlist},{storage}"
+    if index_type == "ivfpq":
+        # 4-bit fast-scan codes: SIMD distance tables, and training is seconds rather than minutes
+        refine = f",{REFINE[spec['refine']]}" if spec.get("refine") else ""
+        return f"IVF{nlist},PQ{spec.get('pq_m') or default_pq_m(dim)}x4fs{refine}"
+    raise ValueError(f"unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+
+def effective_spec(spec, count, dim):
+    """``spec``, or its flat equivalent when there are too few vectors for an ANN structure
+    or no PQ sub-quantizer count divides ``dim``"""
+    if spec.get("type", "flat") != "flat" and count < MIN_ANN_VECTORS:
+        return {**spec, "type": "flat"}
+    if spec.get("type") == "ivfpq":
+        pq_m = spec.get("pq_m") or default_pq_m(dim)
+        if pq_m is None or dim % pq_m:
+            warnings.warn(f"IVF-PQ needs a sub-quantizer count dividing dimension {dim}; building a flat index instead")
+            return {**spec, "type": "flat"}
+    return spec
+
+
+def build_index(vectors, spec, seed=0):
+    """Train (on at most ``train_size`` sampled vectors) and fill an index of type ``spec``"""
+    count, dim = vectors.shape
+    spec = effective_spec(spec, count, dim)
+    index = faiss.index_factory(dim, factory_string(spec, dim, count), faiss.METRIC_L2)
+    if spec.get("type") == "hnsw":
+        index.hnsw.efConstruction = spec.get("ef_construction", 80)
+    if not index.is_trained:
+        sample_size = min(count, spec.get("train_size", 100000))
+        sample = np.sort(np.random.default_rng(seed).choice(count, sample_size, replace=False))
+        index.train(np.ascontiguousarray(vectors[sample]))
+    for start in range(0, count, ADD_BATCH):
+        index.add(np.ascontiguousarray(vectors[start:start + ADD_BATCH]))
+    return index
+
+
+def set_search_params(index, params):
+    """Apply the query-time parameters (``SEARCH_PARAMS``) that fit this index type; others are ignored"""
+    params = params or {}
+    base = index
+    if isinstance(index, faiss.IndexRefine):
+        # k_factor: candidates fetched from the base index per result, then re-ranked
+        if "k_factor" in params:
+            index.k_factor = params["k_factor"]
+        base = faiss.downcast_index(index.base_index)
+    space = faiss.ParameterSpace()
+    if "efSearch" in params and "HNSW" in type(base).__name__:
+        space.set_index_parameter(index, "efSearch", params["efSearch"])
+    if "nprobe" in params and hasattr(base, "nprobe"):
+        space.set_index_parameter(index, "nprobe", params["nprobe"])
+    return index
+
+
+def read_ann_spec(index_dir):
+    path = os.path.join(index_dir, ANN_SPEC_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def remove_ann_index(index_dir):
+    for name in (ANN_INDEX_FILE, ANN_SPEC_FILE):
+        path = os.path.join(index_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def flat_fingerprint(index_dir):
+    """Identifies the flat index an ANN copy is built from: its published generation,
+    or the size and mtime of ``index.faiss`` in directories from before generations"""
+    generation = current_generation(index_dir)
+    if generation is not None:
+        return generation
+    stat = os.stat(index_path(index_dir))
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def write_ann_index(index_dir, spec, flat_index=None):
+    """Build the ANN copy of ``index_dir``'s flat index; a plain fp32 flat spec removes it.
+
+    ``flat_index`` must be the index currently published in ``index_dir``.
+    """
+    if spec.get("type", "flat") == "flat" and spec.get("storage", "fp32") == "fp32":
+        remove_ann_index(index_dir)
+        return None
+    source = flat_fingerprint(index_dir)
+    if flat_index is None:
+        flat_index = faiss.read_index(index_path(index_dir), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+    started = time.perf_counter()
+    effective = effective_spec(spec, *vectors.shape)
+    index = build_index(vectors, effective)
+    built = {
+        "spec": spec,
+        "factory": factory_string(effective, index.d, index.ntotal),
+        "ntotal": index.ntotal,
+        "source": source,
+        "build_seconds": round(time.perf_counter() - started, 2),
+    }
+    path = os.path.join(index_dir, ANN_INDEX_FILE)
+    faiss.write_index(index, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+    spec_path = os.path.join(index_dir, ANN_SPEC_FILE)
+    with open(f"{spec_path}.tmp", 'w') as f:
+        json.dump(built, f, indent=2)
+    os.replace(f"{spec_path}.tmp", spec_path)
+    return built
+
+
+def refresh_ann_index(index_dir, spec=None, flat_index=None):
+    """Rebuild the ANN copy after the flat index changed, or for a new ``spec``.
+
+    ``spec=None`` keeps whatever spec the directory was last built with.
+    """
+    built = read_ann_spec(index_dir)
+    spec = spec or (built or {}).get("spec")
+    if spec is None:
+        return None
+    return write_ann_index(index_dir, spec, flat_index)
+
+
+def load_ann_index(index_dir, expected_ntotal, source, mmap=True):
+    """The ANN copy if it was built from the flat index ``source`` (a ``flat_fingerprint``), else None"""
+    built = read_ann_spec(index_dir)
+    path = os.path.join(index_dir, ANN_INDEX_FILE)
+    if built is None or not os.path.exists(path):
+        return None
+    if built.get("source") != source or built["ntotal"] != expected_ntotal:
+        print(f"{path} is out of date (built from {built.get('source')} with {built['ntotal']} vectors, "
+              f"flat index is {source} with {expected_ntotal}); using the flat index")
+        return None
+    if mmap:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass  # not every index type can be mapped
+    return faiss.read_index(path)
+
+
+def add_index_args(parser):
+    """Index type options shared by the index builders"""
+    group = parser.add_argument_group("index type")
+    group.add_argument("--index-type", choices=INDEX_TYPES, default=None,
+                       help="also build an ANN copy of this type (default: keep the current one)")
+    group.add_argument("--storage", choices=sorted(STORAGE), default="fp32", help="vector storage for flat/hnsw/ivf")
+    group.add_argument("--hnsw-m", type=int, default=32, help="HNSW graph degree")
+    group.add_argument("--ef-construction", type=int, default=80)
+    group.add_argument("--nlist", type=int, default=None, help="IVF lists (default: ~4*sqrt(n))")
+    group.add_argument("--pq-m", type=int, default=None, help="PQ sub-quantizers (default: about dim/4)")
+    group.add_argument("--refine", choices=sorted(REFINE), default=None,
+                       help="re-rank IVF-PQ candidates against vectors stored at this precision")
+    group.add_argument("--train-size", type=int, default=100000, help="vectors sampled to train IVF/PQ/SQ")
+    return group
+
+
+def spec_from_args(args):
+    if args.index_type is None:
+        return None
+    return {
+        "type": args.index_type, "storage": args.storage, "hnsw_m": args.hnsw_m,
+        "ef_construction": args.ef_construction, "nlist": args.nlist, "pq_m": args.pq_m,
+        "refine": args.refine, "train_size": args.train_size,
+    }
+
+
+def synthetic_vectors(count, dim, seed, latent=48, topics=100):
+    """Unit vectors with embedding-like structure: topic clusters in a low-dimensional
+    latent space, projected to ``dim`` and blurred with isotropic noise"""
+    rng = np.random.default_rng(seed)
+    projection = np.random.default_rng(7).standard_normal((latent, dim), dtype="float32")
+    centres = 2 * np.random.default_rng(9).standard_normal((topics, latent), dtype="float32")
+    vectors = np.empty((count, dim), dtype="float32")
+    for start in range(0, count, ADD_BATCH):
+        size = min(ADD_BATCH, count - start)
+        points = centres[rng.integers(topics, size=size)] + rng.standard_normal((size, latent), dtype="float32")
+        block = points @ projection + 0.5 * rng.standard_normal((size, dim), dtype="float32")
+        vectors[start:start + size] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return vectors
+
+
+BENCH_CONFIGS = [
+    ("flat fp32", {"type": "flat"}, [{}]),
+    ("flat fp16", {"type": "flat", "storage": "fp16"}, [{}]),
+    ("flat int8", {"type": "flat", "storage": "int8"}, [{}]),
+    ("hnsw32 fp32", {"type": "hnsw"}, [{"efSearch": 16}, {"efSearch": 64}, {"efSearch": 256}]),
+    ("hnsw32 fp16", {"type": "hnsw", "storage": "fp16"}, [{"efSearch": 64}]),
+    ("hnsw32 int8", {"type": "hnsw", "storage": "int8"}, [{"efSearch": 64}]),
+    ("ivf int8", {"type": "ivf", "storage": "int8"}, [{"nprobe": 8}, {"nprobe": 32}]),
+    ("ivfpq", {"type": "ivfpq"}, [{"nprobe": 8}, {"nprobe": 32}]),
+    ("ivfpq+fp16", {"type": "ivfpq", "refine": "fp16"},
+     [{"nprobe": 8, "k_factor": 4}, {"nprobe": 8, "k_factor": 16}, {"nprobe": 32, "k_factor": 16}]),
+]
+
+
+def _recall(found, truth, k):
+    return float(np.mean([len(set(f[:k]) & set(t[:k])) / k for f, t in zip(found, truth)]))
+
+
+def run_bench(args):
+    configs = [c for c in BENCH_CONFIGS if not args.only or any(name in c[0] for name in args.only)]
+    print(f"dim {args.dim}, {args.queries} single-vector queries, recall@{args.k} against exact search")
+    for count in args.vectors:
+        vectors = synthetic_vectors(count, args.dim, seed=0)
+        queries = synthetic_vectors(args.queries, args.dim, seed=1)
+        exact = faiss.IndexFlatL2(args.dim)
+        exact.add(vectors)
+        truth = exact.search(queries, args.k)[1]
+        del exact
+        print(f"\n{count} vectors")
+        print("index          params                  build s     MB   recall   p50 ms   p99 ms")
+        for name, spec, sweeps in configs:
+            started = time.perf_counter()
+            index = build_index(vectors, {**spec, "train_size": args.train_size})
+            build = time.perf_counter() - started
+            size = faiss.serialize_index(index).nbytes / 2**20
+            for params in sweeps:
+                set_search_params(index, params)
+                latencies, found = [], []
+                for query in queries:
+                    started = time.perf_counter()
+                    found.append(index.search(query.reshape(1, -1), args.k)[1][0])
+                    latencies.append(time.perf_counter() - started)
+                label = ",".join(f"{key}={value}" for key, value in params.items()) or "-"
+                print(f"{name:<15}{label:<24}{build:>7.1f}{size:>7.0f}{_recall(found, truth, args.k):>9.3f}"
+                      f"{np.percentile(latencies, 50) * 1000:>9.3f}{np.percentile(latencies, 99) * 1000:>9.3f}")
+            del index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN index types: build an index directory's ANN copy or benchmark them")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="(re)build the ANN copy of existing index directories")
+    build.add_argument("index_dirs", nargs="+")
+    add_index_args(build)
+    bench = sub.add_parser("bench", help="recall, latency and memory per index type on synthetic vectors")
+    bench.add_argument("--vectors", type=int, nargs="+", default=[10000, 100000])
+    bench.add_argument("--dim", type=int, default=256, help="1536 matches Titan but needs ~6 GB per million vectors")
+    bench.add_argument("--queries", type=int, default=200)
+    bench.add_argument("--k", type=int, default=5)
+    bench.add_argument("--train-size", type=int, default=100000)
+    bench.add_argument("--only", nargs="+", help="only index configs whose name contains one of these")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        run_bench(args)
+        return
+    spec = spec_from_args(args) or {"type": "flat"}
+    for index_dir in args.index_dirs:
+        built = write_ann_index(index_dir, spec)
+        print(f"{index_dir}: {built['factory']} over {built['ntotal']} vectors" if built else f"{index_dir}: flat only")
+
+if __name__ == "__main__":
+    main()
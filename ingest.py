@@ -0,0 +1,305 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from langchain_classic.vectorstores import FAISS
+from langchain_community.document_loaders import PyPDFLoader
+
+from chunking import NearDuplicates, add_source, drop_source
+from embedding_cache import text_hash
+from index_factory import read_ann_spec, refresh_ann_index
+from lexical_index import LEXICAL_FILE, BM25Index
+from mmap_index import current_dir, has_index, load_index, publish
+
+MANIFEST_FILE = "manifest.json"
+RETRYABLE_ERRORS = ("Throttling", "TooManyRequests", "ServiceUnavailable", "ModelTimeout", "ModelNotReady")
+
+
+class RateLimiter:
+    """Token bucket shared by the embedding threads"""
+
+    def __init__(self, calls_per_second):
+        self.rate = calls_per_second
+        self.tokens = calls_per_second
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, calls=1):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= calls or self.tokens >= self.rate:
+                    self.tokens -= calls
+                    return
+                wait = (calls - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Throughput:
+    """Wall-clock stage timings and counters for an index build"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counts = {"pages": 0, "chunks": 0, "embed_calls": 0, "cache_hits": 0, "retries": 0, "duplicates": 0}
+        self._lock = threading.Lock()
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0) + time.perf_counter() - started
+
+    def report(self):
+        total = time.perf_counter() - self.started
+        parse = self.stages.get("parse", 0) or 1e-9
+        embed = self.stages.get("embed", 0) or 1e-9
+        lines = [f"{name}: {seconds:.2f}s" for name, seconds in self.stages.items()]
+        lines.append(f"pages/s: {self.counts['pages'] / parse:.1f}")
+        lines.append(f"chunks/s: {self.counts['chunks'] / embed:.1f}")
+        lines.append(f"embed calls/s: {self.counts['embed_calls'] / embed:.1f} ({self.counts['retries']} retries)")
+        lines.append(f"embedding cache hits: {self.counts['cache_hits']}")
+        lines.append(f"near-duplicate chunks merged: {self.counts['duplicates']}")
+        lines.append(f"total: {total:.2f}s")
+        return "\n".join(lines)
+
+
+def load_pdf(path):
+    return PyPDFLoader(path).load()
+
+
+def load_pdfs(paths, workers=None, throughput=None):
+    """Parse PDFs in a process pool, keeping the input order"""
+    docs = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for pages in pool.map(load_pdf, paths):
+            docs.extend(pages)
+    if throughput:
+        throughput.add("pages", len(docs))
+    return docs
+
+
+def is_retryable(error):
+    message = f"{type(error).__name__}: {error}"
+    return any(code in message for code in RETRYABLE_ERRORS)
+
+
+def embed_batch(embeddings, texts, limiter, throughput=None, retries=6, base_delay=0.5):
+    """Embed one batch, backing off exponentially (with jitter) on throttling"""
+    for attempt in range(retries + 1):
+        limiter.acquire(len(texts))
+        try:
+            vectors = embeddings.embed_documents(texts)
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            if throughput:
+                throughput.add("retries")
+            time.sleep(base_delay * 2 ** attempt * (1 + random.random()))
+            continue
+        if throughput:
+            throughput.add("embed_calls", len(texts))
+        return vectors
+
+
+def embed_texts(embeddings, texts, batch_size=8, workers=8, calls_per_second=None, throughput=None):
+    """Embed ``texts`` with a bounded thread pool; vectors come back in input order"""
+    limiter = RateLimiter(calls_per_second)
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    vectors = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch_vectors in pool.map(lambda batch: embed_batch(embeddings, batch, limiter, throughput), batches):
+            vectors.extend(batch_vectors)
+    return vectors
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def embed_with_cache(embeddings, model_id, texts, cache, batch_size=8, workers=8, calls_per_second=None, throughput=None):
+    """Embed ``texts``, calling the model only for chunks missing from ``cache``"""
+    hashes = [text_hash(text) for text in texts]
+    known = cache.get_many(model_id, hashes)
+    missing = {}
+    for chunk_hash, text in zip(hashes, texts):
+        if chunk_hash not in known:
+            missing.setdefault(chunk_hash, text)
+    if throughput:
+        throughput.add("cache_hits", len(texts) - len(missing))
+    if missing:
+        vectors = embed_texts(embeddings, list(missing.values()), batch_size, workers, calls_per_second, throughput)
+        fresh = list(zip(missing.keys(), vectors))
+        cache.put_many(model_id, fresh)
+        known.update(fresh)
+    return [known[chunk_hash] for chunk_hash in hashes]
+
+
+def load_manifest(index_dir):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path) or not has_index(index_dir):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_manifest(index_dir, manifest):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def _stale_ids(known, affected):
+    """Ids owned by ``affected`` sources; sources sharing one of them are added to ``affected`` to be re-split"""
+    while True:
+        stale = {doc_id for key in affected for doc_id in known.get(key, {}).get("ids", [])}
+        sharing = {key for key, entry in known.items() if key not in affected and stale.intersection(entry.get("shared", []))}
+        if not sharing:
+            return stale
+        affected |= sharing
+
+
+def update_index(index_dir, source_hashes, load_sources, splitter, embeddings, model_id, cache,
+                 batch_size=8, workers=8, calls_per_second=None, throughput=None, index_spec=None,
+                 dedupe_threshold=None, chunking=None, keep=()):
+    """Bring ``index_dir`` in line with ``source_hashes`` ({source: content hash}).
+
+    Only sources that are new or whose hash changed are loaded (through
+    ``load_sources(keys)``), split and embedded; vectors of changed and
+    removed sources are deleted from the existing index, and the BM25
+    index next to it is rebuilt from the updated docstore. The ANN copy
+    is rebuilt whenever the flat index changes, or when ``index_spec``
+    differs from the spec it was built with. Returns
+    (vectorstore, changed, removed); with no changes no embedding call is
+    made and the index is only loaded to backfill a missing BM25 file.
+
+    With ``dedupe_threshold`` a new chunk that near-duplicates one already
+    indexed (or an earlier new one) is not embedded; the kept copy lists it
+    under ``sources`` and the manifest records it as ``shared`` by its
+    source. Sources sharing a chunk whose owner changes are re-split too,
+    which costs no embedding calls for unchanged text. A different
+    ``model_id`` or ``chunking`` label rebuilds the whole index.
+
+    Indexed sources listed in ``keep`` are left as they are even though
+    they are missing from ``source_hashes`` (web pages that could not be
+    fetched this run).
+    """
+    manifest = load_manifest(index_dir)
+    if manifest is None or manifest.get("model_id") != model_id or manifest.get("chunking") != chunking:
+        manifest = {"model_id": model_id, "chunking": chunking, "sources": {}}
+
+    known = manifest["sources"]
+    changed = [key for key, digest in source_hashes.items() if known.get(key, {}).get("hash") != digest]
+    removed = [key for key in known if key not in source_hashes and key not in keep]
+    if not changed and not removed:
+        directory = current_dir(index_dir)
+        if known and not os.path.exists(os.path.join(directory, LEXICAL_FILE)):
+            # Indexes published before BM25 joined the generation: add it to the one already current
+            vectorstore = load_index(index_dir, embeddings, mmap=False, directory=directory)
+            BM25Index.from_vectorstore(vectorstore).save(directory)
+        if known and index_spec is not None and index_spec != (read_ann_spec(index_dir) or {}).get("spec"):
+            refresh_ann_index(index_dir, index_spec)
+        return None, changed, removed
+
+    vectorstore = None
+    if known:
+        vectorstore = load_index(index_dir, embeddings, mmap=False)
+
+    affected = set(changed) | set(removed)
+    stale_ids = _stale_ids(known, affected)
+    changed += [key for key in known if key in affected and key not in changed and key not in removed]
+    if vectorstore is not None:
+        # Chunks kept for an unaffected source no longer also stand for the affected ones
+        for key in affected:
+            for doc_id in known.get(key, {}).get("shared", []):
+                if doc_id not in stale_ids:
+                    drop_source(vectorstore.docstore.search(doc_id).metadata, key)
+        if stale_ids:
+            vectorstore.delete(list(stale_ids))
+    for key in removed:
+        del known[key]
+
+    with throughput.stage("parse") if throughput else nullcontext():
+        docs = load_sources(changed) if changed else []
+    with throughput.stage("split") if throughput else nullcontext():
+        chunks = splitter.split_documents(docs)
+
+    # Ids are derived from the source and its content so they stay stable across runs
+    source_ids = {key: [] for key in changed}
+    shared = {key: [] for key in changed}
+    positions = dict.fromkeys(changed, 0)
+    prefixes = {key: text_hash(key + source_hashes[key])[:16] for key in changed}
+    detector = None
+    if dedupe_threshold:
+        with throughput.stage("dedupe") if throughput else nullcontext():
+            detector = NearDuplicates(dedupe_threshold)
+            for doc_id in (vectorstore.index_to_docstore_id.values() if vectorstore is not None else ()):
+                detector.add(doc_id, vectorstore.docstore.search(doc_id).page_content)
+    kept, ids = [], []
+    new_chunks = {}
+    for chunk in chunks:
+        key = chunk.metadata["source"]
+        doc_id = f"{prefixes[key]}-{positions[key]}"
+        positions[key] += 1
+        match = detector.find(chunk.page_content) if detector else None
+        if match is not None:
+            original = new_chunks[match] if match in new_chunks else vectorstore.docstore.search(match)
+            if original.metadata["source"] != key:
+                add_source(original.metadata, key)
+                if match not in shared[key]:
+                    shared[key].append(match)
+            if throughput:
+                throughput.add("duplicates")
+            continue
+        if detector:
+            detector.add(doc_id, chunk.page_content)
+        new_chunks[doc_id] = chunk
+        kept.append(chunk)
+        ids.append(doc_id)
+        source_ids[key].append(doc_id)
+    for key in changed:
+        known[key] = {"hash": source_hashes[key], "ids": source_ids[key], "shared": shared[key]}
+    chunks = kept
+
+    with throughput.stage("embed") if throughput else nullcontext():
+        texts = [chunk.page_content for chunk in chunks]
+        vectors = embed_with_cache(embeddings, model_id, texts, cache, batch_size, workers, calls_per_second, throughput)
+    if throughput:
+        throughput.add("chunks", len(chunks))
+
+    text_embeddings = list(zip(texts, vectors))
+    metadatas = [chunk.metadata for chunk in chunks]
+    if vectorstore is None:
+        if not chunks:
+            return None, changed, removed
+        vectorstore = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+    elif chunks:
+        vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+
+    with throughput.stage("save") if throughput else nullcontext():
+        # A new generation: processes still mapping the old index.faiss keep reading their own pair
+        publish(vectorstore, index_dir)
+        save_manifest(index_dir, manifest)
+    with throughput.stage("ann") if throughput else nullcontext():
+        refresh_ann_index(index_dir, index_spec, vectorstore.index)
+    return vectorstore, changed, removed
@@ -0,0 +1,87 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+
+from langchain_core.documents import Document
+
+LEXICAL_FILE = "bm25.json"
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i if in is it its me my of on or our please
+should so that the their them then there these this to was we what when where which who why
+will with you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercase word tokens; hyphens are dropped so e-SIM and eSIM match"""
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", text.lower().replace("-", "")):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """In-memory inverted index scored with Okapi BM25"""
+
+    def __init__(self, ids, texts, metadatas, k1=1.5, b=0.75):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.lengths = []
+        for doc_idx, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((doc_idx, tf))
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        self.idf = {
+            term: math.log(1 + (len(texts) - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        ids = list(vectorstore.index_to_docstore_id.values())
+        docs = [vectorstore.docstore.search(doc_id) for doc_id in ids]
+        return cls(ids, [doc.page_content for doc in docs], [doc.metadata for doc in docs])
+
+    def search(self, query, k=10):
+        """Top ``k`` as [(doc_idx, score)] plus the set of query terms each matched"""
+        terms = set(tokenize(query))
+        scores = {}
+        matched = {}
+        for term in terms:
+            for doc_idx, tf in self.postings.get(term, ()):
+                norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[doc_idx] / self.avg_length)
+                scores[doc_idx] = scores.get(doc_idx, 0.0) + self.idf[term] * tf * (self.k1 + 1) / norm
+                matched.setdefault(doc_idx, set()).add(term)
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return top, terms, matched
+
+    def document(self, doc_idx, score=None):
+        metadata = dict(self.metadatas[doc_idx])
+        if score is not None:
+            metadata["lexical_score"] = score
+        return Document(id=self.ids[doc_idx], page_content=self.texts[doc_idx], metadata=metadata)
+
+    def save(self, index_dir):
+        path = os.path.join(index_dir, LEXICAL_FILE)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump({"ids": self.ids, "texts": self.texts, "metadatas": self.metadatas}, f)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, index_dir):
+        with open(os.path.join(index_dir, LEXICAL_FILE), 'r') as f:
+            data = json.load(f)
+        return cls(data["ids"], data["texts"], data["metadatas"])
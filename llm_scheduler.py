@@ -0,0 +1,156 @@
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+from ingest import is_retryable
+from tracing import METRICS
+
+
+class _Flight:
+    """One in-flight LLM call that identical questions can join.
+
+    Streamed tokens are appended to one log; every joiner reads it from its
+    own position in ``follow``, so its callback runs on its own thread
+    (Streamlit routes output by the calling thread's script context).
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.tokens = []
+        self.finished = False
+        self.result = None
+        self.error = None
+
+    def publish(self, token):
+        with self.cond:
+            self.tokens.append(token)
+            self.cond.notify_all()
+
+    def finish(self):
+        with self.cond:
+            self.finished = True
+            self.cond.notify_all()
+
+    def follow(self, on_token=None):
+        """Pass every token, from the first, to ``on_token`` until the call finishes"""
+        delivered = 0
+        while True:
+            with self.cond:
+                while delivered == len(self.tokens) and not self.finished:
+                    self.cond.wait()
+                pending = self.tokens[delivered:]
+                finished = self.finished
+            delivered += len(pending)
+            if on_token:
+                for token in pending:
+                    on_token(token)
+            if finished and delivered == len(self.tokens):
+                return
+
+
+class LLMScheduler:
+    """Single-flight, bounded-concurrency gate in front of Bedrock chain calls.
+
+    Identical in-flight requests (same ``key``) share one call and its
+    streamed tokens. At most ``max_concurrency`` calls run at once; waiting
+    requests are granted slots round-robin across sessions so one busy
+    session cannot starve the others. Throttling errors are retried with
+    exponential backoff as long as no tokens have been streamed yet.
+    """
+
+    def __init__(self, max_concurrency=4, retries=4, base_delay=1.0):
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.base_delay = base_delay
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._queues = OrderedDict()
+        self._running = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+    def run(self, session_id, key, call, on_token=None):
+        """Run ``call(emit)`` or join an identical in-flight call.
+
+        ``call`` receives a token callback to stream through. ``on_token``
+        is always called on the caller's thread, whether it leads the call
+        or joined it. Returns ``(result, shared)`` where ``shared`` is True
+        when the result came from another request's call.
+        """
+        with self._inflight_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            METRICS.inc("chatbot_llm_coalesced_total", help="Requests served by joining an in-flight LLM call")
+            flight.follow(on_token)
+            if flight.error:
+                raise flight.error
+            return flight.result, True
+
+        def emit(token):
+            flight.publish(token)
+            if on_token:
+                on_token(token)
+
+        try:
+            flight.result = self._call_with_backoff(session_id, call, emit, flight)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            flight.finish()
+        return flight.result, False
+
+    def _call_with_backoff(self, session_id, call, emit, flight):
+        for attempt in range(self.retries + 1):
+            self._acquire(session_id)
+            try:
+                return call(emit)
+            except Exception as e:
+                if attempt == self.retries or flight.tokens or not is_retryable(e):
+                    raise
+                METRICS.inc("chatbot_llm_retries_total", help="LLM calls retried after throttling")
+            finally:
+                self._release()
+            time.sleep(self.base_delay * 2 ** attempt * (1 + random.random()))
+
+    def _acquire(self, session_id):
+        ticket = threading.Event()
+        queued = time.perf_counter()
+        with self._cond:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self._waiting += 1
+            self._dispatch()
+            while not ticket.is_set():
+                self._cond.wait()
+        METRICS.observe("chatbot_llm_queue_wait_seconds", time.perf_counter() - queued,
+                        help="Time spent waiting for an LLM slot")
+
+    def _release(self):
+        with self._cond:
+            self._running -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        """Hand free slots to the session at the head of the rotation; caller holds ``_cond``"""
+        granted = False
+        while self._running < self.max_concurrency and self._queues:
+            session_id, tickets = next(iter(self._queues.items()))
+            tickets.popleft().set()
+            if tickets:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            self._running += 1
+            self._waiting -= 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+        METRICS.set("chatbot_llm_queue_depth", self._waiting, help="Requests waiting for an LLM slot")
+        METRICS.set("chatbot_llm_running", self._running, help="LLM calls in flight")
@@ -0,0 +1,356 @@
+"""Memory-mapped FAISS indexes with a SQLite docstore, loaded without pickle.
+
+An index holds ``index.faiss`` (read with mmap, so every worker process
+shares the vectors through the page cache) and ``docstore.sqlite`` (chunk
+id, text and JSON metadata per FAISS row, read lazily by id).
+
+Both are published together with the BM25 index (``bm25.json``):
+``publish`` writes all three to a new directory under ``generations/`` and
+then points ``CURRENT`` at it with one rename. A file a running process has
+mapped is never rewritten, and a reader that resolves ``CURRENT`` once
+always opens a matching set. Directories converted before generations keep
+their files at the top level and are read as they are.
+
+    python mmap_index.py convert faiss_index faiss_webindex
+    python mmap_index.py bench --workers 4 --vectors 200000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections.abc import Mapping
+
+import faiss
+import numpy as np
+from langchain_classic.vectorstores import FAISS
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from lexical_index import LEXICAL_FILE, BM25Index
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+CURRENT_FILE = "CURRENT"
+GENERATIONS_DIR = "generations"
+# The generation before the current one stays on disk for processes still opening it
+KEEP_GENERATIONS = 2
+# Staging directories older than this belong to a publisher that died; younger ones may still be written
+STAGING_GRACE_SECONDS = 3600
+
+SCHEMA = """
+CREATE TABLE chunks (
+    position INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+"""
+
+
+class _NoEmbeddings(Embeddings):
+    """Placeholder for stores that are only searched by vector"""
+
+    def embed_documents(self, texts):
+        raise NotImplementedError("this store is searched by vector only")
+
+    def embed_query(self, text):
+        raise NotImplementedError("this store is searched by vector only")
+
+
+class SqliteDocstore(Docstore):
+    """Read-only docstore over ``docstore.sqlite``; documents are fetched by id on demand"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def search(self, search):
+        with self._lock:
+            row = self._conn.execute("SELECT text, metadata FROM chunks WHERE id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def position_map(self):
+        return PositionMap(self)
+
+    def rows(self):
+        with self._lock:
+            return self._conn.execute("SELECT position, id, text, metadata FROM chunks ORDER BY position").fetchall()
+
+
+class PositionMap(Mapping):
+    """FAISS row -> docstore id, looked up in SQLite instead of held in a dict"""
+
+    def __init__(self, docstore):
+        self.docstore = docstore
+        with docstore._lock:
+            self._length = docstore._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def __getitem__(self, position):
+        with self.docstore._lock:
+            row = self.docstore._conn.execute(
+                "SELECT id FROM chunks WHERE position = ?", (int(position),)
+            ).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __iter__(self):
+        return iter(range(self._length))
+
+    def __len__(self):
+        return self._length
+
+
+def current_generation(index_dir):
+    """Name of the published generation of ``index_dir``, or None before the first publish"""
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), 'r') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def current_dir(index_dir):
+    """Directory holding the current ``index.faiss``/``docstore.sqlite`` pair of ``index_dir``"""
+    generation = current_generation(index_dir)
+    return index_dir if generation is None else os.path.join(index_dir, GENERATIONS_DIR, generation)
+
+
+def index_path(index_dir):
+    return os.path.join(current_dir(index_dir), INDEX_FILE)
+
+
+def has_index(index_dir):
+    return os.path.exists(index_path(index_dir))
+
+
+def has_docstore(index_dir):
+    return os.path.exists(os.path.join(current_dir(index_dir), DOCSTORE_FILE))
+
+
+def _replace(path, write):
+    """Write ``path`` through a temp file in the same directory, then rename it into place"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def publish(vectorstore, index_dir):
+    """Write ``vectorstore`` as a new generation of ``index_dir`` and make it current.
+
+    Readers resolve ``CURRENT`` once and open every file from that
+    generation, so they never pair new vectors with old rows or BM25 ids.
+    ``index.faiss`` and ``index.pkl`` are also swapped in at the top level
+    for ``FAISS.load_local`` (the notebook). Returns the generation name.
+    """
+    root = os.path.join(index_dir, GENERATIONS_DIR)
+    generation = f"{time.time_ns():020d}"
+    staging = os.path.join(root, f"{generation}.tmp")
+    os.makedirs(staging)
+    faiss.write_index(vectorstore.index, os.path.join(staging, INDEX_FILE))
+    write_docstore(vectorstore, staging)
+    BM25Index.from_vectorstore(vectorstore).save(staging)
+    os.rename(staging, os.path.join(root, generation))
+
+    def write_pointer(path):
+        with open(path, 'w') as f:
+            f.write(generation)
+
+    _replace(os.path.join(index_dir, CURRENT_FILE), write_pointer)
+
+    def link_index(path):
+        try:
+            os.link(os.path.join(root, generation, INDEX_FILE), path)
+        except OSError:
+            shutil.copyfile(os.path.join(root, generation, INDEX_FILE), path)
+
+    def write_pickle(path):
+        with open(path, 'wb') as f:
+            pickle.dump((vectorstore.docstore, vectorstore.index_to_docstore_id), f)
+
+    _replace(os.path.join(index_dir, INDEX_FILE), link_index)
+    _replace(os.path.join(index_dir, LEGACY_DOCSTORE_FILE), write_pickle)
+    # Superseded by the generation; unlinking them is safe for a process that still has one open
+    for name in (DOCSTORE_FILE, LEXICAL_FILE):
+        if os.path.exists(os.path.join(index_dir, name)):
+            os.remove(os.path.join(index_dir, name))
+    names = os.listdir(root)
+    generations = sorted(name for name in names if not name.endswith(".tmp"))
+    # Staging directories are named by their start time; another publisher may still be filling a recent one
+    abandoned = [name for name in names if name.endswith(".tmp")
+                 and time.time_ns() - int(name[:-len(".tmp")]) > STAGING_GRACE_SECONDS * 1e9]
+    for name in generations[:-KEEP_GENERATIONS] + abandoned:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    return generation
+
+
+def write_docstore(vectorstore, index_dir):
+    """Write ``docstore.sqlite`` for a LangChain FAISS store, atomically replacing any old one"""
+    path = os.path.join(index_dir, DOCSTORE_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        rows = []
+        for position, doc_id in sorted(vectorstore.index_to_docstore_id.items()):
+            doc = vectorstore.docstore.search(doc_id)
+            rows.append((int(position), doc_id, doc.page_content, json.dumps(doc.metadata, default=str)))
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+
+def load_index(index_dir, embeddings, mmap=True, directory=None):
+    """Load the current generation of an index directory, preferring ``docstore.sqlite`` over the pickle.
+
+    With ``mmap`` the FAISS vectors are mapped read-only and the docstore is
+    read lazily, which suits the apps. ``mmap=False`` returns an ordinary
+    in-memory store that can be updated (used by ingest). ``directory`` is
+    a generation the caller already resolved with ``current_dir``.
+    """
+    directory = directory or current_dir(index_dir)
+    if not os.path.exists(os.path.join(directory, DOCSTORE_FILE)):
+        # Not converted yet: the legacy pickle is still trusted because we wrote it
+        return FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+
+    docstore = SqliteDocstore(os.path.join(directory, DOCSTORE_FILE))
+    if mmap:
+        index = faiss.read_index(os.path.join(directory, INDEX_FILE), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        return FAISS(embeddings, index, docstore, docstore.position_map())
+
+    index = faiss.read_index(os.path.join(directory, INDEX_FILE))
+    rows = docstore.rows()
+    in_memory = InMemoryDocstore({
+        doc_id: Document(id=doc_id, page_content=text, metadata=json.loads(metadata))
+        for _, doc_id, text, metadata in rows
+    })
+    return FAISS(embeddings, index, in_memory, {position: doc_id for position, doc_id, _, _ in rows})
+
+
+def convert(index_dir):
+    """Publish an existing ``index.faiss``/``index.pkl`` pair as the first generation"""
+    with open(os.path.join(index_dir, LEGACY_DOCSTORE_FILE), 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    store = FAISS(_NoEmbeddings(), faiss.read_index(os.path.join(index_dir, INDEX_FILE)), docstore, index_to_docstore_id)
+    return len(index_to_docstore_id), publish(store, index_dir)
+
+
+def memory_usage():
+    """RSS and PSS in MB; PSS splits shared (page-cache) pages between the processes mapping them"""
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup", 'r') as f:
+            for line in f:
+                name, value = line.split(":", 1)
+                if name in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    usage[name.lower()] = int(value.split()[0]) / 1024
+    except OSError:
+        import resource
+        usage["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return usage
+
+
+def _bench_worker(index_dir, fmt, queries, barrier, results):
+    started = time.perf_counter()
+    store = load_index(index_dir, _NoEmbeddings()) if fmt == "mmap" else FAISS.load_local(
+        index_dir, _NoEmbeddings(), allow_dangerous_deserialization=True
+    )
+    loaded = time.perf_counter() - started
+    for query in queries:
+        store.similarity_search_with_score_by_vector(query.tolist(), k=5)
+    searched = time.perf_counter() - started - loaded
+    # Measure while every worker still has the index open, so shared pages are split between them
+    barrier.wait()
+    results.put({"load": loaded, "search": searched / len(queries), **memory_usage()})
+    barrier.wait()
+
+
+def synthetic_index(index_dir, vectors, dim):
+    rng = np.random.default_rng(0)
+    index = faiss.IndexFlatL2(dim)
+    for start in range(0, vectors, 50000):
+        index.add(rng.random((min(50000, vectors - start), dim), dtype="float32"))
+    ids = [f"chunk-{i}" for i in range(vectors)]
+    docstore = InMemoryDocstore({
+        doc_id: Document(page_content=f"synthetic chunk {i} " * 40, metadata={"source": f"doc{i % 100}.pdf"})
+        for i, doc_id in enumerate(ids)
+    })
+    publish(FAISS(_NoEmbeddings(), index, docstore, dict(enumerate(ids))), index_dir)
+    return dim
+
+
+def run_bench(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.vectors:
+            index_dir = tmp
+            dim = synthetic_index(index_dir, args.vectors, args.dim)
+        else:
+            index_dir = args.index_dir
+            if not has_docstore(index_dir):
+                print(f"{index_dir} has no {DOCSTORE_FILE}; run convert first")
+                return
+            dim = faiss.read_index(index_path(index_dir)).d
+        queries = np.random.default_rng(1).random((args.queries, dim), dtype="float32")
+
+        context = multiprocessing.get_context("spawn")
+        print(f"{args.workers} worker processes, index {index_dir if not args.vectors else f'{args.vectors} x {dim} synthetic'}")
+        print("format   load ms   search ms   RSS MB   PSS MB   private MB")
+        for fmt in ("pickle", "mmap"):
+            barrier = context.Barrier(args.workers)
+            results = context.Queue()
+            workers = [
+                context.Process(target=_bench_worker, args=(index_dir, fmt, queries, barrier, results))
+                for _ in range(args.workers)
+            ]
+            for worker in workers:
+                worker.start()
+            samples = [results.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+
+            def mean(name):
+                return float(np.mean([sample.get(name, 0.0) for sample in samples]))
+
+            private = mean("private_clean") + mean("private_dirty")
+            print(f"{fmt:<8}{mean('load') * 1000:>8.1f}{mean('search') * 1000:>12.2f}"
+                  f"{mean('rss'):>9.1f}{mean('pss'):>9.1f}{private:>13.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory-mapped index format")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert_parser = sub.add_parser("convert", help="publish existing index directories with docstore.sqlite")
+    convert_parser.add_argument("index_dirs", nargs="+")
+    bench = sub.add_parser("bench", help="cold start and per-process memory, pickle vs mmap")
+    bench.add_argument("--index-dir", default="faiss_index")
+    bench.add_argument("--vectors", type=int, default=0, help="benchmark a synthetic index of this many vectors")
+    bench.add_argument("--dim", type=int, default=1536)
+    bench.add_argument("--workers", type=int, default=4)
+    bench.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        for index_dir in args.index_dirs:
+            chunks, generation = convert(index_dir)
+            print(f"{index_dir}: {chunks} chunks -> generation {generation}")
+    else:
+        run_bench(args)
+
+if __name__ == "__main__":
+    main()
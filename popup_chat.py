@@ -1,13 +1,15 @@
+import time
+script_started = time.perf_counter()
+
 import streamlit as st
-from langchain_aws import BedrockEmbeddings, ChatBedrock
-from langchain_classic.chains import ConversationalRetrievalChain
-from langchain_classic.memory import ConversationBufferMemory
-from langchain_classic.vectorstores import FAISS
-from langchain_classic.prompts import PromptTemplate
-import boto3
 import json
-import os
-from datetime import datetime
+import uuid
+from chat_client import ChatClient
+from feedback_store import open_feedback_store
+from startup import Warmup, timed_import
+from streaming import CURSOR, StreamToPlaceholder
+from tracing import observe_script_run, start_metrics_server
+from validation import POPUP_GUARDRAIL
 
 st.set_page_config(page_title="💬 Chat", layout="centered", initial_sidebar_state="collapsed")
 
@@ -33,164 +35,121 @@ def load_config():
     with open('config.json', 'r') as f:
         return json.load(f)
 
-@st.cache_resource
-def init_chain():
+def build_engine():
     config = load_config()
-    boto3.setup_default_session(
-        aws_access_key_id=config["aws_access_key_id"],
-        aws_secret_access_key=config["aws_secret_access_key"],
-        region_name=config["aws_region"]
-    )
-    embeddings = BedrockEmbeddings(model_id="amazon.titan-embed-text-v1", region_name=config["aws_region"])
-    vectordb = FAISS.load_local("faiss_index", embeddings, allow_dangerous_deserialization=True)
-    
-    prompt = PromptTemplate(
-        template="""You are a Spectrum mobile customer support assistant. Follow these rules EXACTLY:
-
-        STRICT REQUIREMENTS:
-        1. Answer ONLY in English - no other languages permitted
-        2. Use ONLY information from the provided context below
-        3. If information is not in context, respond: "I don't have that information. Please contact (833) 224-6603 for further assistance 
-           or visit https://www.spectrum.net/support/category/mobile for further assistance."
-        4. Only mention phone number (833) 224-6603 - no other numbers
-        5. Stay focused on Spectrum mobile products and services only
-        6. Provide factual, direct answers without speculation
-        7. Use bullet points for clarity when listing multiple items
-        8. Include the actual link at he bottom of the response with a prefix "For more details, please refer "
-        
-        CONTEXT INFORMATION:
-        {context}
-        
-        CUSTOMER QUESTION:
-        {question}
-        
-        RESPONSE (English only, context-based facts only):""",
-        input_variables=["context", "question"]
-    )
-    
-    return ConversationalRetrievalChain.from_llm(
-        ChatBedrock(
-            model_id=config["model_id"], 
-            region_name=config["aws_region"],
-            model_kwargs={"temperature": config["temperature"], "max_tokens": 500}
-        ),
-        vectordb.as_retriever(search_kwargs={"k": 5}),
-        memory=ConversationBufferMemory(memory_key="chat_history", return_messages=True),
-        combine_docs_chain_kwargs={"prompt": prompt}
-    )
+    # With a chat service configured this app is a thin client; otherwise it hosts the engine itself
+    if config.get("chat_service_url"):
+        return ChatClient(config["chat_service_url"])
+    # langchain, boto3 and FAISS are first imported here, off the first page render
+    engine = timed_import("chat_engine").ChatEngine(config)
+    if config.get("warmup", True):
+        engine.warmup()
+    return engine
+
+@st.cache_resource
+def init_engine():
+    # Starts on the process's first script run; the page renders while the engine warms up
+    return Warmup("engine", build_engine)
+
+def get_engine():
+    try:
+        if engine_warmup.ready():
+            return engine_warmup.get()
+        with st.spinner("Getting ready..."):
+            return engine_warmup.get()
+    except Exception:
+        # Let the next run retry instead of caching the failure
+        init_engine.clear()
+        raise
+
+@st.cache_resource
+def init_feedback():
+    return open_feedback_store(load_config())
+
+@st.cache_resource
+def init_voice():
+    # pyttsx3 / openai load on the first answer read aloud
+    return timed_import("tts").Voice.from_config(load_config())
+
+def voice_enabled():
+    return load_config().get("voice_output", False) and st.session_state.get("voice", False)
+
+@st.cache_resource
+def init_tracing():
+    port = load_config().get("metrics_port")
+    if port:
+        start_metrics_server(port)
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "feedback" not in st.session_state:
     st.session_state.feedback = {}
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if "answer_audio" not in st.session_state:
+    st.session_state.answer_audio = None
 
-def get_cached_response(question):
-    cache_file = "response_cache.json"
-    if os.path.exists(cache_file):
-        with open(cache_file, 'r') as f:
-            cache = json.load(f)
-        return cache.get(question)
-    return None
-
-def save_to_cache(question, response):
-    cache_file = "response_cache.json"
-    if os.path.exists(cache_file):
-        with open(cache_file, 'r') as f:
-            cache = json.load(f)
-    else:
-        cache = {}
-    
-    cache[question] = response
-    
-    with open(cache_file, 'w') as f:
-        json.dump(cache, f, indent=2)
-
-def validate_response_quality(response_text, question):
-    """Validate response meets quality standards"""
-    # Check for English only
-    non_english_patterns = ['¿', '¡', 'ñ', 'ç', 'ü', 'ß', 'à', 'é', 'è', 'ê', 'ë', 'î', 'ï', 'ô', 'ù', 'û', 'ÿ']
-    if any(pattern in response_text for pattern in non_english_patterns):
-        return "I can only respond in English. Please contact (833) 224-6603 for assistance."
-    
-    # Check for unauthorized phone numbers
-    import re
-    phone_pattern = r'\(?\d{3}\)?[-\s]?\d{3}[-\s]?\d{4}'
-    phones = re.findall(phone_pattern, response_text)
-    for phone in phones:
-        if '833-224-6603' not in phone and '(833) 224-6603' not in phone:
-            response_text = response_text.replace(phone, '(833) 224-6603')
-    
-    # Ensure factual tone
-    speculative_words = ['maybe', 'possibly', 'might be', 'could be', 'perhaps', 'I think', 'probably']
-    for word in speculative_words:
-        if word.lower() in response_text.lower():
-            return "I don't have that information. Please contact (833) 224-6603 for further assistance."
-    
-    return response_text
-
-def validate_english_response(response_text):
-    """Ensure response is in English only"""
-    non_english_patterns = ['¿', '¡', 'ñ', 'ç', 'ü', 'ß', 'à', 'é', 'è', 'ê', 'ë', 'î', 'ï', 'ô', 'ù', 'û', 'ÿ', 'ą', 'ć', 'ę', 'ł', 'ń', 'ó', 'ś', 'ź', 'ż']
-    if any(pattern in response_text for pattern in non_english_patterns):
-        return "I apologize, but I can only respond in English. Please contact (833) 224-6603 for assistance in other languages."
-    return response_text
-
-def save_feedback(question, response, feedback):
-    feedback_data = {
-        "timestamp": datetime.now().isoformat(),
-        "question": question,
-        "response": response,
-        "feedback": feedback
-    }
-    
-    feedback_file = "feedback.json"
-    if os.path.exists(feedback_file):
-        with open(feedback_file, 'r') as f:
-            data = json.load(f)
-    else:
-        data = []
-    
-    data.append(feedback_data)
-    
-    with open(feedback_file, 'w') as f:
-        json.dump(data, f, indent=2)
+def save_feedback(index, feedback):
+    # Queued for the shared feedback log's writer thread; the click returns immediately
+    msg = st.session_state.messages[index]
+    init_feedback().record(st.session_state.messages[index - 1]["content"], msg["content"], feedback, app="popup",
+                           session_id=st.session_state.session_id, request_id=msg.get("request_id"))
+    st.session_state.feedback[index] = feedback
+
+init_tracing()
+engine_warmup = init_engine()
 
-chain = init_chain()
+if load_config().get("voice_output", False):
+    st.toggle("🔊 Read answers aloud", key="voice")
 
 # Chat container
 with st.container():
-    for i, msg in enumerate(st.session_state.messages[-6:]):
+    start = max(len(st.session_state.messages) - 6, 0)
+    for i, msg in enumerate(st.session_state.messages[start:], start):
         with st.chat_message(msg["role"]):
             st.write(msg["content"])
+            if st.session_state.answer_audio and st.session_state.answer_audio[0] == i:
+                # Same element on every rerun, so it keeps playing rather than restarting
+                st.audio(st.session_state.answer_audio[1], format=init_voice().mime, autoplay=True)
             
             if msg["role"] == "assistant" and i > 0:
                 col1, col2, col3 = st.columns([2, 2, 8])
                 with col1:
                     if st.button("👍", key=f"like_{i}"):
-                        question = st.session_state.messages[i-1]["content"]
-                        save_feedback(question, msg["content"], "like")
-                        st.session_state.feedback[i] = "like"
+                        save_feedback(i, "like")
                 with col2:
                     if st.button("👎", key=f"dislike_{i}"):
-                        question = st.session_state.messages[i-1]["content"]
-                        save_feedback(question, msg["content"], "dislike")
-                        st.session_state.feedback[i] = "dislike"
+                        save_feedback(i, "dislike")
+                with col3:
+                    if voice_enabled() and st.button("🔊", key=f"play_{i}"):
+                        voice = init_voice()
+                        st.audio(voice.answer_audio(msg["content"]), format=voice.mime, autoplay=True)
 
 if question := st.chat_input("💬 Hello, how can Spectra assist you?"):
     st.session_state.messages.append({"role": "user", "content": question})
     
-    # Check cache first
-    cached_response = get_cached_response(question)
-    
-    if cached_response:
-        response_text = validate_response_quality(cached_response, question)
-    else:
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            with st.spinner("Thinking..."):
-                response = chain({"question": question, "chat_history": []})
-                response_text = validate_response_quality(response["answer"], question)
-                save_to_cache(question, response_text)
+    with st.chat_message("user"):
+        st.write(question)
+    with st.chat_message("assistant"):
+        placeholder = st.empty()
+        placeholder.markdown(CURSOR)
+        handler = StreamToPlaceholder(placeholder, POPUP_GUARDRAIL)
+        # Sentences are spoken as the guardrail releases them, not after the whole answer
+        speaker = init_voice().speaker(st.container()) if voice_enabled() else None
+
+        def on_token(token):
+            handler.write(token)
+            if speaker and not handler.blocked:
+                speaker.update(handler.released)
+
+        result = get_engine().answer(st.session_state.session_id, question, "popup", on_token=on_token)
+        response_text = result["answer"]
+        placeholder.markdown(response_text)
+        # The rest of the answer's audio, played from the history so the rerun does not cut it off
+        answer_audio = speaker.finish(response_text) if speaker else None
     
-    st.session_state.messages.append({"role": "assistant", "content": response_text})
-    st.rerun()
\ No newline at end of file
+    st.session_state.messages.append({"role": "assistant", "content": response_text, "request_id": result["request_id"]})
+    st.session_state.answer_audio = (len(st.session_state.messages) - 1, answer_audio) if answer_audio else None
+    st.rerun()
+
+observe_script_run("popup_chat", time.perf_counter() - script_started)
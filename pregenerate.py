@@ -0,0 +1,234 @@
+"""Answers popular questions ahead of time so the first user to ask one gets a cache hit.
+
+Questions come from the feedback log, the response cache's own keys and/or
+a CSV of top search intents (a ``question`` column, optionally ``count`` to
+rank by). They are retrieved a batch at a time: one embedding request for
+every question the lexical fast path cannot answer, then one FAISS search
+per index for the whole batch. Answers are generated through the LLM
+scheduler, at most ``--concurrency`` at a time, run through the same
+guardrail as the app and written to the response cache as each one
+finishes; the semantic cache's question vectors are embedded in one request
+per batch too. Questions that already have a fresh answer for the current index
+are skipped, so an interrupted run simply picks up where it stopped.
+
+    python pregenerate.py --from feedback cache --csv top_intents.csv --limit 200
+    python pregenerate.py --from cache --force          # answer everything again, e.g. after ingest
+    python pregenerate.py --from feedback --stub        # offline, against the stub models of benchmark.py
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from cache_store import DEFAULT_DB_PATH, open_cache
+from chat_chain import build_chain, build_retriever, make_embeddings, make_llms, make_memory
+from chat_engine import PROFILES
+from feedback_store import DEFAULT_DB_PATH as FEEDBACK_DB_PATH, LEGACY_JSON_PATH as FEEDBACK_JSON_PATH
+from llm_scheduler import LLMScheduler
+from retrieval import PrefetchedRetriever
+from semantic_cache import SemanticCache, normalize_question
+from streaming import ANSWER_TAG
+from tracing import METRICS
+
+SOURCES = ("feedback", "cache")
+# Scheduler fairness queue shared by every pre-generated answer
+PREGENERATE_SESSION = "pregenerate"
+# Stub answers must never land in the cache the apps serve from
+STUB_DB_PATH = "pregenerate_stub.db"
+
+
+def load_feedback_questions(db_path=FEEDBACK_DB_PATH, json_path=FEEDBACK_JSON_PATH):
+    """Rated questions, most often rated first (legacy feedback.json until feedback.db exists)"""
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            questions = [q for (q,) in conn.execute("SELECT question FROM feedback ORDER BY id")]
+        finally:
+            conn.close()
+    elif os.path.exists(json_path):
+        with open(json_path, 'r') as f:
+            questions = [entry["question"] for entry in json.load(f)]
+    else:
+        questions = []
+    return [q for q, _ in Counter(questions).most_common()]
+
+
+def load_csv_questions(path):
+    """Questions from a CSV with a ``question`` column (else the first), ranked by ``count`` when present"""
+    with open(path, 'r', newline='') as f:
+        reader = csv.DictReader(f)
+        column = "question" if "question" in (reader.fieldnames or ()) else reader.fieldnames[0]
+        rows = [(row[column], float(row.get("count") or 0)) for row in reader]
+    return [q for q, _ in sorted(rows, key=lambda row: row[1], reverse=True)]
+
+
+def collect_questions(sources, cache, csv_paths=(), feedback_db=FEEDBACK_DB_PATH):
+    """Questions from every source in order, without blanks or repeats after normalization"""
+    questions = []
+    for source in sources:
+        questions += load_feedback_questions(feedback_db) if source == "feedback" else cache.popular_keys()
+    for path in csv_paths:
+        questions += load_csv_questions(path)
+    unique = {}
+    for question in questions:
+        question = question.strip()
+        if question:
+            unique.setdefault(normalize_question(question), question)
+    return list(unique.values())
+
+
+class Pregenerator:
+    """Retrieves questions in batches and answers them with bounded concurrency into the response cache"""
+
+    def __init__(self, config, embeddings, answer_llm, condense_llm, retriever, cache,
+                 profile="support", concurrency=4, batch_size=16):
+        self.config = config
+        self.answer_llm = answer_llm
+        self.condense_llm = condense_llm
+        self.retriever = retriever
+        self.cache = cache
+        self.template, self.guardrail = PROFILES[profile]
+        self.profile = profile
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.scheduler = LLMScheduler(max_concurrency=concurrency, retries=config.get("llm_retries", 4))
+        self.stats = {"retrieval_seconds": 0.0, "generation_seconds": [], "done": 0, "failed": 0, "rewritten": 0}
+
+    @classmethod
+    def from_config(cls, config, db_path=DEFAULT_DB_PATH, stub=False, **kwargs):
+        if stub:
+            from benchmark import StubChatModel, StubEmbeddings, stub_vectorstores
+
+            embeddings = StubEmbeddings()
+            answer_llm, condense_llm = StubChatModel(streaming=True, tags=[ANSWER_TAG]), StubChatModel()
+            retriever = build_retriever(config, embeddings, vectorstores=stub_vectorstores(embeddings))
+        else:
+            embeddings = make_embeddings(config)
+            answer_llm, condense_llm = make_llms(config)
+            retriever = build_retriever(config, embeddings)
+        cache = SemanticCache(
+            embeddings, open_cache(config, db_path), threshold=config.get("semantic_cache_threshold", 0.92),
+            db_path=db_path,
+        )
+        return cls(config, embeddings, answer_llm, condense_llm, retriever, cache, **kwargs)
+
+    def pending(self, questions, force=False):
+        """``questions`` without a fresh answer for the current index"""
+        if force:
+            return list(questions)
+        fresh = self.cache.response_cache.fresh(questions, self.cache.fingerprint)
+        return [q for q in questions if q not in fresh]
+
+    def _answer(self, question, documents, vector):
+        # A fresh chain per question: no history, and retrieval served from the batch
+        chain = build_chain(
+            self.answer_llm, self.condense_llm,
+            PrefetchedRetriever(base=self.retriever, documents={question: documents}),
+            self.template, memory=make_memory(self.config, self.condense_llm),
+        )
+        started = time.perf_counter()
+        response, _ = self.scheduler.run(
+            PREGENERATE_SESSION, (self.profile, normalize_question(question), ""),
+            lambda emit: chain({"question": question, "chat_history": []}), None,
+        )
+        seconds = time.perf_counter() - started
+        response_text = self.guardrail.validate(response["answer"])
+        self.cache.set(question, response_text, self.profile, vector=vector)
+        return seconds, response_text != response["answer"]
+
+    def _finished(self, future, question, total, started):
+        try:
+            seconds, rewritten = future.result()
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"[pregen] could not answer {question!r}: {e}", file=sys.stderr)
+        else:
+            self.stats["done"] += 1
+            self.stats["rewritten"] += rewritten
+            self.stats["generation_seconds"].append(seconds)
+            METRICS.inc("chatbot_pregenerated_total", help="Answers written to the cache ahead of time")
+        finished = self.stats["done"] + self.stats["failed"]
+        if finished % self.batch_size == 0 or finished == total:
+            elapsed = time.perf_counter() - started
+            rate = finished / elapsed
+            print(f"[pregen] {finished}/{total} ({self.stats['failed']} failed), "
+                  f"{rate:.2f} questions/s, eta {(total - finished) / rate:.0f}s", flush=True)
+
+    def run(self, questions):
+        """Answer every question; returns the stats dict"""
+        started = time.perf_counter()
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for offset in range(0, len(questions), self.batch_size):
+                batch = questions[offset:offset + self.batch_size]
+                retrieval_started = time.perf_counter()
+                documents = self.retriever.retrieve_many(batch)
+                self.stats["retrieval_seconds"] += time.perf_counter() - retrieval_started
+                # The semantic cache's vectors too, in one request instead of one per answer
+                vectors = self.cache.embed_many(batch)
+                for question, docs, vector in zip(batch, documents, vectors):
+                    in_flight[pool.submit(self._answer, question, docs, vector)] = question
+                # Retrieve the next batch while this one generates, but never more than one ahead
+                while len(in_flight) > self.batch_size:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._finished(future, in_flight.pop(future), len(questions), started)
+            for future in list(in_flight):
+                wait([future])
+                self._finished(future, in_flight.pop(future), len(questions), started)
+        self.stats["wall_seconds"] = time.perf_counter() - started
+        return self.stats
+
+
+def print_summary(stats, total, skipped):
+    generation = stats["generation_seconds"]
+    wall = stats.get("wall_seconds") or 1e-9
+    print(f"{total + skipped} questions, {skipped} already cached, {stats['done']} answered, {stats['failed']} failed")
+    print(f"throughput: {stats['done'] / wall:.2f} questions/s over {wall:.1f}s")
+    if total:
+        print(f"batched retrieval: {stats['retrieval_seconds'] / total * 1000:.1f} ms/question")
+    if generation:
+        print(f"generation p50/p95: {np.percentile(generation, 50):.2f}s / {np.percentile(generation, 95):.2f}s")
+    print(f"answers rewritten by the guardrail: {stats['rewritten']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate answers for popular questions into the response cache")
+    parser.add_argument("--from", dest="sources", nargs="*", choices=SOURCES, default=["feedback"],
+                        help="question sources: rated questions and/or the cache's own keys")
+    parser.add_argument("--csv", nargs="*", default=[], help="CSV files of top search intents")
+    parser.add_argument("--limit", type=int, default=None, help="at most this many questions, in source order")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="support")
+    parser.add_argument("--concurrency", type=int, default=4, help="answers generated at once")
+    parser.add_argument("--batch-size", type=int, default=16, help="questions retrieved together")
+    parser.add_argument("--force", action="store_true", help="answer again even if a fresh answer is cached")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--db", default=None, help=f"response cache (default {DEFAULT_DB_PATH}; {STUB_DB_PATH} with --stub)")
+    parser.add_argument("--feedback-db", default=FEEDBACK_DB_PATH)
+    parser.add_argument("--stub", action="store_true", help="use the benchmark's stub embeddings and LLM, no AWS")
+    args = parser.parse_args()
+
+    config = {}
+    if os.path.exists(args.config) or not args.stub:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+    db_path = args.db or (STUB_DB_PATH if args.stub else DEFAULT_DB_PATH)
+    pregenerator = Pregenerator.from_config(
+        config, db_path, stub=args.stub, profile=args.profile, concurrency=args.concurrency, batch_size=args.batch_size,
+    )
+    questions = collect_questions(args.sources, pregenerator.cache.response_cache, args.csv, args.feedback_db)
+    questions = questions[:args.limit]
+    pending = pregenerator.pending(questions, args.force)
+    print(f"[pregen] {len(pending)} of {len(questions)} questions to answer into {db_path}", flush=True)
+    stats = pregenerator.run(pending)
+    print_summary(stats, len(pending), len(questions) - len(pending))
+
+if __name__ == "__main__":
+    main()
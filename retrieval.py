@@ -0,0 +1,297 @@
+import hashlib
+import os
+import re
+import time
+from collections import deque
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict, PrivateAttr
+
+from index_factory import flat_fingerprint, load_ann_index, set_search_params
+from lexical_index import LEXICAL_FILE, BM25Index
+from mmap_index import current_dir, has_index, load_index
+
+DEFAULT_INDEXES = ("faiss_index", "faiss_webindex")
+
+
+def load_indexes(embeddings, index_dirs=DEFAULT_INDEXES, search_params=None, ann=True):
+    """Vector stores and BM25 indexes of every index directory that exists, keyed by its name.
+
+    Each directory's ``CURRENT`` is resolved once, so its vectors and BM25
+    ids come from the same generation. With ``ann`` a directory's ANN copy
+    (see index_factory) is searched in place of its flat index, tuned with
+    ``search_params``.
+    """
+    stores, lexical_indexes = {}, {}
+    for index_dir in index_dirs:
+        if not has_index(index_dir):
+            continue
+        # Read before loading: a generation published in between then only costs the ANN copy
+        source = flat_fingerprint(index_dir)
+        directory = current_dir(index_dir)
+        store = load_index(index_dir, embeddings, directory=directory)
+        ann_index = load_ann_index(index_dir, store.index.ntotal, source) if ann else None
+        if ann_index is not None:
+            store.index = set_search_params(ann_index, search_params)
+        stores[index_dir] = store
+        if os.path.exists(os.path.join(directory, LEXICAL_FILE)):
+            lexical_indexes[index_dir] = BM25Index.load(directory)
+    return stores, lexical_indexes
+
+
+def load_vectorstores(embeddings, index_dirs=DEFAULT_INDEXES, search_params=None, ann=True):
+    """Load every index directory that exists, keyed by its name (memory-mapped once converted)"""
+    return load_indexes(embeddings, index_dirs, search_params, ann)[0]
+
+
+def load_lexical_indexes(index_dirs=DEFAULT_INDEXES):
+    """BM25 indexes of the current generation of every directory that has one, keyed by directory"""
+    directories = {index_dir: current_dir(index_dir) for index_dir in index_dirs}
+    return {
+        index_dir: BM25Index.load(directory)
+        for index_dir, directory in directories.items()
+        if os.path.exists(os.path.join(directory, LEXICAL_FILE))
+    }
+
+
+def content_key(text):
+    return hashlib.sha1(" ".join(re.sub(r"[^\w\s]", " ", text.lower()).split()).encode()).hexdigest()
+
+
+def _normalized(text):
+    return " ".join(text.lower().split())
+
+
+def dedupe(docs):
+    """Drop repeated chunks and chunks whose text is contained in a better-ranked one"""
+    kept = []
+    seen = set()
+    for doc in docs:
+        key = content_key(doc.page_content)
+        if key in seen:
+            continue
+        text = _normalized(doc.page_content)
+        if any(text in _normalized(other.page_content) for other in kept):
+            continue
+        seen.add(key)
+        kept.append(doc)
+    return kept
+
+
+def min_max_normalize(hits):
+    """Rescale one index's relevance scores to [0, 1] so indexes are comparable"""
+    if not hits:
+        return []
+    scores = [float(score) for _, score in hits]
+    low, high = min(scores), max(scores)
+    span = high - low
+    return [(doc, (score - low) / span if span else 1.0) for (doc, _), score in zip(hits, scores)]
+
+
+def reciprocal_rank_fusion(ranked_lists, rrf_k=60, weights=None):
+    """Fuse ranked document lists; returns [(doc, score)] best first"""
+    scores = {}
+    docs = {}
+    weights = weights or [1.0] * len(ranked_lists)
+    for ranked, weight in zip(ranked_lists, weights):
+        for rank, doc in enumerate(ranked):
+            key = content_key(doc.page_content)
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank + 1)
+            docs.setdefault(key, doc)
+    return [(docs[key], scores[key]) for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class MultiIndexRetriever(BaseRetriever):
+    """Search several FAISS stores with a single query embedding.
+
+    The query is embedded once and the vector is searched in every store.
+    Results are merged by reciprocal-rank fusion (``fusion="rrf"``) or by
+    each store's min-max normalized relevance score (``fusion="score"``), then
+    de-duplicated and cut to ``k``. With ``query_vectors`` (an object with
+    ``query_vector(query)``, e.g. the SemanticCache) a query embedded moments
+    ago is not embedded again. Recent per-index search latencies are kept in
+    ``latencies``.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstores: dict
+    embeddings: object
+    k: int = 5
+    fetch_k: int = 10
+    fusion: str = "rrf"
+    rrf_k: int = 60
+    query_vectors: object = None
+
+    _latencies: dict = PrivateAttr(default_factory=dict)
+
+    @property
+    def latencies(self):
+        return {name: list(samples) for name, samples in self._latencies.items()}
+
+    def _record(self, name, seconds):
+        self._latencies.setdefault(name, deque(maxlen=200)).append(seconds)
+
+    def search_by_vector(self, vector):
+        """Per-index ``[(doc, relevance)]`` lists for an already embedded query"""
+        results = {}
+        for name, store in self.vectorstores.items():
+            started = time.perf_counter()
+            hits = store.similarity_search_with_score_by_vector(vector, k=self.fetch_k)
+            self._record(name, time.perf_counter() - started)
+            relevance = store._select_relevance_score_fn()
+            # Copies, so annotating metadata never touches the docstore's documents
+            results[name] = [
+                (Document(page_content=doc.page_content, metadata={**doc.metadata, "index": name}), relevance(distance))
+                for doc, distance in hits
+            ]
+        return results
+
+    def search_by_vectors(self, vectors):
+        """``search_by_vector`` for a batch of embedded queries, with one FAISS search per index"""
+        if not len(vectors):
+            return []
+        results = [{} for _ in vectors]
+        for name, store in self.vectorstores.items():
+            matrix = np.array(vectors, dtype="float32")
+            started = time.perf_counter()
+            if store._normalize_L2:
+                faiss.normalize_L2(matrix)
+            distances, positions = store.index.search(matrix, self.fetch_k)
+            self._record(name, (time.perf_counter() - started) / len(vectors))
+            relevance = store._select_relevance_score_fn()
+            for hits, row_distances, row_positions in zip(results, distances, positions):
+                hits[name] = []
+                for distance, position in zip(row_distances, row_positions):
+                    if position == -1:
+                        continue
+                    doc = store.docstore.search(store.index_to_docstore_id[position])
+                    hits[name].append((
+                        Document(page_content=doc.page_content, metadata={**doc.metadata, "index": name}),
+                        relevance(distance),
+                    ))
+        return results
+
+    def merge(self, results):
+        if self.fusion == "score":
+            scored = sorted(
+                (pair for hits in results.values() for pair in min_max_normalize(hits)),
+                key=lambda pair: pair[1],
+                reverse=True,
+            )
+        else:
+            scored = reciprocal_rank_fusion([[doc for doc, _ in hits] for hits in results.values()], self.rrf_k)
+        docs = []
+        for doc, score in scored:
+            doc.metadata["retrieval_score"] = score
+            docs.append(doc)
+        return dedupe(docs)[:self.k]
+
+    def known_vector(self, query):
+        """The embedding of ``query`` from ``query_vectors``, or None"""
+        return self.query_vectors.query_vector(query) if self.query_vectors is not None else None
+
+    def embed_query(self, query):
+        vector = self.known_vector(query)
+        if vector is None:
+            started = time.perf_counter()
+            vector = self.embeddings.embed_query(query)
+            self._record("embed", time.perf_counter() - started)
+        return vector
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return self.merge(self.search_by_vector(self.embed_query(query)))
+
+    def embed_many(self, queries):
+        started = time.perf_counter()
+        vectors = self.embeddings.embed_documents(queries) if queries else []
+        self._record("embed", (time.perf_counter() - started) / max(len(queries), 1))
+        return vectors
+
+    def retrieve_many(self, queries):
+        """Documents for each of ``queries``: one embedding request and one search per index for all of them"""
+        return [self.merge(results) for results in self.search_by_vectors(self.embed_many(queries))]
+
+
+class HybridRetriever(MultiIndexRetriever):
+    """MultiIndexRetriever that also ranks chunks with BM25.
+
+    Lexical and vector rankings are fused by weighted reciprocal rank. When
+    ``lexical_fast_path`` is on and, in some index, the best lexical hit
+    contains every query term with a clear margin over the runner-up, the
+    lexical rankings are returned directly and no embedding call is made.
+    A query whose embedding is already known (see ``query_vectors``) has
+    nothing to save, so it always gets the fused ranking.
+    """
+
+    lexical_indexes: dict
+    lexical_weight: float = 1.0
+    lexical_fast_path: bool = True
+    min_query_terms: int = 2
+    min_margin: float = 1.25
+
+    def lexical_search(self, query):
+        """Per-index lexical rankings and whether any is confident enough to skip the embedding"""
+        results = {}
+        confident = False
+        for name, lexical in self.lexical_indexes.items():
+            started = time.perf_counter()
+            top, terms, matched = lexical.search(query, self.fetch_k)
+            self._record(f"{name}:bm25", time.perf_counter() - started)
+            hits = []
+            for doc_idx, score in top:
+                doc = lexical.document(doc_idx, score)
+                doc.metadata["index"] = name
+                hits.append((doc, score))
+            results[name] = hits
+            if top and len(terms) >= self.min_query_terms and matched[top[0][0]] == terms:
+                if len(top) == 1 or top[0][1] >= self.min_margin * top[1][1]:
+                    confident = True
+        return results, self.lexical_fast_path and confident
+
+    def fuse(self, lexical, dense):
+        """Weighted reciprocal-rank fusion of per-index lexical and dense rankings"""
+        ranked_lists = [[doc for doc, _ in hits] for hits in dense.values()]
+        ranked_lists += [[doc for doc, _ in hits] for hits in lexical.values()]
+        weights = [1.0] * len(dense) + [self.lexical_weight] * len(lexical)
+        docs = []
+        for doc, score in reciprocal_rank_fusion(ranked_lists, self.rrf_k, weights):
+            doc.metadata["retrieval_score"] = score
+            docs.append(doc)
+        return dedupe(docs)[:self.k]
+
+    def lexical_only(self, lexical):
+        ranked = reciprocal_rank_fusion([[doc for doc, _ in hits] for hits in lexical.values()], self.rrf_k)
+        return dedupe([doc for doc, _ in ranked])[:self.k]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        lexical, confident = self.lexical_search(query)
+        if confident and self.known_vector(query) is None:
+            return self.lexical_only(lexical)
+        return self.fuse(lexical, self.search_by_vector(self.embed_query(query)))
+
+    def retrieve_many(self, queries):
+        """Like ``invoke`` per query, but every query the fast path cannot answer is embedded and searched together"""
+        lexical = [self.lexical_search(query) for query in queries]
+        dense_queries = [i for i, (_, confident) in enumerate(lexical) if not confident]
+        dense = dict(zip(dense_queries, self.search_by_vectors(self.embed_many([queries[i] for i in dense_queries]))))
+        return [
+            self.fuse(hits, dense[i]) if i in dense else self.lexical_only(hits)
+            for i, (hits, _) in enumerate(lexical)
+        ]
+
+
+class PrefetchedRetriever(BaseRetriever):
+    """Serves documents already retrieved for a query (see ``retrieve_many``), asking ``base`` for any other"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    base: BaseRetriever
+    documents: dict
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        documents = self.documents.get(query)
+        return list(documents) if documents is not None else self.base.invoke(query)
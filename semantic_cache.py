@@ -0,0 +1,204 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+from cache_store import DEFAULT_DB_PATH
+from mmap_index import index_path
+from retrieval import DEFAULT_INDEXES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS semantic_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    normalized TEXT UNIQUE NOT NULL,
+    question TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    index_fingerprint TEXT NOT NULL
+);
+"""
+# Embeddings of recent misses, kept so neither retrieval nor set() embeds the question again
+PENDING_VECTORS = 256
+
+
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(question.split())
+
+
+def index_fingerprint(index_dirs=DEFAULT_INDEXES):
+    """Content hash of the retrieval indexes that exist, used to expire semantic entries"""
+    digest = hashlib.sha256()
+    for index_dir in index_dirs:
+        path = index_path(index_dir)
+        if not os.path.exists(path):
+            continue
+        digest.update(index_dir.encode())
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class SemanticCache:
+    """Embedding-similarity layer in front of a ResponseCache.
+
+    A question is answered from cache when it matches a stored question
+    exactly, after normalization, or by cosine similarity of its embedding
+    above ``threshold``. Entries are tied to the fingerprint of the retrieval
+    indexes they were answered from and are dropped when any of them changes.
+    """
+
+    def __init__(self, embeddings, response_cache, threshold=0.92, index_dirs=DEFAULT_INDEXES, db_path=DEFAULT_DB_PATH):
+        self.embeddings = embeddings
+        self.response_cache = response_cache
+        self.threshold = threshold
+        self.fingerprint = index_fingerprint(index_dirs)
+        self.stats = {"exact_hits": 0, "normalized_hits": 0, "semantic_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.executescript(SCHEMA)
+        self._conn.execute("DELETE FROM semantic_entries WHERE index_fingerprint != ?", (self.fingerprint,))
+        self._index = None
+        self._questions = []
+        self._by_normalized = {}
+        self._last_id = 0
+        self._pending = OrderedDict()
+        self._refresh()
+
+    def _refresh(self):
+        """Pull entries written since the last refresh, including other processes' writes"""
+        rows = self._conn.execute(
+            "SELECT id, normalized, question, vector FROM semantic_entries WHERE id > ? AND index_fingerprint = ? ORDER BY id",
+            (self._last_id, self.fingerprint),
+        ).fetchall()
+        for row_id, normalized, question, vector in rows:
+            self._append(normalized, question, np.frombuffer(vector, dtype="float32"))
+            self._last_id = row_id
+
+    def _append(self, normalized, question, vector):
+        if normalized in self._by_normalized:
+            return
+        if self._index is None:
+            self._index = faiss.IndexFlatIP(len(vector))
+        self._index.add(vector.reshape(1, -1))
+        self._questions.append(question)
+        self._by_normalized[normalized] = question
+
+    def _embed(self, normalized):
+        return np.asarray(self.embeddings.embed_query(normalized), dtype="float32")
+
+    @staticmethod
+    def _unit(vector):
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def query_vector(self, question):
+        """The embedding of ``question`` if a recent miss already paid for it, else None.
+
+        Retrievers take it as ``query_vectors`` so a miss costs one embedding
+        call, not one for the lookup and another for retrieval.
+        """
+        with self._lock:
+            vector = self._pending.get(normalize_question(question))
+        return None if vector is None else vector.tolist()
+
+    def get(self, question):
+        response = self.response_cache.get(question)
+        if response is not None:
+            self.stats["exact_hits"] += 1
+            return response
+
+        normalized = normalize_question(question)
+        with self._lock:
+            self._refresh()
+            match = self._by_normalized.get(normalized)
+        if match is not None:
+            response = self.response_cache.get(match)
+            if response is not None:
+                self.stats["normalized_hits"] += 1
+                return response
+
+        match = None
+        vector = self._embed(normalized)
+        with self._lock:
+            if self._index is not None and self._index.ntotal:
+                scores, ids = self._index.search(self._unit(vector).reshape(1, -1), 1)
+                if scores[0][0] >= self.threshold:
+                    match = self._questions[ids[0][0]]
+        if match is not None:
+            response = self.response_cache.get(match)
+            if response is not None:
+                self.stats["semantic_hits"] += 1
+                return response
+
+        self.stats["misses"] += 1
+        with self._lock:
+            self._pending[normalized] = vector
+            self._pending.move_to_end(normalized)
+            while len(self._pending) > PENDING_VECTORS:
+                self._pending.popitem(last=False)
+        return None
+
+    def embed_many(self, questions):
+        """Embeddings for ``set(..., vector=)`` of many questions, in one request"""
+        normalized = [normalize_question(question) for question in questions]
+        return [np.asarray(vector, dtype="float32") for vector in self.embeddings.embed_documents(normalized)] \
+            if normalized else []
+
+    def set(self, question, response, profile=None, vector=None):
+        """Store an answer; ``vector`` (from ``embed_many``) saves embedding a question that never missed"""
+        self.response_cache.set(question, response, fingerprint=self.fingerprint, profile=profile)
+        normalized = normalize_question(question)
+        with self._lock:
+            pending = self._pending.pop(normalized, None)
+        if vector is None:
+            vector = pending if pending is not None else self._embed(normalized)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO semantic_entries (normalized, question, vector, index_fingerprint) VALUES (?, ?, ?, ?)",
+                (normalized, question, self._unit(vector).tobytes(), self.fingerprint),
+            )
+            self._refresh()
+
+    def hit_rate(self):
+        total = sum(self.stats.values())
+        return (total - self.stats["misses"]) / total if total else 0.0
+
+    def invalidate(self):
+        """Forget every semantic entry, e.g. after an index is rebuilt"""
+        with self._lock:
+            self._conn.execute("DELETE FROM semantic_entries")
+            self._index = None
+            self._questions = []
+            self._by_normalized = {}
+            self._pending.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or reset the semantic response cache")
+    parser.add_argument("command", choices=["stats", "invalidate"])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--indexes", nargs="+", default=list(DEFAULT_INDEXES))
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    conn.executescript(SCHEMA)
+    if args.command == "invalidate":
+        conn.execute("DELETE FROM semantic_entries")
+        conn.commit()
+        print("Semantic cache cleared")
+    fingerprint = index_fingerprint(args.indexes)
+    current, stale = conn.execute(
+        "SELECT SUM(index_fingerprint = ?), SUM(index_fingerprint != ?) FROM semantic_entries",
+        (fingerprint, fingerprint),
+    ).fetchone()
+    print(f"{current or 0} semantic entries for the current {', '.join(args.indexes)}, {stale or 0} stale")
+
+if __name__ == "__main__":
+    main()
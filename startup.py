@@ -0,0 +1,92 @@
+"""Lazy imports, background warmup and cold-start timings for the apps.
+
+    python startup.py          # fresh-interpreter import times, eager vs lazy app imports
+"""
+import argparse
+import importlib
+import subprocess
+import sys
+import threading
+import time
+
+from tracing import METRICS
+
+# Imported by the apps' script body on every cold start
+APP_IMPORTS = ("streamlit", "chat_client", "feedback_store", "streaming", "tracing", "validation")
+# Deferred until a question is asked, a PDF is requested or an answer is read aloud
+DEFERRED_IMPORTS = ("reportlab.platypus", "chat_engine", "tts")
+HEAVY_MODULES = ("streamlit", "reportlab.platypus", "boto3", "faiss", "langchain_aws", "langchain_classic.chains", "chat_engine")
+
+
+def record_startup(phase, seconds):
+    METRICS.set("chatbot_startup_seconds", seconds, help="Cold start time per phase", phase=phase)
+
+
+def timed_import(name):
+    """Import ``name``, recording how long a first import took"""
+    if name in sys.modules:
+        return sys.modules[name]
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    record_startup(f"import:{name}", time.perf_counter() - started)
+    return module
+
+
+class Warmup:
+    """Builds a resource on a daemon thread as soon as it is created; ``get`` waits for it"""
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.value = None
+        self.error = None
+        self.seconds = None
+        self._done = threading.Event()
+        threading.Thread(target=self._run, name=f"warmup-{name}", daemon=True).start()
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            self.value = self.factory()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.seconds = time.perf_counter() - started
+            record_startup(f"warmup:{self.name}", self.seconds)
+            self._done.set()
+            print(f"[startup] {self.name} {'failed' if self.error else 'ready'} in {self.seconds:.2f}s", file=sys.stderr)
+
+    def ready(self):
+        return self._done.is_set()
+
+    def get(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"{self.name} is still warming up")
+        if self.error:
+            raise self.error
+        return self.value
+
+
+def _import_seconds(modules):
+    code = f"import time; t = time.perf_counter(); import {', '.join(modules)}; print(time.perf_counter() - t)"
+    return float(subprocess.run([sys.executable, "-W", "ignore", "-c", code], capture_output=True, text=True, check=True).stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import times in fresh interpreters")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    def best(modules):
+        return min(_import_seconds(modules) for _ in range(args.repeat))
+
+    print("module                         import ms")
+    for name in HEAVY_MODULES:
+        print(f"{name:<30}{best([name]) * 1000:>10.0f}")
+    lazy = best(APP_IMPORTS)
+    eager = best(APP_IMPORTS + DEFERRED_IMPORTS)
+    print(f"app script imports, eager     {eager * 1000:>10.0f}")
+    print(f"app script imports, lazy      {lazy * 1000:>10.0f}  ({eager / lazy:.1f}x faster first render)")
+
+if __name__ == "__main__":
+    main()
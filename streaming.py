@@ -0,0 +1,52 @@
+from langchain_core.callbacks import BaseCallbackHandler
+
+ANSWER_TAG = "answer"
+CURSOR = "▌"
+
+
+class TokenForwarder(BaseCallbackHandler):
+    """Pass answer tokens to ``on_token`` as the model produces them.
+
+    Only runs tagged ``ANSWER_TAG`` are forwarded, so the question-condensing
+    LLM call is never shown.
+    """
+
+    def __init__(self, on_token):
+        self.on_token = on_token
+
+    def on_llm_new_token(self, token, *, tags=None, **kwargs):
+        if ANSWER_TAG in (tags or []):
+            self.on_token(token)
+
+
+class StreamToPlaceholder:
+    """Render streamed answer tokens into a Streamlit placeholder.
+
+    Tokens go through the profile's ``Guardrail`` incrementally: only text it
+    has released is shown (stray phone numbers already rewritten), and once
+    it blocks the response rendering stops, leaving the final validation to
+    replace the text when generation completes.
+    """
+
+    def __init__(self, placeholder, guardrail):
+        self.placeholder = placeholder
+        self.guard = guardrail.stream()
+
+    @property
+    def text(self):
+        return self.guard.text
+
+    @property
+    def released(self):
+        return self.guard.released
+
+    @property
+    def blocked(self):
+        return self.guard.blocked
+
+    def write(self, token):
+        was_blocked = self.guard.blocked
+        self.guard.feed(token)
+        if was_blocked:
+            return
+        self.placeholder.markdown(CURSOR if self.guard.blocked else self.guard.released + CURSOR)
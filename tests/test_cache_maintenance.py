@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from cache_maintenance import CacheMaintainer
+from cache_store import ResponseCache
+
+
+class FakeEngine:
+    """Answers with the profile name and records every regeneration"""
+
+    def __init__(self, db_path, fingerprint="new", during=None):
+        self.cache = SimpleNamespace(response_cache=ResponseCache(db_path), fingerprint=fingerprint)
+        self.calls = []
+        self.during = during
+
+    def regenerate(self, question, profile="support"):
+        self.calls.append((question, profile))
+        if self.during:
+            self.during()
+        self.cache.response_cache.set(question, f"{profile} answer", self.cache.fingerprint, profile)
+
+
+def test_entries_are_regenerated_once_with_their_own_profile(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    seed = ResponseCache(db_path)
+    seed.set("How do I activate my phone?", "old", fingerprint="old", profile="popup")
+    seed.set("How do I port my number?", "old", fingerprint="old", profile="support")
+    seed.set("Where is my SIM?", "old", fingerprint="old")  # cached before profiles were recorded
+
+    # A second process's maintainer runs while the first is mid-regeneration
+    other = FakeEngine(db_path)
+    engine = FakeEngine(db_path, during=lambda: CacheMaintainer(other, interval=0).regenerate())
+    CacheMaintainer(engine, interval=0, concurrency=1).regenerate()
+
+    assert sorted(engine.calls + other.calls) == [
+        ("How do I activate my phone?", "popup"),
+        ("How do I port my number?", "support"),
+        ("Where is my SIM?", "support"),
+    ]
+    cache = ResponseCache(db_path)
+    assert cache.get("How do I activate my phone?") == "popup answer"
+    assert cache.refresh_candidates("new", 10) == []
+
+
+def test_failed_regeneration_releases_the_claim(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    cache = ResponseCache(db_path)
+    cache.set("How do I activate my phone?", "old", fingerprint="old", profile="support")
+    engine = FakeEngine(db_path)
+    engine.regenerate = lambda question, profile: 1 / 0
+
+    assert CacheMaintainer(engine, interval=0).regenerate(1) == 0
+    assert cache.claim("How do I activate my phone?", "new", 60)
+    assert not cache.claim("How do I activate my phone?", "new", 60)
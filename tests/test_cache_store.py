@@ -0,0 +1,38 @@
+import pytest
+
+from cache_store import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr("cache_store.time.time", lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_ttl_unless_pinned(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.db"), ttl_seconds=60)
+    cache.set("How do I activate my phone?", "Open the app.")
+    cache.set("How do I port my number?", "Call support.")
+    cache.apply_feedback([(1, "Call support.", "like")], pin_likes=1)
+
+    clock[0] += 30
+    assert cache.get("How do I activate my phone?") == "Open the app."
+    clock[0] += 31
+    assert cache.get("How do I activate my phone?") is None
+    assert cache.get("How do I port my number?") == "Call support."
+    assert len(cache) == 1
+
+
+def test_eviction_drops_the_least_recently_read_entry(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_entries=2, memory_entries=0)
+    cache.set("a", "answer a")
+    clock[0] += 1
+    cache.set("b", "answer b")
+    # Reads only move an entry's access time once it is TOUCH_INTERVAL old
+    clock[0] += 120
+    assert cache.get("a") == "answer a"
+    cache.set("c", "answer c")
+
+    assert cache.get("b") is None
+    assert cache.keys() == ["a", "c"]
@@ -0,0 +1,29 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from chat_service import create_app
+
+
+class EchoEngine:
+    def answer(self, session_id, question, profile="support", on_token=None):
+        return {"answer": question, "cached": False, "request_id": session_id}
+
+
+def post(path, **kwargs):
+    async def run():
+        async with TestClient(TestServer(create_app(EchoEngine(), workers=1))) as client:
+            response = await client.post(path, **kwargs)
+            return response.status, await response.text()
+    return asyncio.run(run())
+
+
+def test_malformed_bodies_are_rejected_as_bad_requests():
+    for path in ("/chat", "/chat/stream"):
+        assert post(path, data="{not json")[0] == 400
+        assert post(path, json=["a list"])[0] == 400
+        assert post(path, json={"session_id": "s"})[0] == 400
+        assert post(path, json={"session_id": "s", "question": "Hi", "profile": "nope"})[0] == 400
+
+    status, text = post("/chat", json={"session_id": "s", "question": " Hi "})
+    assert status == 200 and '"answer": "Hi"' in text
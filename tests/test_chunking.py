@@ -0,0 +1,37 @@
+from langchain_core.documents import Document
+
+from chunking import StructureSplitter
+from context_packing import pack, source_reference
+
+URL = "https://www.spectrum.net/support/mobile/activate-your-phone"
+PAGES = [
+    "10/2/24, 3:15 PM Phone Activation\n"
+    "Phone Activation\n"
+    "Before You Activate\n"
+    "1. Make sure your phone is compatible and unlocked before you\n"
+    "start the activation.\n"
+    "2. Keep your account PIN ready.\n"
+    f"{URL} 1/2",
+    "10/2/24, 3:15 PM Phone Activation\n"
+    "Activate Your Phone\n"
+    "1. Insert the Spectrum SIM card and restart the phone.\n"
+    "2. Open the My Spectrum app and follow the steps.\n"
+    f"{URL} 2/2",
+]
+
+
+def test_footer_url_survives_split_and_pack():
+    docs = [Document(page_content=text, metadata={"source": r"Data\Phone activation-byod.pdf", "page": page})
+            for page, text in enumerate(PAGES)]
+    chunks = StructureSplitter(chunk_size=200, min_chunk_size=20).split_documents(docs)
+
+    assert chunks and all(chunk.metadata["url"] == URL for chunk in chunks)
+    assert not any(URL in chunk.page_content for chunk in chunks)
+    packed = pack(chunks, token_budget=500)
+    assert [doc.metadata["reference"] for doc in packed] == [URL]
+    assert packed[0].page_content.startswith(f"Source: {URL}\n")
+
+
+def test_pdfs_without_a_footer_are_referenced_by_file_name():
+    assert source_reference({"source": r"Data\Phone activation-byod.pdf"}) == "Phone activation-byod.pdf"
+    assert source_reference({"source": URL}) == URL
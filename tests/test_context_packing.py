@@ -0,0 +1,45 @@
+from langchain_core.documents import Document
+
+from context_packing import _counter, pack, remove_overlap, rerank
+
+SHARED = "Hold the power button for ten seconds until the logo appears. "
+STEPS = "Insert the SIM card with the notch facing down and close the tray. "
+
+
+def doc(text, source="Data/Phone activation.pdf", page=0):
+    return Document(page_content=text, metadata={"source": source, "page": page})
+
+
+def test_text_repeated_by_a_neighbouring_chunk_is_cut_from_the_later_one():
+    first = doc(STEPS + SHARED)
+    second = doc(SHARED + "Then open the My Spectrum app.")
+    other_source = doc(SHARED + "Then open Settings.", source="Data/Other.pdf")
+
+    kept = remove_overlap([first, second, other_source])
+    assert [d.page_content for d in kept] == [
+        (STEPS + SHARED).strip(), "Then open the My Spectrum app.", (SHARED + "Then open Settings.").strip(),
+    ]
+    # A chunk wholly repeated by a better-ranked one disappears
+    assert len(remove_overlap([first, doc(SHARED)])) == 1
+
+
+def test_rerank_prefers_chunks_covering_the_query():
+    ranked = rerank("insert sim card", [doc("Restart the phone."), doc(STEPS)])
+    assert ranked[0].page_content == STEPS
+    assert ranked[0].metadata["rerank_score"] > ranked[1].metadata["rerank_score"]
+
+
+def test_pack_respects_the_token_budget_and_groups_by_source():
+    # About 75 tokens each, alternating between two sources, best first
+    docs = [doc(f"{STEPS * 4}step {i}", source=f"Data/{'AB'[i % 2]}.pdf", page=i) for i in range(8)]
+    packed = pack(docs, token_budget=200)
+
+    assert sum(_counter.count(d.page_content) for d in packed) <= 200
+    assert [d.metadata["reference"] for d in packed] == ["A.pdf", "B.pdf"]
+    assert [d.metadata["chunks"] for d in packed] == [2, 1]
+    first = packed[0].page_content
+    assert first.startswith("Source: A.pdf\nInsert") and "step 0" in first
+    # The third chunk is cut to the budget left, and nothing after it is taken
+    assert first.endswith(" ...") and "step 2" not in first
+    assert "step 1" in packed[1].page_content
+    assert pack(docs, token_budget=100)[0].metadata["chunks"] == 1
@@ -0,0 +1,106 @@
+import asyncio
+import socket
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from crawler import Crawler
+
+PAGES = {
+    "/": '<a href="/a">a</a> <a href="/private/p">p</a> <a href="/missing">m</a>',
+    "/a": '<a href="/b">b</a>',
+    "/b": '<a href="/c">c</a>',
+    "/c": "deep",
+}
+
+
+def site(statuses=None):
+    """Test site with ETags; ``statuses`` overrides the response for a path"""
+    statuses = statuses if statuses is not None else {}
+    requests = []
+
+    async def robots(request):
+        requests.append(request.path)
+        return web.Response(text="User-agent: *\nDisallow: /private\n")
+
+    async def page(request):
+        requests.append(request.path)
+        if request.path in statuses:
+            return web.Response(status=statuses[request.path])
+        if request.path not in PAGES:
+            return web.Response(status=404)
+        etag = f'"{request.path}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304)
+        return web.Response(text=f"<html><body>{PAGES[request.path]}</body></html>", content_type="text/html",
+                            headers={"ETag": etag})
+
+    app = web.Application()
+    app.router.add_get("/robots.txt", robots)
+    app.router.add_get("/{tail:.*}", page)
+    return app, requests
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def crawl(app, tmp_path, port=None, **options):
+    """Crawl ``app`` from "/"; pages are keyed by path without the leading slash"""
+    async def run():
+        server = TestServer(app, port=port)
+        await server.start_server()
+        try:
+            crawler = Crawler(url_filter=lambda url: True, delay=0, cache_dir=str(tmp_path / "cache"), **options)
+            pages = await crawler.crawl([str(server.make_url("/"))])
+        finally:
+            await server.close()
+        return crawler, {page.url.split(":", 2)[2].split("/", 1)[1]: page for page in pages}
+
+    return asyncio.run(run())
+
+
+def test_depth_limit(tmp_path):
+    app, _ = site()
+    _, pages = crawl(app, tmp_path, max_depth=2)
+    assert set(pages) == {"", "a", "b"}
+    assert pages["b"].depth == 2
+
+
+def test_robots_disallow_and_missing_pages_are_gone(tmp_path):
+    app, requests = site()
+    crawler, _ = crawl(app, tmp_path, max_depth=1)
+    assert "/private/p" not in requests
+    assert requests.count("/robots.txt") == 1
+    assert {url.split("/", 3)[3] for url in crawler.gone} == {"private/p", "missing"}
+    assert crawler.stats["robots_blocked"] == 1
+    assert crawler.stats["gone"] == 1
+
+
+def test_not_modified_serves_cached_copy(tmp_path):
+    port = free_port()
+    crawl(site()[0], tmp_path, port, max_depth=1)
+    crawler, pages = crawl(site()[0], tmp_path, port, max_depth=1)
+    assert crawler.stats["not_modified"] == 2
+    assert crawler.stats["fetched"] == 0
+    assert pages["a"].from_cache and "/b" in pages["a"].html
+
+
+def test_throttled_page_falls_back_to_cache(tmp_path):
+    port = free_port()
+    crawl(site()[0], tmp_path, port, max_depth=1)
+    crawler, pages = crawl(site({"/a": 429, "/": 503})[0], tmp_path, port, max_depth=1)
+    assert set(pages) == {"", "a"}
+    assert pages["a"].from_cache
+    assert crawler.stats["from_cache"] == 2
+    assert {url.split("/", 3)[3] for url in crawler.gone} == {"private/p", "missing"}
+
+
+def test_throttled_page_without_cache_is_not_gone(tmp_path):
+    app, _ = site({"/a": 429})
+    crawler, pages = crawl(app, tmp_path, max_depth=1)
+    assert "a" not in pages
+    assert not any(url.endswith("/a") for url in crawler.gone)
+    assert crawler.stats["errors"] == 1
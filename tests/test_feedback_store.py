@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from feedback_store import analyze, cluster_questions, wilson_lower_bound
+
+
+def test_wilson_bound_ranks_evidence_above_a_stray_dislike():
+    assert wilson_lower_bound(0, 0) == 0.0
+    assert wilson_lower_bound(0, 10) == pytest.approx(0.0)
+    assert wilson_lower_bound(1, 1) < wilson_lower_bound(8, 10) < wilson_lower_bound(80, 100)
+    assert wilson_lower_bound(8, 10) < 0.8
+
+
+def test_paraphrases_share_a_cluster_labelled_by_the_most_asked():
+    questions = ["How do I activate my phone?"] * 2 + [
+        "How do I activate my new phone?",
+        "Activate phone",
+        "Where is my SIM card?",
+    ]
+    labels = cluster_questions(questions)
+    assert labels["How do I activate my new phone?"] == "How do I activate my phone?"
+    assert labels["Activate phone"] == "How do I activate my phone?"
+    assert labels["Where is my SIM card?"] == "Where is my SIM card?"
+    # A strict threshold keeps the paraphrase apart
+    assert cluster_questions(questions, threshold=1.0)["How do I activate my new phone?"] == \
+        "How do I activate my new phone?"
+
+
+def test_report_orders_clusters_and_sources_worst_first(tmp_path):
+    log_path = tmp_path / "traces.jsonl"
+    log_path.write_text("\n".join(json.dumps(record) for record in [
+        {"request_id": "a", "question": "Activate phone", "sources": ["C:\\docs\\activation.pdf"]},
+        {"request_id": "b", "question": "Where is my SIM card?", "sources": ["https://example.com/sim"]},
+    ]) + "\n")
+    rows = (
+        [{"question": "Activate phone", "feedback": "dislike", "request_id": "a"}] * 8
+        + [{"question": "Activate phone", "feedback": "like", "request_id": "a"}] * 2
+        + [{"question": "Where is my SIM card?", "feedback": "dislike", "request_id": "b"}]
+        + [{"question": "Port my number", "feedback": "like", "request_id": "c"}]
+    )
+    report = analyze(rows, str(log_path))
+
+    assert report["ratings"] == 12 and report["unattributed"] == 1
+    assert [row["name"] for row in report["clusters"]] == [
+        "Activate phone", "Where is my SIM card?", "Port my number"]
+    assert [row["name"] for row in report["sources"]] == ["activation.pdf", "https://example.com/sim"]
+    assert report["clusters"][0]["dislikes"] == 8
@@ -0,0 +1,83 @@
+import time
+
+from history import SUMMARY_PREFIX, TokenBudgetMemory, TokenCounter, approximate_tokens
+
+
+class FakeBedrock:
+    custom_get_token_ids = None
+
+    def __init__(self, provider):
+        self.provider = provider
+
+    def _get_provider(self):
+        return self.provider
+
+    def get_num_tokens(self, text):
+        return 999
+
+
+def test_only_a_models_own_tokenizer_replaces_the_estimate(monkeypatch):
+    monkeypatch.setattr("langchain_aws.utils.anthropic_tokens_supported", lambda: True)
+    assert TokenCounter(FakeBedrock("meta")).count("Open the app") == approximate_tokens("Open the app")
+    assert TokenCounter(FakeBedrock("anthropic")).count("Open the app") == 999
+
+    monkeypatch.setattr("langchain_aws.utils.anthropic_tokens_supported", lambda: False)
+    assert TokenCounter(FakeBedrock("anthropic")).count("Open the app") == approximate_tokens("Open the app")
+
+
+def ask(memory, turn, answer_words=20):
+    memory.save_context({"question": f"What about question {turn}?"}, {"answer": f"answer{turn} " * answer_words})
+
+
+def settled(memory):
+    """The memory once its background summary has caught up"""
+    deadline = time.monotonic() + 5
+    while (memory._summarizing or memory._pending) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return memory
+
+
+def test_window_keeps_the_last_three_turns_within_the_token_budget():
+    memory = TokenBudgetMemory(max_tokens=600, window_turns=3)
+    for turn in range(3):
+        ask(memory, turn, answer_words=40)
+    window = settled(memory).window()
+    assert memory.summary == ""
+    assert [message.type for message in window] == ["human", "ai"] * 3
+
+    # Long answers are cut to message_tokens rather than dropped
+    ask(memory, 3, answer_words=300)
+    ask(memory, 4, answer_words=300)
+    window = settled(memory).window()
+    assert memory.counter.count_messages(window) <= 600
+    assert [message.content for message in window[1::2]] == [f"What about question {turn}?" for turn in (2, 3, 4)]
+    assert window[-1].content.endswith(" ...")
+    assert memory.counter.count(window[-1].content) <= memory.message_tokens
+
+    # Past the budget the oldest messages give way first
+    memory.max_tokens = 300
+    window = memory.window()
+    assert memory.counter.count_messages(window) <= 300
+    assert window[-2].content == "What about question 4?" and len(window) < 7
+
+
+def test_older_turns_roll_into_the_summary():
+    memory = TokenBudgetMemory(max_tokens=600, window_turns=3)
+    for turn in range(5):
+        ask(memory, turn)
+    settled(memory)
+    assert memory.summary == "What about question 1?; What about question 0?"
+
+    ask(memory, 5)
+    window = settled(memory).window()
+    assert memory.summary == "What about question 2?; What about question 1?; What about question 0?"
+    assert window[0].content == SUMMARY_PREFIX + memory.summary
+    assert [message.content for message in window[1::2]] == [f"What about question {turn}?" for turn in (3, 4, 5)]
+    assert memory.counter.count_messages(window) <= 600
+
+
+def test_self_contained_questions_load_no_history():
+    memory = TokenBudgetMemory()
+    ask(memory, 0)
+    assert memory.load_memory_variables({"question": "How do I activate my new iPhone?"}) == {"chat_history": []}
+    assert len(memory.load_memory_variables({"question": "What about the other one?"})["chat_history"]) == 2
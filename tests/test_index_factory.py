@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from index_factory import build_index, default_pq_m, flat_fingerprint, load_ann_index, write_ann_index
+from mmap_index import synthetic_index
+
+SPEC = {"type": "flat", "storage": "fp16"}
+
+
+def test_ann_copy_of_an_older_generation_is_not_used(tmp_path):
+    index_dir = str(tmp_path / "index")
+    synthetic_index(index_dir, 100, 16)
+    write_ann_index(index_dir, SPEC)
+    assert load_ann_index(index_dir, 100, flat_fingerprint(index_dir)) is not None
+
+    # Same vector count, new generation: the copy no longer matches
+    synthetic_index(index_dir, 100, 16)
+    assert load_ann_index(index_dir, 100, flat_fingerprint(index_dir)) is None
+
+    write_ann_index(index_dir, SPEC)
+    assert load_ann_index(index_dir, 100, flat_fingerprint(index_dir)) is not None
+
+
+def test_ivfpq_without_a_dividing_sub_quantizer_falls_back_to_flat():
+    assert default_pq_m(31) is None
+    vectors = np.random.default_rng(0).random((2500, 31), dtype="float32")
+    with pytest.warns(UserWarning, match="flat index instead"):
+        index = build_index(vectors, {"type": "ivfpq"})
+    assert index.ntotal == 2500 and not hasattr(index, "nprobe")
@@ -0,0 +1,95 @@
+import os
+import time
+
+from langchain_classic.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from benchmark import StubEmbeddings
+from embedding_cache import EmbeddingCache, text_hash
+from ingest import update_index
+from mmap_index import GENERATIONS_DIR, STAGING_GRACE_SECONDS, current_dir, current_generation, load_index
+from retrieval import load_indexes
+
+PAGES = {
+    "https://example.com/a": "Restart the phone by holding the power button for ten seconds.",
+    "https://example.com/b": "Insert the SIM card with the notch facing down and close the tray.",
+}
+
+
+def build(index_dir, cache, pages, keep=()):
+    return update_index(
+        str(index_dir),
+        {url: text_hash(text) for url, text in pages.items()},
+        lambda keys: [Document(page_content=pages[key], metadata={"source": key}) for key in keys],
+        RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=0),
+        StubEmbeddings(size=32, latency=0),
+        "stub",
+        cache,
+        keep=keep,
+    )
+
+
+def sources(index_dir):
+    store = load_index(str(index_dir), StubEmbeddings(size=32, latency=0))
+    return sorted(store.docstore.search(doc_id).metadata["source"] for doc_id in store.index_to_docstore_id.values())
+
+
+def test_kept_sources_survive_a_partial_crawl(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.db"))
+    build(tmp_path / "index", cache, PAGES)
+    partial = {"https://example.com/a": PAGES["https://example.com/a"]}
+
+    _, changed, removed = build(tmp_path / "index", cache, partial, keep=["https://example.com/b"])
+    assert (changed, removed) == ([], [])
+    assert sources(tmp_path / "index") == sorted(PAGES)
+
+    _, _, removed = build(tmp_path / "index", cache, partial)
+    assert removed == ["https://example.com/b"]
+    assert sources(tmp_path / "index") == ["https://example.com/a"]
+
+
+def test_update_publishes_a_new_generation_beside_the_mapped_one(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.db"))
+    index_dir = tmp_path / "index"
+    build(index_dir, cache, {"https://example.com/a": PAGES["https://example.com/a"]})
+    generation = current_generation(str(index_dir))
+    live = load_index(str(index_dir), StubEmbeddings(size=32, latency=0))
+
+    build(index_dir, cache, PAGES)
+    assert current_generation(str(index_dir)) != generation
+    # The mapped vectors and the docstore the live store opened still belong together
+    query = StubEmbeddings(size=32, latency=0).embed_query("restart the phone")
+    assert [doc.metadata["source"] for doc in live.similarity_search_by_vector(query, k=5)] == ["https://example.com/a"]
+    assert sources(index_dir) == sorted(PAGES)
+    # The notebook's FAISS.load_local copy follows the current generation
+    assert FAISS.load_local(str(index_dir), StubEmbeddings(size=32, latency=0),
+                            allow_dangerous_deserialization=True).index.ntotal == 2
+
+
+def test_bm25_is_published_in_the_generation(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.db"))
+    index_dir = tmp_path / "index"
+    build(index_dir, cache, {"https://example.com/a": PAGES["https://example.com/a"]})
+    build(index_dir, cache, PAGES)
+
+    assert not (index_dir / "bm25.json").exists()
+    assert os.path.exists(os.path.join(current_dir(str(index_dir)), "bm25.json"))
+    stores, lexical = load_indexes(StubEmbeddings(size=32, latency=0), [str(index_dir)], ann=False)
+    store = stores[str(index_dir)]
+    assert sorted(lexical[str(index_dir)].ids) == sorted(store.index_to_docstore_id.values())
+
+
+def test_publish_leaves_other_publishers_staging_alone(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.db"))
+    index_dir = tmp_path / "index"
+    build(index_dir, cache, {"https://example.com/a": PAGES["https://example.com/a"]})
+    root = index_dir / GENERATIONS_DIR
+    writing = root / f"{time.time_ns():020d}.tmp"
+    abandoned = root / f"{time.time_ns() - int(2 * STAGING_GRACE_SECONDS * 1e9):020d}.tmp"
+    writing.mkdir()
+    abandoned.mkdir()
+
+    build(index_dir, cache, PAGES)
+    assert writing.exists()
+    assert not abandoned.exists()
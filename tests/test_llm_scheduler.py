@@ -0,0 +1,49 @@
+import threading
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from history import TokenBudgetMemory
+from llm_scheduler import LLMScheduler
+
+
+def test_joiner_tokens_run_on_the_joiners_thread():
+    scheduler = LLMScheduler()
+    started, joined, release = threading.Event(), threading.Event(), threading.Event()
+    seen = {}
+
+    def call(emit):
+        emit("Hello")
+        started.set()
+        release.wait()
+        emit(" world")
+        return "Hello world"
+
+    def ask(name):
+        def on_token(token):
+            seen.setdefault(name, []).append((token, threading.current_thread().name))
+            if name == "joiner":
+                joined.set()
+        seen[name + "_result"] = scheduler.run(name, ("support", "hi", ""), call, on_token)
+
+    leader = threading.Thread(target=ask, args=("leader",), name="leader")
+    leader.start()
+    started.wait()
+    joiner = threading.Thread(target=ask, args=("joiner",), name="joiner")
+    joiner.start()
+    joined.wait()
+    release.set()
+    leader.join()
+    joiner.join()
+
+    assert seen["leader_result"] == ("Hello world", False)
+    assert seen["joiner_result"] == ("Hello world", True)
+    assert seen["leader"] == [("Hello", "leader"), (" world", "leader")]
+    assert seen["joiner"] == [("Hello", "joiner"), (" world", "joiner")]
+
+
+def test_history_fingerprint_separates_follow_ups():
+    first, second = TokenBudgetMemory(), TokenBudgetMemory()
+    first.chat_memory.messages = [HumanMessage(content="I have an iPhone 15"), AIMessage(content="Great.")]
+    second.chat_memory.messages = [HumanMessage(content="I have a Galaxy S24"), AIMessage(content="Great.")]
+    assert first.history_fingerprint("how do I reset it?") != second.history_fingerprint("how do I reset it?")
+    assert TokenBudgetMemory().history_fingerprint("how do I reset it?") == ""
@@ -0,0 +1,81 @@
+from langchain_classic.vectorstores import FAISS
+
+from benchmark import StubChatModel, StubEmbeddings
+from cache_store import ResponseCache
+from mmap_index import synthetic_index
+from pregenerate import Pregenerator
+from retrieval import MultiIndexRetriever
+from semantic_cache import SemanticCache
+from streaming import ANSWER_TAG
+
+QUESTIONS = ["How do I activate my phone?", "How do I port my number?", "Where is my SIM?"]
+
+
+class CountingEmbeddings(StubEmbeddings):
+    """Records the size of every embedding request"""
+
+    def __init__(self):
+        super().__init__(size=32, latency=0)
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls.append(1)
+        return super().embed_query(text)
+
+
+def pregenerator(tmp_path, ttl_seconds=None):
+    db_path = str(tmp_path / "cache.db")
+    cache = SemanticCache(
+        CountingEmbeddings(), ResponseCache(db_path, ttl_seconds=ttl_seconds),
+        index_dirs=[str(tmp_path / "index")], db_path=db_path,
+    )
+    return Pregenerator({}, cache.embeddings, None, None, None, cache)
+
+
+def test_an_interrupted_run_resumes_with_the_unanswered_questions(tmp_path):
+    synthetic_index(str(tmp_path / "index"), 10, 8)
+    first = pregenerator(tmp_path)
+    assert first.pending(QUESTIONS) == QUESTIONS
+    first.cache.set(QUESTIONS[0], "Open the app.", "support")
+
+    # A new process picks up where the first one stopped
+    resumed = pregenerator(tmp_path)
+    assert resumed.pending(QUESTIONS) == QUESTIONS[1:]
+    assert resumed.pending(QUESTIONS, force=True) == QUESTIONS
+
+
+def test_answers_from_another_index_or_past_ttl_are_not_fresh(tmp_path, monkeypatch):
+    synthetic_index(str(tmp_path / "index"), 10, 8)
+    pregen = pregenerator(tmp_path, ttl_seconds=3600)
+    monkeypatch.setattr("cache_store.time.time", lambda: 1_000_000.0)
+    pregen.cache.set(QUESTIONS[1], "Call support.", "support")
+    monkeypatch.setattr("cache_store.time.time", lambda: 1_007_200.0)
+    pregen.cache.set(QUESTIONS[0], "Open the app.", "support")
+    assert pregen.pending(QUESTIONS) == QUESTIONS[1:]
+    monkeypatch.undo()
+
+    synthetic_index(str(tmp_path / "index"), 20, 8)
+    assert pregenerator(tmp_path, ttl_seconds=3600).pending(QUESTIONS) == QUESTIONS
+
+
+def test_a_run_embeds_each_batch_once(tmp_path):
+    synthetic_index(str(tmp_path / "index"), 10, 8)
+    pregen = pregenerator(tmp_path)
+    embeddings = pregen.cache.embeddings
+    pregen.retriever = MultiIndexRetriever(
+        vectorstores={"faiss_index": FAISS.from_texts(["Open the My Spectrum app and tap Activate."], embeddings)},
+        embeddings=embeddings, k=1,
+    )
+    pregen.answer_llm = StubChatModel(streaming=True, tags=[ANSWER_TAG], first_token_latency=0, tokens_per_second=1e6)
+    pregen.condense_llm = StubChatModel(first_token_latency=0, tokens_per_second=1e6)
+    embeddings.calls.clear()
+
+    stats = pregen.run(QUESTIONS)
+
+    assert stats["done"] == len(QUESTIONS) and stats["failed"] == 0
+    assert embeddings.calls == [len(QUESTIONS), len(QUESTIONS)]  # retrieval, then the semantic cache
+    assert pregenerator(tmp_path).pending(QUESTIONS) == []
@@ -0,0 +1,79 @@
+from langchain_classic.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from benchmark import StubEmbeddings
+from lexical_index import BM25Index, tokenize
+from retrieval import HybridRetriever
+
+TEXTS = [
+    "Insert the SIM card with the notch facing down.",
+    "Transfer an eSIM to a new iPhone from Settings.",
+    "Restart the phone by holding the power button.",
+]
+
+
+class CountingEmbeddings(StubEmbeddings):
+    def __init__(self):
+        super().__init__(size=32, latency=0)
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+
+class FixedLexical:
+    """A lexical index returning fixed scores, every query term matched by the top hit unless ``partial``"""
+
+    def __init__(self, scores, partial=False):
+        self.scores = scores
+        self.partial = partial
+
+    def search(self, query, k=10):
+        terms = set(tokenize(query))
+        top = list(enumerate(self.scores))[:k]
+        matched = {0: set(list(terms)[:1]) if self.partial else terms}
+        return top, terms, matched
+
+    def document(self, doc_idx, score=None):
+        return Document(page_content=TEXTS[doc_idx], metadata={"lexical_score": score})
+
+
+def retriever(lexical):
+    embeddings = CountingEmbeddings()
+    return HybridRetriever(
+        vectorstores={"faiss_index": FAISS.from_texts(TEXTS, embeddings)}, embeddings=embeddings,
+        lexical_indexes={"faiss_index": lexical}, k=2,
+    )
+
+
+def test_fast_path_needs_every_term_and_a_clear_margin():
+    cases = [
+        (FixedLexical([2.6, 2.0]), True),                 # 1.3x the runner-up
+        (FixedLexical([2.5, 2.0]), True),                 # exactly the 1.25 margin
+        (FixedLexical([2.4, 2.0]), False),                # 1.2x
+        (FixedLexical([2.6]), True),                      # no runner-up at all
+        (FixedLexical([2.6, 2.0], partial=True), False),  # the top hit misses a query term
+    ]
+    for lexical, fast in cases:
+        hybrid = retriever(lexical)
+        docs = hybrid.invoke("insert sim card")
+        assert (hybrid.embeddings.calls == 0) == fast, lexical.scores
+        assert docs[0].page_content == TEXTS[0]
+
+    # One content word is too little to trust
+    hybrid = retriever(FixedLexical([2.6, 2.0]))
+    hybrid.invoke("sim")
+    assert hybrid.embeddings.calls == 1
+
+
+def test_bm25_ranks_rare_terms_and_normalizes_tokens():
+    bm25 = BM25Index(list(range(len(TEXTS))), TEXTS, [{}] * len(TEXTS))
+    assert tokenize("How do I transfer my e-SIM cards?") == ["transfer", "esim", "card"]
+
+    top, terms, matched = bm25.search("transfer e-SIM")
+    assert top[0][0] == 1 and matched[1] == terms == {"transfer", "esim"}
+    # "phone" and "the" are everywhere or stopwords; "power" singles out one chunk
+    top, _, _ = bm25.search("the phone power")
+    assert top[0][0] == 2
+    assert bm25.search("voicemail")[0] == []
@@ -0,0 +1,41 @@
+from langchain_classic.vectorstores import FAISS
+
+from benchmark import StubEmbeddings
+from cache_store import ResponseCache
+from retrieval import MultiIndexRetriever
+from semantic_cache import SemanticCache
+
+TEXTS = [
+    "Restart the phone by holding the power button for ten seconds.",
+    "Insert the SIM card with the notch facing down and close the tray.",
+]
+
+
+class CountingEmbeddings(StubEmbeddings):
+    def __init__(self):
+        super().__init__(size=32, latency=0)
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+
+def test_a_miss_is_embedded_once_for_lookup_retrieval_and_store(tmp_path):
+    embeddings = CountingEmbeddings()
+    db_path = str(tmp_path / "cache.db")
+    cache = SemanticCache(embeddings, ResponseCache(db_path), index_dirs=(), db_path=db_path)
+    retriever = MultiIndexRetriever(
+        vectorstores={"faiss_index": FAISS.from_texts(TEXTS, embeddings)}, embeddings=embeddings,
+        query_vectors=cache, k=1,
+    )
+
+    question = "How do I insert the SIM card?"
+    assert cache.get(question) is None
+    docs = retriever.invoke(question)
+    cache.set(question, "Notch down.")
+
+    assert embeddings.calls == 1
+    assert docs[0].page_content == TEXTS[1]
+    assert cache.get("how do I insert the SIM card") == "Notch down."
+    assert retriever.invoke("Something never looked up") and embeddings.calls == 2
@@ -0,0 +1,48 @@
+import json
+import threading
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from chat_engine import ChatEngine
+from llm_scheduler import LLMScheduler
+from streaming import ANSWER_TAG
+from tracing import METRICS, Trace
+
+
+class FailingChain:
+    memory = SimpleNamespace(history_fingerprint=lambda question: "")
+
+    def __call__(self, inputs, callbacks=()):
+        raise TimeoutError("Bedrock did not answer")
+
+
+def test_failed_requests_are_traced(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    engine = object.__new__(ChatEngine)
+    engine.cache = SimpleNamespace(get=lambda question: None)
+    engine.scheduler = LLMScheduler(retries=0)
+    session = SimpleNamespace(chain=FailingChain(), lock=threading.Lock())
+    engine._session = lambda session_id, profile: session
+
+    with pytest.raises(TimeoutError):
+        engine.answer("s1", "How do I activate my phone?")
+
+    with open(tmp_path / "logs" / "requests.jsonl") as f:
+        (record,) = [json.loads(line) for line in f]
+    assert record["error"] == "TimeoutError" and record["cache"] == "miss"
+    assert 'chatbot_request_errors_total{app="support",error="TimeoutError"}' in METRICS.render()
+
+
+def test_failed_llm_and_retriever_runs_close_their_spans(tmp_path):
+    trace = Trace("support", "How do I activate my phone?", log_path=str(tmp_path / "requests.jsonl"))
+    handler = trace.handler()
+    retrieval, llm = uuid.uuid4(), uuid.uuid4()
+    handler.on_retriever_start({}, "activate", run_id=retrieval)
+    handler.on_retriever_error(RuntimeError(), run_id=retrieval)
+    handler.on_chat_model_start({}, [], run_id=llm)
+    handler.on_llm_error(RuntimeError(), run_id=llm, tags=[ANSWER_TAG])
+
+    assert handler.started == {}
+    assert [span["name"] for span in trace.spans] == ["retrieval", "llm"]
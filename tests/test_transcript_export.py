@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from transcript_export import TEXT_CHUNKS, TITLE, export_bytes, stamp, text_body
+
+MESSAGES = [{"role": "user", "content": "How do I reset my router?"}, {"role": "assistant", "content": "Unplug it <b>first</b>."}]
+
+
+def test_stamped_body_matches_a_full_render():
+    for fmt in TEXT_CHUNKS:
+        generated = datetime(2026, 10, 17, 9, 30)
+        full = "".join(TEXT_CHUNKS[fmt](MESSAGES, TITLE, generated)).encode("utf-8")
+        assert stamp(text_body(MESSAGES, fmt), fmt, generated=generated) == full
+        assert export_bytes(MESSAGES, fmt, generated=generated) == full
+
+
+def test_cached_body_carries_no_timestamp():
+    body = text_body(MESSAGES, "md")
+    assert b"Generated on" not in body
+    assert b"2026-10-18 08:00:00" in stamp(body, "md", generated=datetime(2026, 10, 18, 8))
@@ -0,0 +1,94 @@
+import os
+import time
+
+from tts import AudioCache, SentenceSplitter, StubBackend, Voice, clip_seconds
+
+ANSWER = ("Sure! To activate your phone, open the My Spectrum app. "
+          "Then tap Activate and follow the steps on screen.\n"
+          "- Done.")
+
+
+def test_streamed_text_yields_each_sentence_once():
+    splitter = SentenceSplitter()
+    streamed = []
+    for end in range(1, len(ANSWER) + 1):
+        streamed += splitter.feed(ANSWER[:end])
+    streamed += splitter.finish(ANSWER)
+
+    assert streamed == SentenceSplitter().finish(ANSWER)
+    assert streamed == [
+        "Sure! To activate your phone, open the My Spectrum app.",
+        "Then tap Activate and follow the steps on screen.",
+        "- Done.",
+    ]
+
+
+def test_short_fragments_join_the_next_sentence():
+    splitter = SentenceSplitter(min_chars=24)
+    # A sentence only counts as complete once the whitespace after it has arrived
+    assert splitter.feed("Sure! Open the app") == []
+    assert splitter.feed("Sure! Open the app and tap Activate. ") == ["Sure! Open the app and tap Activate."]
+    assert splitter.finish("Sure! Open the app and tap Activate. Ok.") == ["Ok."]
+
+
+def test_audio_cache_key_covers_backend_voice_and_text(tmp_path):
+    cache = AudioCache(str(tmp_path))
+    backend, other_voice = StubBackend(), StubBackend(voice="other")
+    cache.put(backend, "Open the app.", b"clip")
+
+    assert cache.get(backend, "Open the app.") == b"clip"
+    assert cache.get(other_voice, "Open the app.") is None
+    assert cache.get(backend, "Open the app!") is None
+    assert cache.path(backend, "Open the app.").endswith(".wav")
+
+
+def test_prune_removes_least_recently_used_clips(tmp_path):
+    cache = AudioCache(str(tmp_path))
+    backend = StubBackend()
+    for age, text in enumerate(["newest", "middle", "oldest"]):
+        cache.put(backend, text, b"x" * 100)
+        os.utime(cache.path(backend, text), (1000 - age, 1000 - age))
+
+    assert cache.prune(250) == 1
+    assert cache.get(backend, "oldest") is None
+    assert cache.get(backend, "middle") == cache.get(backend, "newest") == b"x" * 100
+    assert cache.prune(1000) == 0
+
+
+class Slot:
+    def __init__(self, played):
+        self.played = played
+
+    def audio(self, clip, **kwargs):
+        self.played.append(clip)
+
+    def empty(self):
+        return self
+
+
+class Container:
+    def __init__(self):
+        self.played = []
+
+    def empty(self):
+        return Slot(self.played)
+
+
+def test_finish_hands_back_the_rest_of_the_answer_without_waiting_for_playback(tmp_path):
+    voice = Voice(StubBackend(), AudioCache(str(tmp_path)))
+    container = Container()
+    speaker = voice.speaker(container)
+    first = ANSWER.split("\n")[0].split(". ")[0] + ". "
+    speaker.update(first)
+    speaker.clips[0].result()
+    speaker.update(first)
+    assert len(container.played) == 1 and clip_seconds(container.played[0]) == 4.0
+
+    started = time.monotonic()
+    rest = speaker.finish(ANSWER)
+    assert time.monotonic() - started < 1
+    # Most of the playing sentence, then the two sentences after it
+    later = sum(clip_seconds(voice.clip(s)) for s in SentenceSplitter().finish(ANSWER)[1:])
+    assert later + 3 < clip_seconds(rest) <= later + 4
+    assert len(container.played) == 1
+    assert speaker.finish(ANSWER) is None
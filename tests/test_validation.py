@@ -0,0 +1,57 @@
+import pytest
+
+from validation import (
+    ENGLISH_ONLY_MESSAGE, POPUP_GUARDRAIL, QUALITY_ENGLISH_ONLY_MESSAGE, SPECULATIVE_MESSAGE, SUPPORT_GUARDRAIL,
+    _legacy_english, _legacy_quality,
+)
+
+TEXTS = [
+    "Open the My Spectrum app and tap Activate.",
+    "Llame al soporte, señor.",
+    "Dziękuję, the SIM is in the tray.",
+    "You might be able to restart it.",
+    "PERHAPS restart the phone. I THINK that works.",
+    "Call (833) 224-6603 or 833-224-6603 today.",
+    "Call 212-555-0100, (646) 555 0199 or 2125550100 for help.",
+    "Your order 12345678901234 ships soon; call 646.555.0199.",
+    "Call 212-555-0100, it could be faster.",
+    "Maybe call 212-555-0100, señor.",
+    "(833) 224-6603",
+    "2125550100",
+]
+
+
+def splits(text):
+    """The text as one token, character by character, and cut in two at every position"""
+    yield [text]
+    yield list(text)
+    for cut in range(1, len(text)):
+        yield [text[:cut], text[cut:]]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("guardrail, legacy", [
+    (SUPPORT_GUARDRAIL, _legacy_english),
+    (POPUP_GUARDRAIL, lambda text: _legacy_quality(text, "")),
+])
+def test_stream_matches_validate_and_the_legacy_checks(guardrail, legacy, text):
+    expected = legacy(text)
+    assert guardrail.validate(text) == expected
+    blocked = expected in (guardrail.banned_message, guardrail.phrase_message)
+    for tokens in splits(text):
+        stream = guardrail.stream()
+        for token in tokens:
+            stream.feed(token)
+            # Released text is final: an answer that passes only ever grows into the validated one
+            assert blocked or expected.startswith(stream.released), tokens
+        assert stream.finish() == expected, tokens
+
+
+def test_each_rule_applies():
+    assert SUPPORT_GUARDRAIL.validate("Dziękuję") == ENGLISH_ONLY_MESSAGE
+    assert POPUP_GUARDRAIL.validate("Dziękuję") == "Dziękuję"
+    assert POPUP_GUARDRAIL.validate("Llame al soporte, señor, maybe.") == QUALITY_ENGLISH_ONLY_MESSAGE
+    assert POPUP_GUARDRAIL.validate("It is probably fine.") == SPECULATIVE_MESSAGE
+    assert POPUP_GUARDRAIL.validate("Call 212-555-0100.") == "Call (833) 224-6603."
+    assert POPUP_GUARDRAIL.validate("Call 833-224-6603.") == "Call 833-224-6603."
+    assert SUPPORT_GUARDRAIL.validate("Call 212-555-0100.") == "Call 212-555-0100."
@@ -1,11 +1,44 @@
-from openai import OpenAI
-client = OpenAI()
+"""Reads a script aloud into one audio file, a sentence at a time through the answer audio cache.
 
-response = client.audio.speech.create(
-    model="gpt-4o-mini-tts",
-    voice="alloy",
-    input=open("script.txt").read()
-)
+Sentences are synthesized concurrently and cached (see tts.py), so re-running
+after editing the script only synthesizes the sentences that changed.
 
-with open("cathy_john_high_quality.mp3", "wb") as f:
-    f.write(response)
\ No newline at end of file
+    python text-to-speech.py                                   # OpenAI gpt-4o-mini-tts, MP3
+    python text-to-speech.py --backend pyttsx3 --output script.wav
+"""
+import argparse
+import os
+import time
+
+from tts import BACKENDS, DEFAULT_CACHE_DIR, AudioCache, SentenceSplitter, Voice, join_clips, make_backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthesize a script into a single audio file")
+    parser.add_argument("--script", default="script.txt")
+    parser.add_argument("--output", default="cathy_john_high_quality.mp3", help=".mp3 (openai only) or .wav")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="openai")
+    parser.add_argument("--voice", default="alloy", help="OpenAI voice")
+    parser.add_argument("--workers", type=int, default=4, help="sentences synthesized at once")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
+    fmt = os.path.splitext(args.output)[1].lstrip(".").lower()
+    if args.backend == "openai":
+        backend = make_backend("openai", voice=args.voice, format=fmt)
+    elif fmt == "wav":
+        backend = make_backend(args.backend)
+    else:
+        parser.error(f"the {args.backend} backend writes .wav files")
+    voice = Voice(backend, AudioCache(args.cache_dir), args.workers)
+
+    started = time.perf_counter()
+    with open(args.script, 'r') as f:
+        sentences = SentenceSplitter().finish(f.read())
+    clips = [future.result() for future in [voice.submit(sentence) for sentence in sentences]]
+    with open(args.output, 'wb') as f:
+        f.write(join_clips(clips, backend.format))
+    print(f"Wrote {args.output}: {len(sentences)} sentences in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from streaming import ANSWER_TAG
+
+TRACE_LOG = os.path.join("logs", "requests.jsonl")
+METRICS_FILE = "metrics.prom"
+METRICS_FLUSH_SECONDS = 15.0
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+        self.version = 0
+
+    def inc(self, name, amount=1, help="", **labels):
+        with self._lock:
+            self._help.setdefault(name, help)
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + amount
+            self.version += 1
+
+    def set(self, name, value, help="", **labels):
+        with self._lock:
+            self._help.setdefault(name, help)
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+            self.version += 1
+
+    def observe(self, name, value, help="", buckets=DEFAULT_BUCKETS, **labels):
+        with self._lock:
+            self._help.setdefault(name, help)
+            series = self._histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            histogram = series[key]
+            for i, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    histogram["counts"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+            self.version += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(metrics.items()):
+                    lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {histogram['count']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram['sum']}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path=METRICS_FILE):
+        """Atomically write the metrics for a node_exporter-style textfile collector"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with self._write_lock:
+            with open(tmp_path, 'w') as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+
+
+METRICS = MetricsRegistry()
+_log_lock = threading.Lock()
+_server = None
+_flusher = None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = METRICS.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread; later calls in the same process are no-ops"""
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+def start_metrics_flush(path=METRICS_FILE, interval=METRICS_FLUSH_SECONDS):
+    """Rewrite the metrics textfile from a daemon thread every ``interval`` seconds, and at exit.
+
+    The file is only rewritten when a metric changed since the last write,
+    so requests never wait on it. Later calls in the same process are no-ops.
+    """
+    global _flusher
+    if _flusher is not None or not path:
+        return _flusher
+    written = -1
+
+    def flush():
+        nonlocal written
+        version = METRICS.version
+        if version != written:
+            METRICS.write_textfile(path)
+            written = version
+
+    def run():
+        while True:
+            time.sleep(interval)
+            flush()
+
+    _flusher = threading.Thread(target=run, name="metrics-flush", daemon=True)
+    _flusher.start()
+    atexit.register(flush)
+    return _flusher
+
+
+class Trace:
+    """Span timings and attributes for one chat request.
+
+    A request that raised carries the exception's class name in ``error``.
+    ``finish`` appends the trace as one JSON line to ``logs/requests.jsonl``
+    and folds it into the process metrics (written out by
+    ``start_metrics_flush``).
+    """
+
+    def __init__(self, app, question, session_id=None, log_path=TRACE_LOG):
+        self.app = app
+        self.request_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.question = question
+        self.log_path = log_path
+        self.started = time.perf_counter()
+        self.timestamp = time.time()
+        self.spans = []
+        self.attributes = {}
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, started, time.perf_counter())
+
+    def add_span(self, name, started, ended):
+        self.spans.append({"name": name, "start_ms": (started - self.started) * 1000, "duration_ms": (ended - started) * 1000})
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def handler(self):
+        return TracingHandler(self)
+
+    def finish(self):
+        total = time.perf_counter() - self.started
+        record = {
+            "timestamp": self.timestamp,
+            "request_id": self.request_id,
+            "session_id": self.session_id,
+            "app": self.app,
+            "question": self.question,
+            "total_ms": total * 1000,
+            "spans": self.spans,
+            **self.attributes,
+        }
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        with _log_lock:
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+
+        METRICS.inc("chatbot_requests_total", help="Chat requests handled",
+                    app=self.app, cache=self.attributes.get("cache", "none"))
+        METRICS.observe("chatbot_request_seconds", total, help="End-to-end request latency", app=self.app)
+        if "error" in self.attributes:
+            METRICS.inc("chatbot_request_errors_total", help="Chat requests that raised",
+                        app=self.app, error=self.attributes["error"])
+        for span in self.spans:
+            METRICS.observe("chatbot_stage_seconds", span["duration_ms"] / 1000, help="Per-stage latency",
+                            app=self.app, stage=span["name"])
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if self.attributes.get(kind):
+                METRICS.inc("chatbot_tokens_total", self.attributes[kind], help="LLM tokens",
+                            app=self.app, kind=kind)
+        if "ttft_ms" in self.attributes:
+            METRICS.observe("chatbot_time_to_first_token_seconds", self.attributes["ttft_ms"] / 1000,
+                            help="Time from request start to the first streamed answer token", app=self.app)
+        return record
+
+
+def observe_script_run(app, seconds):
+    """Record how long one Streamlit script run took"""
+    METRICS.observe("chatbot_script_run_seconds", seconds, help="Streamlit script run time", app=app)
+
+
+class TracingHandler(BaseCallbackHandler):
+    """Adds retrieval and LLM spans, token counts and time to first token to a Trace"""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.started = {}
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self.started[run_id] = time.perf_counter()
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self.trace.add_span("retrieval", self.started.pop(run_id), time.perf_counter())
+        self.trace.set(retrieved=len(documents), sources=_sources(documents))
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        started = self.started.pop(run_id, None)
+        if started is not None:
+            self.trace.add_span("retrieval", started, time.perf_counter())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.started[run_id] = time.perf_counter()
+
+    def on_llm_new_token(self, token, *, tags=None, **kwargs):
+        if ANSWER_TAG in (tags or []) and "ttft_ms" not in self.trace.attributes:
+            self.trace.set(ttft_ms=(time.perf_counter() - self.trace.started) * 1000)
+
+    def on_llm_end(self, response, *, run_id, tags=None, **kwargs):
+        answer = ANSWER_TAG in (tags or [])
+        self.trace.add_span("llm" if answer else "condense", self.started.pop(run_id), time.perf_counter())
+        usage = _usage(response)
+        if usage:
+            self.trace.set(
+                prompt_tokens=self.trace.attributes.get("prompt_tokens", 0) + usage.get("input_tokens", 0),
+                completion_tokens=self.trace.attributes.get("completion_tokens", 0) + usage.get("output_tokens", 0),
+            )
+
+    def on_llm_error(self, error, *, run_id, tags=None, **kwargs):
+        started = self.started.pop(run_id, None)
+        if started is not None:
+            self.trace.add_span("llm" if ANSWER_TAG in (tags or []) else "condense", started, time.perf_counter())
+
+
+def _sources(documents):
+    """Distinct sources of the retrieved documents, in rank order"""
+    sources = []
+    for doc in documents:
+        source = doc.metadata.get("reference") or doc.metadata.get("source")
+        if source and source not in sources:
+            sources.append(source)
+    return sources
+
+
+def _usage(response):
+    """Token usage reported by the model, if any"""
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            if message is not None and getattr(message, "usage_metadata", None):
+                return message.usage_metadata
+    usage = (response.llm_output or {}).get("usage") or {}
+    if usage:
+        return {"input_tokens": usage.get("prompt_tokens", 0), "output_tokens": usage.get("completion_tokens", 0)}
+    return None
@@ -0,0 +1,332 @@
+"""Chat transcript export: streamed PDF, plus cheap Markdown and HTML.
+
+A transcript is the apps' message list (``{"role", "content"}`` dicts).
+PDF flowables are generated a few messages ahead of reportlab's layout and
+written straight to the output file, so a long session never holds its
+whole story; Markdown and HTML are plain text and skip reportlab entirely.
+Bulk exports read the request log (``logs/requests.jsonl``), one transcript
+per session, and render them in a process pool.
+
+    python transcript_export.py batch --date 2026-10-17 --format pdf --out exports
+    python transcript_export.py bench --turns 500
+"""
+import argparse
+import html
+import io
+import json
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
+
+from tracing import TRACE_LOG
+
+TITLE = "Customer Support Chat History"
+FORMATS = {"pdf": "application/pdf", "md": "text/markdown", "html": "text/html"}
+# Flowables kept ahead of the page being laid out; enough for keep-with-next groups
+LOOKAHEAD = 16
+
+HTML_HEAD = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body{{font-family:Helvetica,Arial,sans-serif;max-width:800px;margin:2rem auto;color:#37474f;line-height:1.5}}
+h1{{text-align:center;font-size:1.6rem}}
+.generated{{text-align:center;color:#78909c}}
+h3{{margin-bottom:.3rem}}
+p{{margin-top:0;white-space:pre-wrap}}
+.answer{{margin-bottom:1.5rem}}
+</style></head><body>
+<h1>{title}</h1>
+<p class="generated">Generated on: {generated}</p>
+"""
+HTML_TAIL = "</body></html>\n"
+
+
+def _generated(generated):
+    return (generated or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _turns(messages):
+    """(heading, content, is_question) per message, questions numbered in order"""
+    number = 0
+    for msg in messages:
+        if msg["role"] == "user":
+            number += 1
+            yield f"Question {number}:", msg["content"], True
+        else:
+            yield "Answer:", msg["content"], False
+
+
+@lru_cache(maxsize=None)
+def pdf_styles():
+    """Paragraph styles, built once per process instead of per export"""
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+
+    styles = getSampleStyleSheet()
+    return {
+        "title": ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=18, spaceAfter=30, alignment=1),
+        "heading": styles['Heading3'],
+        "normal": styles['Normal'],
+    }
+
+
+def _markup(text):
+    # Paragraph parses its text as mini-HTML; model answers are plain text
+    return html.escape(text, quote=False).replace("\n", "<br/>")
+
+
+def iter_flowables(messages, title=TITLE, generated=None):
+    from reportlab.platypus import Paragraph, Spacer
+
+    styles = pdf_styles()
+    yield Paragraph(title, styles["title"])
+    yield Paragraph(f"Generated on: {_generated(generated)}", styles["normal"])
+    yield Spacer(1, 20)
+    for heading, content, is_question in _turns(messages):
+        yield Paragraph(f"<b>{heading}</b>", styles["heading"])
+        yield Paragraph(_markup(content), styles["normal"])
+        yield Spacer(1, 10 if is_question else 20)
+
+
+class StreamedStory(list):
+    """The flowable list ``doc.build`` consumes, refilled from a generator as pages are laid out.
+
+    reportlab checks ``len(story)`` before placing each flowable, so topping
+    up there keeps only ``lookahead`` unplaced flowables alive at a time.
+    """
+
+    def __init__(self, flowables, lookahead=LOOKAHEAD):
+        super().__init__()
+        self._source = iter(flowables)
+        self.lookahead = lookahead
+        self._top_up()
+
+    def _top_up(self):
+        while self._source is not None and list.__len__(self) < self.lookahead:
+            flowable = next(self._source, None)
+            if flowable is None:
+                self._source = None
+            else:
+                self.append(flowable)
+
+    def __len__(self):
+        self._top_up()
+        return list.__len__(self)
+
+
+def write_pdf(messages, out, title=TITLE, generated=None):
+    """Render a transcript as PDF to ``out`` (a path or binary file)"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate
+
+    doc = SimpleDocTemplate(out, pagesize=letter, title=title)
+    doc.build(StreamedStory(iter_flowables(messages, title, generated)))
+
+
+def iter_markdown(messages, title=TITLE, generated=None):
+    yield f"# {title}\n\nGenerated on: {_generated(generated)}\n\n"
+    for heading, content, _ in _turns(messages):
+        yield f"### {heading}\n\n{content}\n\n"
+
+
+def iter_html(messages, title=TITLE, generated=None):
+    yield HTML_HEAD.format(title=html.escape(title), generated=_generated(generated))
+    for heading, content, is_question in _turns(messages):
+        yield f'<h3>{heading}</h3>\n<p class="{"question" if is_question else "answer"}">{html.escape(content)}</p>\n'
+    yield HTML_TAIL
+
+
+def _text_writer(chunks):
+    def write(messages, out, title=TITLE, generated=None):
+        if isinstance(out, (str, os.PathLike)):
+            with open(out, 'wb') as f:
+                return write(messages, f, title, generated)
+        for chunk in chunks(messages, title, generated):
+            out.write(chunk.encode("utf-8"))
+    return write
+
+
+WRITERS = {"pdf": write_pdf, "md": _text_writer(iter_markdown), "html": _text_writer(iter_html)}
+TEXT_CHUNKS = {"md": iter_markdown, "html": iter_html}
+
+
+def text_body(messages, fmt, title=TITLE):
+    """A Markdown or HTML transcript without its timestamped header, which ``stamp`` adds; safe to cache"""
+    chunks = TEXT_CHUNKS[fmt](messages, title)
+    next(chunks)
+    return "".join(chunks).encode("utf-8")
+
+
+def stamp(body, fmt, title=TITLE, generated=None):
+    """``body`` from ``text_body`` behind a header generated at ``generated`` (default: now)"""
+    return next(TEXT_CHUNKS[fmt]([], title, generated)).encode("utf-8") + body
+
+
+def export_bytes(messages, fmt="pdf", title=TITLE, generated=None):
+    """A transcript rendered in memory, for download buttons"""
+    if fmt in TEXT_CHUNKS:
+        return stamp(text_body(messages, fmt, title), fmt, title, generated)
+    buffer = io.BytesIO()
+    write_pdf(messages, buffer, title, generated)
+    return buffer.getvalue()
+
+
+def load_transcripts(log_path=TRACE_LOG, day=None):
+    """Rebuild per-session transcripts from the request log, optionally for one local date.
+
+    Returns ``{session_id: {"app", "started", "messages"}}`` in log order.
+    Requests logged before answers were recorded contribute the question only.
+    """
+    transcripts = {}
+    with open(log_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if day and datetime.fromtimestamp(record["timestamp"]).date() != day:
+                continue
+            session_id = record.get("session_id") or record["request_id"]
+            transcript = transcripts.setdefault(
+                session_id, {"app": record.get("app"), "started": record["timestamp"], "messages": []}
+            )
+            transcript["messages"].append({"role": "user", "content": record["question"]})
+            if record.get("answer") is not None:
+                transcript["messages"].append({"role": "assistant", "content": record["answer"]})
+    return transcripts
+
+
+def _file_name(session_id, transcript, fmt):
+    started = datetime.fromtimestamp(transcript["started"]).strftime('%Y%m%d_%H%M%S')
+    return re.sub(r"[^\w.-]", "_", f"chat_{started}_{transcript['app']}_{session_id}") + f".{fmt}"
+
+
+def _export_one(job):
+    messages, path, fmt = job
+    WRITERS[fmt](messages, path)
+    return path
+
+
+def export_batch(transcripts, out_dir, fmt="pdf", workers=None):
+    """Export every transcript to ``out_dir``; ``workers`` > 1 renders them in a process pool"""
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [
+        (transcript["messages"], os.path.join(out_dir, _file_name(session_id, transcript, fmt)), fmt)
+        for session_id, transcript in transcripts.items()
+    ]
+    if workers == 1 or len(jobs) < 2:
+        return [_export_one(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_export_one, jobs))
+
+
+def synthetic_transcript(turns):
+    question = "How do I move my internet service to a new address without losing my current plan?"
+    answer = ("You can transfer your service online or in the app. Choose a move date, confirm the new "
+              "address is serviceable and keep your equipment until the technician visit is complete. ") * 4
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"{question} ({i + 1})"})
+        messages.append({"role": "assistant", "content": answer})
+    return messages
+
+
+def legacy_pdf(messages):
+    """The apps' original export: fresh styles, full story, whole document in a BytesIO"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=18, spaceAfter=30, alignment=1)
+    story = [
+        Paragraph(TITLE, title_style),
+        Paragraph(f"Generated on: {_generated(None)}", styles['Normal']),
+        Spacer(1, 20),
+    ]
+    for i, msg in enumerate(messages):
+        if msg["role"] == "user":
+            story.append(Paragraph(f"<b>Question {i//2+1}:</b>", styles['Heading3']))
+            story.append(Paragraph(msg["content"], styles['Normal']))
+            story.append(Spacer(1, 10))
+        else:
+            story.append(Paragraph("<b>Answer:</b>", styles['Heading3']))
+            story.append(Paragraph(msg["content"], styles['Normal']))
+            story.append(Spacer(1, 20))
+    doc.build(story)
+    buffer.seek(0)
+    return buffer
+
+
+def _measure(render, repeat):
+    render()  # first call pays imports and style setup
+    started = time.perf_counter()
+    for _ in range(repeat):
+        render()
+    seconds = (time.perf_counter() - started) / repeat
+    tracemalloc.start()
+    render()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def run_bench(args):
+    messages = synthetic_transcript(args.turns)
+    print(f"{args.turns}-turn transcript, {sum(len(m['content']) for m in messages) / 1024:.0f} KB of text")
+    with tempfile.TemporaryDirectory() as tmp:
+        def to_file(fmt):
+            path = os.path.join(tmp, f"transcript.{fmt}")
+            return lambda: WRITERS[fmt](messages, path), path
+
+        cases = [("pdf, legacy BytesIO", lambda: legacy_pdf(messages), None)]
+        cases += [(f"{fmt}, streamed to file", *to_file(fmt)) for fmt in ("pdf", "html", "md")]
+        print("export                     ms   peak MB   size KB")
+        for name, render, path in cases:
+            seconds, peak = _measure(render, args.repeat)
+            size = os.path.getsize(path) if path else len(legacy_pdf(messages).getvalue())
+            print(f"{name:<22}{seconds * 1000:>9.1f}{peak / 2**20:>10.1f}{size / 1024:>10.0f}")
+
+        transcripts = {
+            f"s{i}": {"app": "support", "started": time.time(), "messages": messages} for i in range(args.sessions)
+        }
+        print(f"\nbatch of {args.sessions} sessions, pdf, {os.cpu_count()} CPUs")
+        for workers in (1, args.workers):
+            started = time.perf_counter()
+            export_batch(transcripts, os.path.join(tmp, f"batch{workers}"), "pdf", workers)
+            seconds = time.perf_counter() - started
+            print(f"{workers} worker{'s' if workers > 1 else ''}: {seconds:.2f}s ({args.sessions / seconds:.1f} transcripts/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export chat transcripts")
+    sub = parser.add_subparsers(dest="command", required=True)
+    batch = sub.add_parser("batch", help="export every session in the request log")
+    batch.add_argument("--log", default=TRACE_LOG)
+    batch.add_argument("--date", type=date.fromisoformat, default=None, help="only sessions from this day (YYYY-MM-DD)")
+    batch.add_argument("--format", choices=sorted(FORMATS), default="pdf")
+    batch.add_argument("--out", default="exports")
+    batch.add_argument("--workers", type=int, default=os.cpu_count())
+    bench = sub.add_parser("bench", help="time and peak memory per export path")
+    bench.add_argument("--turns", type=int, default=500)
+    bench.add_argument("--repeat", type=int, default=3)
+    bench.add_argument("--sessions", type=int, default=16)
+    bench.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        run_bench(args)
+        return
+    transcripts = load_transcripts(args.log, args.date)
+    started = time.perf_counter()
+    paths = export_batch(transcripts, args.out, args.format, args.workers)
+    print(f"exported {len(paths)} transcripts to {args.out} in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
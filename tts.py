@@ -0,0 +1,455 @@
+"""Sentence-by-sentence text-to-speech for assistant answers, with a content-addressed audio cache.
+
+Answers are spoken while they stream: ``SentenceSplitter`` cuts the text
+the guardrail has released into sentences, ``Speaker`` synthesizes them on
+a small thread pool and plays each clip as soon as the previous one ends.
+Every clip is stored in ``AudioCache`` under the hash of the backend, voice,
+format and sentence, so sentences shared between answers are synthesized
+once and an answer served from the response cache replays without any
+synthesis.
+
+Backends are picked by name (config ``tts_backend``, constructor options in
+``tts_options``): ``pyttsx3`` (local, offline), ``openai`` (gpt-4o-mini-tts,
+as text-to-speech.py used) and ``stub`` (a tone per sentence, for tests).
+
+    python tts.py warm --limit 200          # pre-synthesize the answers in the response cache
+    python tts.py bench --latency 0.4       # time to first audio: whole answer vs per sentence vs cached
+    python tts.py prune --max-mb 200
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from tracing import METRICS
+
+DEFAULT_CACHE_DIR = "audio_cache"
+MIN_SENTENCE_CHARS = 24
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+URL = re.compile(r"https?://(?:www\.)?([^/\s]+)\S*")
+MARKDOWN = re.compile(r"^\s*(?:[-*•]|\d+[.)]|#+)\s+|[*_`#]+")
+MIMES = {"wav": "audio/wav", "mp3": "audio/mpeg"}
+
+
+def speakable(sentence):
+    """Sentence as it should be read: no markdown markers, links read as their site"""
+    sentence = URL.sub(lambda match: match.group(1), sentence)
+    return " ".join(MARKDOWN.sub("", sentence).split())
+
+
+class SentenceSplitter:
+    """Turns a growing text into complete sentences, each returned once.
+
+    A sentence is complete once the whitespace after its end has arrived.
+    Fragments shorter than ``min_chars`` (a bullet marker, "Sure!") are
+    joined to the next sentence so each clip is worth a round trip.
+    """
+
+    def __init__(self, min_chars=MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self.position = 0
+        self.pending = ""
+
+    def _take(self, text, final):
+        sentences = []
+        for part in SENTENCE_BREAK.split(text):
+            self.pending = f"{self.pending} {part}".strip()
+            if len(self.pending) >= self.min_chars:
+                sentences.append(self.pending)
+                self.pending = ""
+        if final and self.pending:
+            sentences.append(self.pending)
+            self.pending = ""
+        return sentences
+
+    def feed(self, text):
+        """New complete sentences in ``text``, which must extend what was fed before"""
+        breaks = [match.end() for match in SENTENCE_BREAK.finditer(text, self.position)]
+        if not breaks:
+            return []
+        chunk, self.position = text[self.position:breaks[-1]], breaks[-1]
+        return self._take(chunk, final=False)
+
+    def finish(self, text):
+        """Every sentence of ``text`` not returned yet"""
+        chunk, self.position = text[self.position:], len(text)
+        return self._take(chunk, final=True)
+
+
+def tone_wav(seconds, sample_rate=16000, frequency=440.0):
+    samples = np.sin(2 * np.pi * frequency * np.arange(int(seconds * sample_rate)) / sample_rate)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes((samples * 3000).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def clip_seconds(clip):
+    with wave.open(io.BytesIO(clip), 'rb') as audio:
+        return audio.getnframes() / audio.getframerate()
+
+
+def join_clips(clips, fmt="wav"):
+    """One clip from several of the same backend; MP3 frames simply concatenate"""
+    if fmt != "wav":
+        return b"".join(clips)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as out:
+        for index, clip in enumerate(clips):
+            with wave.open(io.BytesIO(clip), 'rb') as audio:
+                if index == 0:
+                    out.setparams(audio.getparams())
+                out.writeframes(audio.readframes(audio.getnframes()))
+    return buffer.getvalue()
+
+
+def clip_tail(clip, seconds):
+    """The last ``seconds`` of a WAV clip"""
+    buffer = io.BytesIO()
+    with wave.open(io.BytesIO(clip), 'rb') as audio, wave.open(buffer, 'wb') as out:
+        out.setparams(audio.getparams())
+        skip = max(audio.getnframes() - int(seconds * audio.getframerate()), 0)
+        audio.setpos(skip)
+        out.writeframes(audio.readframes(audio.getnframes() - skip))
+    return buffer.getvalue()
+
+
+def pad_silence(clip, frames):
+    """The same WAV clip with ``frames`` of silence appended"""
+    buffer = io.BytesIO()
+    with wave.open(io.BytesIO(clip), 'rb') as audio, wave.open(buffer, 'wb') as out:
+        out.setparams(audio.getparams())
+        out.writeframes(audio.readframes(audio.getnframes()))
+        out.writeframes(b"\0" * frames * audio.getnchannels() * audio.getsampwidth())
+    return buffer.getvalue()
+
+
+class StubBackend:
+    """Offline stand-in: a tone as long as the sentence would take to read, after a simulated synthesis delay"""
+
+    name = "stub"
+    format = "wav"
+
+    def __init__(self, voice="tone", words_per_second=2.5, latency=0.0, seconds_per_char=0.0):
+        self.voice = voice
+        self.words_per_second = words_per_second
+        self.latency = latency
+        self.seconds_per_char = seconds_per_char
+
+    def synthesize(self, text):
+        time.sleep(self.latency + self.seconds_per_char * len(text))
+        return tone_wav(max(len(text.split()), 1) / self.words_per_second)
+
+
+class Pyttsx3Backend:
+    """Local speech engine (SAPI5, NSSpeechSynthesizer or eSpeak); one synthesis at a time"""
+
+    name = "pyttsx3"
+    format = "wav"
+
+    def __init__(self, voice=None, rate=None):
+        import pyttsx3
+
+        self.voice = voice or "default"
+        self._engine = pyttsx3.init()
+        if voice:
+            self._engine.setProperty("voice", voice)
+        if rate:
+            self._engine.setProperty("rate", rate)
+        self._lock = threading.Lock()
+
+    def synthesize(self, text):
+        with self._lock, tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "clip.wav")
+            self._engine.save_to_file(text, path)
+            self._engine.runAndWait()
+            with open(path, 'rb') as f:
+                return f.read()
+
+
+class OpenAIBackend:
+    """OpenAI speech API; WAV by default so clips can be timed and joined"""
+
+    name = "openai"
+
+    def __init__(self, model="gpt-4o-mini-tts", voice="alloy", format="wav"):
+        from openai import OpenAI
+
+        self.model = model
+        self.voice = f"{model}:{voice}"
+        self._voice = voice
+        self.format = format
+        self._client = OpenAI()
+
+    def synthesize(self, text):
+        response = self._client.audio.speech.create(
+            model=self.model, voice=self._voice, input=text, response_format=self.format
+        )
+        return response.content
+
+
+BACKENDS = {"pyttsx3": Pyttsx3Backend, "openai": OpenAIBackend, "stub": StubBackend}
+
+
+def make_backend(name="pyttsx3", **options):
+    return BACKENDS[name](**options)
+
+
+class AudioCache:
+    """Clips on disk under the SHA-256 of (backend, voice, format, sentence); writes are atomic"""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+
+    def path(self, backend, text):
+        digest = hashlib.sha256(f"{backend.name}\0{backend.voice}\0{backend.format}\0{text}".encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.{backend.format}")
+
+    def get(self, backend, text):
+        path = self.path(backend, text)
+        try:
+            with open(path, 'rb') as f:
+                clip = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # recency for prune
+        return clip
+
+    def put(self, backend, text, clip):
+        path = self.path(backend, text)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(clip)
+        os.replace(tmp_path, path)
+
+    def prune(self, max_bytes):
+        """Delete least recently used clips until the cache fits ``max_bytes``; returns how many"""
+        clips = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                stat = os.stat(os.path.join(root, name))
+                clips.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        total = sum(size for _, size, _ in clips)
+        removed = 0
+        for _, size, path in sorted(clips):
+            if total <= max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+
+class Voice:
+    """A backend, its audio cache and the synthesis pool shared by every answer"""
+
+    def __init__(self, backend, cache, workers=2):
+        self.backend = backend
+        self.cache = cache
+        self.mime = MIMES[backend.format]
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+
+    @classmethod
+    def from_config(cls, config):
+        backend = make_backend(config.get("tts_backend", "pyttsx3"), **config.get("tts_options", {}))
+        return cls(backend, AudioCache(config.get("tts_cache_dir", DEFAULT_CACHE_DIR)), config.get("tts_workers", 2))
+
+    def clip(self, sentence):
+        """Audio for one sentence, from the cache or synthesized and stored"""
+        text = speakable(sentence)
+        clip = self.cache.get(self.backend, text)
+        METRICS.inc("chatbot_tts_clips_total", help="Sentence clips by audio cache result",
+                    result="miss" if clip is None else "hit")
+        if clip is None:
+            started = time.perf_counter()
+            clip = self.backend.synthesize(text)
+            METRICS.observe("chatbot_tts_synthesis_seconds", time.perf_counter() - started,
+                            help="Time to synthesize one sentence", backend=self.backend.name)
+            self.cache.put(self.backend, text, clip)
+        return clip
+
+    def submit(self, sentence):
+        return self._pool.submit(self.clip, sentence)
+
+    def answer_audio(self, text):
+        """The whole answer as one clip, e.g. to replay it from the chat history"""
+        futures = [self.submit(sentence) for sentence in SentenceSplitter().finish(text)]
+        return join_clips([future.result() for future in futures], self.backend.format)
+
+    def speaker(self, container):
+        return Speaker(self, container)
+
+
+class Speaker:
+    """Speaks one answer into a Streamlit container while it streams.
+
+    ``update`` takes the text released so far, queues its new sentences for
+    synthesis and starts any clip that is ready once the previous one has
+    finished playing; it never waits. ``finish`` takes the final answer and
+    returns everything not yet started, from the remaining part of the clip
+    playing now to the last sentence, as one clip (None if nothing is left);
+    it waits only for synthesis, not playback. The caller mounts that clip
+    where it survives the rerun, so the answer plays out. If the final answer
+    is not a continuation of what was spoken (the guardrail replaced it), it
+    is spoken instead.
+
+    Each clip gets its own slot in ``container`` and the finished one is
+    cleared. Streamlit identifies media by content, so a sentence repeated
+    within the answer gets a few silent frames to make its clip distinct
+    (formats other than WAV skip the repeat).
+    """
+
+    def __init__(self, voice, container):
+        self.voice = voice
+        self.container = container
+        self.slot = None
+        self.playing = None
+        self.seen = set()
+        self.splitter = SentenceSplitter()
+        self.spoken = ""
+        self.clips = []
+        self.played = 0
+        self.busy_until = 0.0
+        self.started = time.perf_counter()
+
+    def _queue(self, sentences):
+        self.clips += [self.voice.submit(sentence) for sentence in sentences]
+
+    def _observe_first_audio(self):
+        METRICS.observe("chatbot_tts_first_audio_seconds", time.perf_counter() - self.started,
+                        help="From the first released text to the first audio", backend=self.voice.backend.name)
+
+    def _play_next(self):
+        future = self.clips[self.played]
+        if not future.done() or time.monotonic() < self.busy_until:
+            return False
+        clip = future.result()
+        while clip in self.seen and self.voice.backend.format == "wav":
+            clip = pad_silence(clip, 1)
+        if self.played == 0:
+            self._observe_first_audio()
+        self.played += 1
+        if clip in self.seen:
+            return True
+        self.seen.add(clip)
+        if self.slot is not None:
+            self.slot.empty()
+        self.slot = self.container.empty()
+        self.slot.audio(clip, format=self.voice.mime, autoplay=True)
+        self.playing = clip
+        self.busy_until = time.monotonic() + (clip_seconds(clip) if self.voice.backend.format == "wav" else 0)
+        return True
+
+    def update(self, text):
+        if not self.spoken:
+            self.started = time.perf_counter()
+        self.spoken = text
+        self._queue(self.splitter.feed(text))
+        while self.played < len(self.clips) and self._play_next():
+            pass
+
+    def finish(self, text):
+        if text.startswith(self.spoken):
+            self._queue(self.splitter.finish(text))
+        else:
+            self._queue(SentenceSplitter().finish(text))
+        rest = [future.result() for future in self.clips[self.played:]]
+        remaining = self.busy_until - time.monotonic()
+        if self.playing is not None and remaining > 0:
+            rest.insert(0, clip_tail(self.playing, remaining))
+        self.playing = None
+        if not rest:
+            return None
+        if self.played == 0:
+            self._observe_first_audio()
+        self.played = len(self.clips)
+        return join_clips(rest, self.voice.backend.format)
+
+
+def load_answers(db_path, limit=None):
+    from cache_store import ResponseCache
+
+    cache = ResponseCache(db_path)
+    try:
+        return [answer for answer in map(cache.get, cache.popular_keys()[:limit]) if answer]
+    finally:
+        cache.close()
+
+
+def warm(voice, answers):
+    """Synthesize every sentence of ``answers`` not in the audio cache yet; returns (sentences, synthesized)"""
+    sentences = list(dict.fromkeys(s for answer in answers for s in SentenceSplitter().finish(answer)))
+    missing = [s for s in sentences if voice.cache.get(voice.backend, speakable(s)) is None]
+    for future in [voice.submit(sentence) for sentence in missing]:
+        future.result()
+    return len(sentences), len(missing)
+
+
+def run_bench(args):
+    with open(args.answers, 'r') as f:
+        answers = [answer for answer in json.load(f).values() if answer.strip()][:args.limit]
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = StubBackend(latency=args.latency, seconds_per_char=args.seconds_per_char)
+        voice = Voice(backend, AudioCache(tmp), workers=args.workers)
+
+        def first_audio(speak):
+            started = time.perf_counter()
+            speak()
+            return time.perf_counter() - started
+
+        whole = [first_audio(lambda: backend.synthesize(speakable(answer))) for answer in answers]
+        streamed = [first_audio(lambda: voice.submit(SentenceSplitter().finish(answer)[0]).result()) for answer in answers]
+        warm(voice, answers)
+        cached = [first_audio(lambda: voice.submit(SentenceSplitter().finish(answer)[0]).result()) for answer in answers]
+
+    print(f"{len(answers)} cached answers, stub synthesis {args.latency * 1000:.0f} ms + "
+          f"{args.seconds_per_char * 1000:.1f} ms/char\ntime to first audio      mean ms    p95 ms")
+    for name, times in (("whole answer", whole), ("first sentence", streamed), ("audio cache", cached)):
+        print(f"{name:<22}{np.mean(times) * 1000:>10.1f}{np.percentile(times, 95) * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the answer audio cache")
+    sub = parser.add_subparsers(dest="command", required=True)
+    warm_parser = sub.add_parser("warm", help="synthesize the answers in the response cache")
+    warm_parser.add_argument("--config", default="config.json")
+    warm_parser.add_argument("--db", default="response_cache.db")
+    warm_parser.add_argument("--limit", type=int, default=None)
+    bench = sub.add_parser("bench", help="time to first audio with the stub backend")
+    bench.add_argument("--answers", default="response_cache.json")
+    bench.add_argument("--limit", type=int, default=50)
+    bench.add_argument("--latency", type=float, default=0.4, help="fixed seconds per synthesis call")
+    bench.add_argument("--seconds-per-char", type=float, default=0.004)
+    bench.add_argument("--workers", type=int, default=2)
+    prune = sub.add_parser("prune", help="drop least recently played clips")
+    prune.add_argument("--dir", default=DEFAULT_CACHE_DIR)
+    prune.add_argument("--max-mb", type=float, required=True)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        run_bench(args)
+    elif args.command == "prune":
+        print(f"Removed {AudioCache(args.dir).prune(args.max_mb * 1024 * 1024)} clips from {args.dir}")
+    else:
+        with open(args.config, 'r') as f:
+            voice = Voice.from_config(json.load(f))
+        started = time.perf_counter()
+        sentences, synthesized = warm(voice, load_answers(args.db, args.limit))
+        print(f"{sentences} distinct sentences, {synthesized} synthesized, {sentences - synthesized} already cached "
+              f"({time.perf_counter() - started:.1f}s) in {voice.cache.directory}")
+
+if __name__ == "__main__":
+    main()
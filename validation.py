@@ -0,0 +1,261 @@
+"""Response guardrails shared by both apps and the chat engine.
+
+Each profile's banned characters, speculative phrases and phone numbers are
+compiled into one regular expression, so a response is checked in a single
+pass. ``Guardrail.stream()`` runs the same matcher incrementally over
+streamed tokens.
+
+    python validation.py bench     # compare with the previous per-pattern checks
+"""
+import argparse
+import json
+import re
+import time
+
+NON_ENGLISH_PATTERNS = ['¿', '¡', 'ñ', 'ç', 'ü', 'ß', 'à', 'é', 'è', 'ê', 'ë', 'î', 'ï', 'ô', 'ù', 'û', 'ÿ', 'ą', 'ć', 'ę', 'ł', 'ń', 'ó', 'ś', 'ź', 'ż']
+QUALITY_NON_ENGLISH_PATTERNS = ['¿', '¡', 'ñ', 'ç', 'ü', 'ß', 'à', 'é', 'è', 'ê', 'ë', 'î', 'ï', 'ô', 'ù', 'û', 'ÿ']
+SPECULATIVE_WORDS = ['maybe', 'possibly', 'might be', 'could be', 'perhaps', 'I think', 'probably']
+
+SUPPORT_PHONE = '(833) 224-6603'
+ALLOWED_PHONES = ('833-224-6603', '(833) 224-6603')
+PHONE_PATTERN = r'\(?\d{3}\)?[-\s]?\d{3}[-\s]?\d{4}'
+PHONE_MAX_LENGTH = len('(123) 456-7890')
+
+ENGLISH_ONLY_MESSAGE = "I apologize, but I can only respond in English. Please contact (833) 224-6603 for assistance in other languages."
+QUALITY_ENGLISH_ONLY_MESSAGE = "I can only respond in English. Please contact (833) 224-6603 for assistance."
+SPECULATIVE_MESSAGE = "I don't have that information. Please contact (833) 224-6603 for further assistance."
+
+
+def _phrase_alternatives(phrase):
+    # Case-insensitive, but starting with a literal so the regex engine can skip ahead to candidates
+    rest = f"(?i:{re.escape(phrase[1:])})" if len(phrase) > 1 else ""
+    return [re.escape(first) + rest for first in dict.fromkeys((phrase[0].lower(), phrase[0].upper()))]
+
+
+def _phone_alternatives():
+    # PHONE_PATTERN unrolled by its first character, for the same reason
+    rest = PHONE_PATTERN[len(r"\(?\d{3}"):]
+    return [r"\(\d{3}" + rest] + [f"{digit}\\d{{2}}" + rest for digit in range(10)]
+
+
+class Guardrail:
+    """Single-pass check for banned characters, speculative phrases and off-brand phone numbers.
+
+    A banned character replaces the whole response with ``banned_message``
+    and takes precedence over a speculative phrase (``phrase_message``).
+    Otherwise, with ``replace_phones``, every phone number other than the
+    support line is rewritten to it.
+
+    All alternatives are compiled into one pattern whose branches each
+    start with a literal character, which lets CPython's regex engine jump
+    between candidate positions instead of trying every branch at every
+    character. The banned characters are all non-ASCII, so ASCII-only
+    responses (most of them) are scanned without that part.
+    """
+
+    def __init__(self, banned_chars, banned_message, phrases=(), phrase_message=None, replace_phones=False):
+        self.banned_chars = frozenset(banned_chars)
+        self.banned_message = banned_message
+        self.phrase_message = phrase_message
+        alternatives = [alternative for phrase in phrases for alternative in _phrase_alternatives(phrase)]
+        if replace_phones:
+            alternatives += _phone_alternatives()
+        banned = [re.escape(char) for char in banned_chars]
+        self.pattern = re.compile("|".join(banned + alternatives))
+        if all(not char.isascii() for char in banned_chars):
+            self.ascii_pattern = re.compile("|".join(alternatives)) if alternatives else None
+        else:
+            self.ascii_pattern = self.pattern
+        # Longest text one match can span; the stream holds this much back
+        self.max_match = max([1] + [len(phrase) for phrase in phrases] + [PHONE_MAX_LENGTH] * replace_phones)
+
+    def kind(self, match):
+        text = match.group()
+        if text in self.banned_chars:
+            return "banned"
+        return "phrase" if text[0].isalpha() else "phone"
+
+    def validate(self, text):
+        if text.isascii():
+            if self.ascii_pattern is None:
+                return text
+            scan = GuardedStream(self, self.ascii_pattern)
+        else:
+            scan = GuardedStream(self)
+        scan.feed(text)
+        return scan.finish()
+
+    def stream(self):
+        return GuardedStream(self)
+
+
+class GuardedStream:
+    """Incremental ``Guardrail`` over a token stream.
+
+    ``feed`` scans only new text, holding back the last few characters in
+    case a phrase or phone number continues in the next token. ``released``
+    is the text that is safe to show so far (phone numbers already
+    rewritten) and ``blocked`` turns on at the first banned character or
+    speculative phrase. ``finish`` returns exactly what ``validate`` would
+    for the full text.
+    """
+
+    def __init__(self, guardrail, pattern=None):
+        self.guardrail = guardrail
+        self.pattern = pattern or guardrail.pattern
+        self.text = ""
+        self.released = ""
+        self.position = 0
+        self.banned = False
+        self.speculative = False
+
+    @property
+    def blocked(self):
+        return self.banned or self.speculative
+
+    def feed(self, token):
+        self.text += token
+        if not self.banned:
+            self._scan(len(self.text) - self.guardrail.max_match + 1)
+        return self
+
+    def finish(self):
+        if not self.banned:
+            self._scan(len(self.text))
+        if self.banned:
+            return self.guardrail.banned_message
+        if self.speculative:
+            return self.guardrail.phrase_message
+        return self.released
+
+    def _scan(self, limit):
+        # Matches starting before ``limit`` are complete: every character they could use has arrived
+        if limit <= self.position:
+            return
+        parts = [self.released]
+        start = self.position
+        for match in self.pattern.finditer(self.text, self.position):
+            if match.start() >= limit:
+                break
+            kind = self.guardrail.kind(match)
+            if kind == "banned":
+                self.banned = True
+                return
+            if kind == "phrase":
+                self.speculative = True
+            elif kind == "phone" and not any(phone in match.group() for phone in ALLOWED_PHONES):
+                parts.append(self.text[start:match.start()])
+                parts.append(SUPPORT_PHONE)
+                start = match.end()
+            self.position = match.end()
+        self.position = max(self.position, limit)
+        parts.append(self.text[start:self.position])
+        self.released = "".join(parts)
+
+
+SUPPORT_GUARDRAIL = Guardrail(NON_ENGLISH_PATTERNS, ENGLISH_ONLY_MESSAGE)
+POPUP_GUARDRAIL = Guardrail(
+    QUALITY_NON_ENGLISH_PATTERNS,
+    QUALITY_ENGLISH_ONLY_MESSAGE,
+    phrases=SPECULATIVE_WORDS,
+    phrase_message=SPECULATIVE_MESSAGE,
+    replace_phones=True,
+)
+
+
+def validate_english_response(response_text):
+    """Ensure response is in English only"""
+    return SUPPORT_GUARDRAIL.validate(response_text)
+
+
+def validate_response_quality(response_text, question):
+    """Validate response meets quality standards"""
+    return POPUP_GUARDRAIL.validate(response_text)
+
+
+def _legacy_english(response_text):
+    if any(pattern in response_text for pattern in NON_ENGLISH_PATTERNS):
+        return ENGLISH_ONLY_MESSAGE
+    return response_text
+
+
+def _legacy_quality(response_text, question):
+    # The per-pattern implementation this module replaced, kept as the benchmark baseline
+    if any(pattern in response_text for pattern in QUALITY_NON_ENGLISH_PATTERNS):
+        return QUALITY_ENGLISH_ONLY_MESSAGE
+    phones = re.findall(PHONE_PATTERN, response_text)
+    for phone in phones:
+        if '833-224-6603' not in phone and '(833) 224-6603' not in phone:
+            response_text = response_text.replace(phone, SUPPORT_PHONE)
+    for word in SPECULATIVE_WORDS:
+        if word.lower() in response_text.lower():
+            return SPECULATIVE_MESSAGE
+    return response_text
+
+
+def _timed(function, texts, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            function(text)
+    return (time.perf_counter() - started) / (repeat * len(texts))
+
+
+def _stream_tokens(text):
+    return re.findall(r"\S+\s*", text)
+
+
+def run_bench(args):
+    with open(args.responses, 'r') as f:
+        texts = [text for text in json.load(f).values() if text]
+    # Exercise every branch: foreign characters, speculative wording and stray phone numbers
+    texts += [text + " Llame al 212-555-0100, señor." for text in texts[:10]]
+    texts += [text.replace("you can", "you might be able to") + " Call 212 555 0100." for text in texts[:10]]
+
+    mismatches = sum(
+        _legacy_quality(text, "") != validate_response_quality(text, "")
+        or _legacy_english(text) != validate_english_response(text)
+        for text in texts
+    )
+    print(f"{len(texts)} responses, {mismatches} differ from the previous implementation")
+
+    print("check                    previous us   compiled us   speedup")
+    rows = [
+        ("english (support)", _legacy_english, validate_english_response),
+        ("quality (popup)", lambda text: _legacy_quality(text, ""), lambda text: validate_response_quality(text, "")),
+    ]
+    for name, legacy, compiled in rows:
+        before = _timed(legacy, texts, args.repeat)
+        after = _timed(compiled, texts, args.repeat)
+        print(f"{name:<22}{before * 1e6:>13.1f}{after * 1e6:>14.1f}{before / after:>9.1f}x")
+
+    # Streaming: re-validating the whole text on every token versus one incremental pass
+    token_lists = [_stream_tokens(text) for text in texts]
+
+    def revalidate(tokens):
+        text = ""
+        for token in tokens:
+            text += token
+            _legacy_quality(text, "")
+
+    def incremental(tokens):
+        stream = POPUP_GUARDRAIL.stream()
+        for token in tokens:
+            stream.feed(token)
+        stream.finish()
+
+    before = _timed(revalidate, token_lists, max(1, args.repeat // 10))
+    after = _timed(incremental, token_lists, max(1, args.repeat // 10))
+    print(f"{'stream (per response)':<22}{before * 1e6:>13.1f}{after * 1e6:>14.1f}{before / after:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response guardrails")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="micro-benchmark against the cached responses")
+    bench.add_argument("--responses", default="response_cache.json")
+    bench.add_argument("--repeat", type=int, default=200)
+    run_bench(parser.parse_args())
+
+if __name__ == "__main__":
+    main()